@@ -0,0 +1,92 @@
+"""
+Admission control for the API.
+
+Routes are split into pools. "heavy" covers full-disk uploads and batch
+scoring, and "light" covers interactive calls. Each pool has its own
+concurrency limit and wait queue, so a long /process-h5 can occupy at most the
+heavy slots while /predict and /health keep their own. A request that finds
+its pool's queue full, or that waits longer than `wait_timeout`, is rejected
+immediately so the caller can send 429 with a Retry-After estimate. The
+estimate comes from the pool's recent service times.
+
+Limits are per process. Run gunicorn with threaded workers (gthread) so a
+process can serve light requests while a heavy one is running.
+"""
+import math
+import time
+import threading
+
+
+class AdmissionPool:
+    """Concurrency limit + bounded wait queue for one class of routes."""
+
+    def __init__(self, name, max_concurrent, max_queue, wait_timeout):
+        self.name = name
+        self.max_concurrent = max(1, int(max_concurrent))
+        self.max_queue = max(0, int(max_queue))
+        self.wait_timeout = float(wait_timeout)
+        self._cond = threading.Condition()
+        self._active = 0
+        self._waiting = 0
+        self._avg_seconds = None      # EWMA of service time
+        self.rejected = 0
+
+    def acquire(self):
+        """Take a slot, waiting in the queue if there is room. Returns False when rejected."""
+        with self._cond:
+            if self._active < self.max_concurrent and self._waiting == 0:
+                self._active += 1
+                return True
+            if self._waiting >= self.max_queue:
+                self.rejected += 1
+                return False
+            self._waiting += 1
+            deadline = time.monotonic() + self.wait_timeout
+            try:
+                while self._active >= self.max_concurrent:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.rejected += 1
+                        return False
+                    self._cond.wait(remaining)
+                self._active += 1
+                return True
+            finally:
+                self._waiting -= 1
+
+    def release(self, seconds=None):
+        with self._cond:
+            self._active -= 1
+            if seconds is not None:
+                self._avg_seconds = seconds if self._avg_seconds is None else 0.8 * self._avg_seconds + 0.2 * seconds
+            self._cond.notify()
+
+    def retry_after(self):
+        """Seconds until a slot is likely free (at least 1)."""
+        with self._cond:
+            avg = self._avg_seconds or 1.0
+            backlog = self._waiting + 1
+            return max(1, math.ceil(avg * backlog / self.max_concurrent))
+
+    def stats(self):
+        with self._cond:
+            return {"active": self._active, "waiting": self._waiting, "max_concurrent": self.max_concurrent,
+                    "max_queue": self.max_queue, "rejected": self.rejected,
+                    "avg_seconds": round(self._avg_seconds, 3) if self._avg_seconds is not None else None}
+
+
+class AdmissionController:
+    """Maps endpoints to pools; endpoints in `exempt` bypass admission."""
+
+    def __init__(self, pools, heavy_endpoints, exempt=()):
+        self.pools = pools
+        self.heavy_endpoints = set(heavy_endpoints)
+        self.exempt = set(exempt)
+
+    def pool_for(self, endpoint):
+        if endpoint is None or endpoint in self.exempt:
+            return None
+        return self.pools["heavy" if endpoint in self.heavy_endpoints else "light"]
+
+    def stats(self):
+        return {name: pool.stats() for name, pool in self.pools.items()}
@@ -1,9 +1,19 @@
 # app.py
 import os
 import io
+import math
+import time
+import shutil
+import hashlib
+import contextlib
+import functools
+import queue
 import logging
-from typing import List, Dict
-from flask import Flask, request, jsonify
+import threading
+from typing import Dict
+import numpy as np
+from flask import Flask, Response, request, jsonify
+from werkzeug.datastructures import MultiDict
 from werkzeug.utils import secure_filename
 
 # --- Py3.14 Compatibility Patch ---
@@ -21,28 +31,123 @@ if not hasattr(pkgutil, 'get_loader'):
     pkgutil.get_loader = get_loader
 # ----------------------------------
 
-from flask import render_template
+from flask import render_template, g, send_from_directory, has_request_context, copy_current_request_context
 
 import joblib
 import pandas as pd
-import numpy as np
 import h5py
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
 try:
     from api.mosdac_client import MosdacClient
+    from api.profiling import RequestProfile, profile_request_options, token_matches
+    from api.sharding import ShardedPredictor, score_block
+    from api.encoding import encode_predictions, requested_layout, json_response
+    from api.geocache import GeoCache, product_type, parse_product_name
+    from api.temporal import TemporalFeatureEngine
+    from api.risk_cache import RiskCache
+    from api.stream import Broadcaster, parse_region, sse
+    from api.route import GridIndex, parse_waypoints, sample_count, sample_polyline, interpolate
+    from api.history import PredictionHistory
+    from api.admission import AdmissionPool, AdmissionController
+    from api.jobs import JobStore
+    from api.features import FEATURE_DTYPE, FEATURES, feature_matrix
+    from api.cascade import MODES as CASCADE_MODES, cascade_predict, agreement
+    from api.histogram import CELL_SIZES, risk_histogram, merge_histograms, encode_histogram
+    from api.uploads import UploadError, is_archive, staged_uploads
 except ImportError:
     from mosdac_client import MosdacClient
+    from profiling import RequestProfile, profile_request_options, token_matches
+    from sharding import ShardedPredictor, score_block
+    from encoding import encode_predictions, requested_layout, json_response
+    from geocache import GeoCache, product_type, parse_product_name
+    from temporal import TemporalFeatureEngine
+    from risk_cache import RiskCache
+    from stream import Broadcaster, parse_region, sse
+    from route import GridIndex, parse_waypoints, sample_count, sample_polyline, interpolate
+    from history import PredictionHistory
+    from admission import AdmissionPool, AdmissionController
+    from jobs import JobStore
+    from features import FEATURE_DTYPE, FEATURES, feature_matrix
+    from cascade import MODES as CASCADE_MODES, cascade_predict, agreement
+    from histogram import CELL_SIZES, risk_histogram, merge_histograms, encode_histogram
+    from uploads import UploadError, is_archive, staged_uploads
 
 # --- config (update if you prefer S3) ---
 MODEL_PATH = os.getenv("MODEL_PATH", "model_artifacts/rf_model.joblib")
 SCALER_PATH = os.getenv("SCALER_PATH", "model_artifacts/scaler.joblib")
 PORT = int(os.getenv("PORT", 8080))
+# Sharded inference: inputs with at least SHARD_MIN_ROWS rows are split into blocks and scored on a pool
+SHARD_MIN_ROWS = int(os.getenv("SHARD_MIN_ROWS", 200000))
+SHARD_BLOCK_ROWS = int(os.getenv("SHARD_BLOCK_ROWS", 100000))
+# Shard pool size per process: the cores are split between the WEB_CONCURRENCY gunicorn workers
+# (gunicorn.conf.py exports the worker count; 1 when the app runs on its own)
+WEB_CONCURRENCY = max(1, int(os.getenv("WEB_CONCURRENCY", 1)))
+SHARD_WORKERS = int(os.getenv("SHARD_WORKERS", max(1, (os.cpu_count() or 1) // WEB_CONCURRENCY)))
+SHARD_EXECUTOR = os.getenv("SHARD_EXECUTOR", "thread")  # "thread" or "process"
+# Rolling CTP/CTT features: number of timesteps kept per 0.25 deg cell
+TEMPORAL_WINDOW = int(os.getenv("TEMPORAL_WINDOW", 8))
+# /stream: seconds between heartbeats and between risk-cache checks
+STREAM_HEARTBEAT = float(os.getenv("STREAM_HEARTBEAT", 15))
+STREAM_POLL = float(os.getenv("STREAM_POLL", 1))
+# Open /stream clients per process; each holds a request thread, so the default leaves half of
+# GUNICORN_THREADS for other requests (more clients get 503 + Retry-After)
+MAX_STREAMS = int(os.getenv("MAX_STREAMS", max(1, int(os.getenv("GUNICORN_THREADS", 8)) // 2)))
+# /route-risk: default sample spacing, max distance to a grid pixel, and max samples per request
+ROUTE_SPACING_KM = float(os.getenv("ROUTE_SPACING_KM", 10))
+ROUTE_MAX_MATCH_KM = float(os.getenv("ROUTE_MAX_MATCH_KM", 50))
+ROUTE_MAX_SAMPLES = int(os.getenv("ROUTE_MAX_SAMPLES", 500000))
+# Distilled fast model (train_model.py), opt-in. MODEL_ROUTING: "full" (default) always uses the forest,
+# "auto" sends requests of at most FAST_MODEL_MAX_ROWS rows to the fast model, "fast" always uses it;
+# ?model=full|fast overrides per request
+FAST_MODEL_PATH = os.getenv("FAST_MODEL_PATH", "model_artifacts/fast_model.joblib")
+FAST_MODEL_MAX_ROWS = int(os.getenv("FAST_MODEL_MAX_ROWS", 32))
+MODEL_ROUTING = os.getenv("MODEL_ROUTING", "full")
+# Cascaded scoring of /process-h5 grids (api/cascade.py): "exact" scores identical clear-sky pixels once
+# (same results as "off"), "fast" also lets the fast model label Low pixels it is at least
+# CASCADE_CONFIDENCE sure of; ?cascade=off|exact|fast overrides per request, ?verify=1 reports agreement
+CASCADE_MODE = os.getenv("CASCADE_MODE", "exact")
+CASCADE_CONFIDENCE = float(os.getenv("CASCADE_CONFIDENCE", 0.9))
+# Binned lat/lon risk histogram in /process-h5 responses (api/histogram.py): cell size in degrees,
+# one of 0.25/0.5/1 or "off"; ?histogram= overrides per request
+HISTOGRAM_CELL_DEG = os.getenv("HISTOGRAM_CELL_DEG", "1")
+# /process-h5 uploads are staged in unique scratch files under H5_SCRATCH_DIR (default: the system temp
+# dir); multi-file and tar/zip uploads (up to H5_MAX_FILES products, H5_MAX_STAGED_MB unpacked) are
+# analysed on H5_WORKERS threads
+H5_SCRATCH_DIR = os.getenv("H5_SCRATCH_DIR") or None
+H5_WORKERS = int(os.getenv("H5_WORKERS", min(4, os.cpu_count() or 1)))
+H5_MAX_FILES = int(os.getenv("H5_MAX_FILES", 96))
+H5_MAX_STAGED_MB = int(os.getenv("H5_MAX_STAGED_MB", 8192))
+# Warm start: score a dummy batch with each loaded model at import, i.e. in the gunicorn master
+# (--preload) before workers fork and start accepting traffic; WARM_START=0 turns it off
+WARM_START = os.getenv("WARM_START", "1") == "1"
+WARM_START_ROWS = int(os.getenv("WARM_START_ROWS", 256))
+# Prediction history log (set HISTORY_ENABLED=0 to turn off)
+HISTORY_ENABLED = os.getenv("HISTORY_ENABLED", "1") == "1"
+# Admission control (per process): concurrency and wait-queue limits for light and heavy routes,
+# seconds a request may wait for a slot, and request body limits
+LIGHT_CONCURRENCY = int(os.getenv("LIGHT_CONCURRENCY", 8))
+LIGHT_QUEUE = int(os.getenv("LIGHT_QUEUE", 16))
+HEAVY_CONCURRENCY = int(os.getenv("HEAVY_CONCURRENCY", 1))
+HEAVY_QUEUE = int(os.getenv("HEAVY_QUEUE", 2))
+ADMISSION_WAIT_S = float(os.getenv("ADMISSION_WAIT_S", 10))
+MAX_UPLOAD_MB = int(os.getenv("MAX_UPLOAD_MB", 512))
+LIGHT_MAX_BODY_KB = int(os.getenv("LIGHT_MAX_BODY_KB", 1024))
+# Heavy requests sent with ?async=1 run as background jobs, polled at /jobs/<id>; results of
+# /process-h5 and /predict-batch are cached by upload content (?refresh=1 recomputes)
+MAX_PENDING_JOBS = int(os.getenv("MAX_PENDING_JOBS", 8))
+# On-demand request profiling (disabled unless PROFILE_TOKEN is set)
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN")
+PROFILE_DIR = os.getenv("PROFILE_DIR", "/tmp/turbulence-profiles")
+# Thread-name prefixes of the worker pools (sharded inference, multi-file /process-h5) sampled with a profiled request
+PROFILE_POOL_THREADS = ("shard", "h5")
 
 # Logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("turbulence-api")
 
 app = Flask(__name__)
+app.config["MAX_CONTENT_LENGTH"] = MAX_UPLOAD_MB * 1024 * 1024
 
 # Load model (joblib pipeline expected)
 def load_model(path: str):
@@ -66,11 +171,72 @@ except Exception as e:
     MODEL = None
     SCALER = None
 
-# Features exptected by the model
-EXPECTED_FEATURES = ["wind_speed_10m", "wind_speed_100m", "wind_shear", "relative_humidity_2m", "cloud_cover", "surface_pressure", "dewpt_dep"]
+FAST_MODEL = None
+if MODEL is not None and os.path.exists(FAST_MODEL_PATH):  # loaded for ?model=fast even when routing is "full"
+    try:
+        FAST_MODEL = load_model(FAST_MODEL_PATH)
+        if not np.array_equal(getattr(FAST_MODEL, "classes_", []), getattr(MODEL, "classes_", [])):
+            logger.warning("Fast model classes differ from the full model; not using it")
+            FAST_MODEL = None
+    except Exception:
+        logger.exception("Failed to load fast model")
+        FAST_MODEL = None
+
+# Lat/lon, valid-pixel index and bins per product grid, shared across uploads
+GEO_CACHE = GeoCache()
+# Per-cell ring buffers of recent CTP/CTT, fed by /process-h5 and /mosdac-ingest
+TEMPORAL = TemporalFeatureEngine(window=TEMPORAL_WINDOW)
+# Latest grid published by ingest_daemon.py (reloaded when the files change)
+RISK_CACHE = RiskCache()
+# Fans each new cached product out to /stream subscribers (computed once per product)
+BROADCASTER = Broadcaster(RISK_CACHE, label_fn=lambda cls: stored_class_text(cls), poll=STREAM_POLL)
+
+def model_version(path: str) -> str:
+    """Model file name plus a short content hash."""
+    try:
+        with open(path, "rb") as fh:
+            digest = hashlib.sha1(fh.read()).hexdigest()[:8]
+    except OSError:
+        return "unknown"
+    return f"{os.path.basename(path)}@{digest}"
+
+MODEL_VERSION = os.getenv("MODEL_VERSION") or model_version(MODEL_PATH)
+FAST_MODEL_VERSION = model_version(FAST_MODEL_PATH) if FAST_MODEL is not None else None
+# Append-only log of served predictions with hourly rollups
+HISTORY = PredictionHistory() if HISTORY_ENABLED else None
+
+# Separate slots for heavy uploads/batches and interactive calls; SSE (own slots), health and job polls are exempt
+HEAVY_ENDPOINTS = ("process_h5", "predict_batch", "route_risk")
+ADMISSION = AdmissionController(
+    {"light": AdmissionPool("light", LIGHT_CONCURRENCY, LIGHT_QUEUE, ADMISSION_WAIT_S),
+     "heavy": AdmissionPool("heavy", HEAVY_CONCURRENCY, HEAVY_QUEUE, ADMISSION_WAIT_S)},
+    heavy_endpoints=HEAVY_ENDPOINTS,
+    exempt=("health", "stream", "job_status", "job_file", "get_profile", "index", "static"))
+# /stream has its own slots: streams last indefinitely, so they never wait for one
+STREAM_SLOTS = AdmissionPool("stream", MAX_STREAMS, 0, 0)
+JOBS = JobStore(workers=HEAVY_CONCURRENCY, max_pending=MAX_PENDING_JOBS)
+# set in the WSGI environ of replayed async jobs (clients cannot set environ keys)
+JOB_ENVIRON_KEY = "turbulence.job_id"
+# Endpoints whose result depends only on the request content and the model
+CACHEABLE_ENDPOINTS = ("process_h5", "predict_batch")
+# Query parameters that control the job system and are not part of the job spec
+JOB_CONTROL_ARGS = ("async", "refresh")
+# Credentials and per-request diagnostics: never stored in the job table or mixed into cache keys
+JOB_PRIVATE_ARGS = ("profile_token", "profile_mode", "token", "access_token", "api_key")
+
+# KD-tree over the latest cached grid for /route-risk, rebuilt when a new grid is published
+ROUTE_INDEX = None
+ROUTE_INDEX_LOCK = threading.Lock()
+
+PREDICTOR = ShardedPredictor(MODEL, n_workers=SHARD_WORKERS, block_rows=SHARD_BLOCK_ROWS,
+                             executor=SHARD_EXECUTOR) if MODEL is not None else None
+
+# Features exptected by the model (shared with training, see api/features.py)
+EXPECTED_FEATURES = FEATURES
 
 # Helpful label map - change if your labels differ
 LABEL_MAP = {0: "Low", 1: "Moderate", 2: "Severe"}
+RISK_LEVELS = ["Low", "Moderate", "Severe"]
 
 def df_from_request(req) -> pd.DataFrame:
     """Accept JSON array of records or file upload (CSV or gzipped CSV) or form fields."""
@@ -101,34 +267,376 @@ def df_from_request(req) -> pd.DataFrame:
         return pd.DataFrame([d])
     raise ValueError("Unsupported input. Send JSON array or upload a CSV file (field 'file').")
 
-def calculate_risk_summary(predictions: List[Dict]) -> Dict:
-    """Helper to calculate percentage distribution of risk levels."""
-    total = len(predictions)
-    counts = {"Low": 0, "Moderate": 0, "Severe": 0}
-    for p in predictions:
-        label = p.get("pred_text")
-        if label in counts:
-            counts[label] += 1
-    
+def select_model(n_rows: int):
+    """(model, variant) for n_rows under MODEL_ROUTING; a request's ?model=full|fast overrides it."""
+    policy = MODEL_ROUTING
+    if has_request_context() and request.args.get("model") in ("full", "fast"):
+        policy = request.args["model"]
+    if FAST_MODEL is not None and (policy == "fast" or (policy == "auto" and n_rows <= FAST_MODEL_MAX_ROWS)):
+        return FAST_MODEL, "fast"
+    return MODEL, "full"
+
+def score_features(X: pd.DataFrame, scaler=None, variant=None):
+    """
+    Scale and score X with the routed model (or the given variant, "full"/"fast");
+    large inputs are sharded across the worker pool. Returns (preds, probs).
+    """
+    if variant is None:
+        model, variant = select_model(len(X))
+    else:
+        model = FAST_MODEL if variant == "fast" and FAST_MODEL is not None else MODEL
+        variant = "fast" if model is FAST_MODEL else "full"
+    if has_request_context():
+        g.model_variant = variant
+    if variant == "full" and PREDICTOR is not None and len(X) >= SHARD_MIN_ROWS:
+        preds, probs, _ = PREDICTOR.predict(X, scaler)
+        return preds, probs
+    return score_block(model, scaler, X)
+
+def cascade_mode() -> str:
+    mode = request.args.get("cascade", CASCADE_MODE) if has_request_context() else CASCADE_MODE
+    return mode if mode in CASCADE_MODES else CASCADE_MODE
+
+def score_cascade(X: pd.DataFrame, prefilter: np.ndarray):
+    """
+    score_features through the clear-sky / fast-model cascade (only when the request
+    is routed to the full model). Stats go to g.cascade, with agreement against
+    exhaustive scoring when the request has ?verify=1. Returns (preds, probs).
+    """
+    mode = cascade_mode()
+    if mode == "off" or select_model(len(X))[1] != "full":
+        return score_features(X, SCALER)
+    accept = [c for c in getattr(MODEL, "classes_", []) if label_text(c) == "Low"]
+    preds, probs, stats = cascade_predict(
+        X, lambda part: score_features(part, SCALER, "full"),
+        (lambda part: score_block(FAST_MODEL, SCALER, part)) if FAST_MODEL is not None else None,
+        prefilter=prefilter, mode=mode, confidence=CASCADE_CONFIDENCE, accept=accept)
+    if has_request_context():
+        if request.args.get("verify") in ("1", "true"):
+            t0 = time.perf_counter()
+            ref_preds, ref_probs = score_features(X, SCALER, "full")
+            stats["exhaustive_seconds"] = round(time.perf_counter() - t0, 3)
+            stats["agreement"] = agreement(preds, probs, ref_preds, ref_probs)
+        g.model_variant = "cascade" if stats["cheap_rows"] else "full"
+        g.cascade = stats
+    return preds, probs
+
+def histogram_cell_deg():
+    """Histogram cell size for this request (?histogram=, else HISTOGRAM_CELL_DEG), or None when off."""
+    value = request.args.get("histogram", HISTOGRAM_CELL_DEG) if has_request_context() else HISTOGRAM_CELL_DEG
+    try:
+        cell_deg = float(value)
+    except ValueError:
+        return None
+    return cell_deg if cell_deg in CELL_SIZES else None
+
+def model_uses_temporal_features() -> bool:
+    """True when the loaded model/scaler was trained with any temporal feature column."""
+    names = set(getattr(MODEL, "feature_names_in_", [])) | set(getattr(SCALER, "feature_names_in_", []))
+    return bool(names & set(TEMPORAL.feature_names))
+
+def coerce_numeric(df: pd.DataFrame) -> pd.DataFrame:
+    """Best-effort numeric conversion; float columns are stored as FEATURE_DTYPE."""
+    for c in df.columns:
+        try:
+            df[c] = pd.to_numeric(df[c], errors='coerce')
+        except Exception:
+            continue
+        if df[c].dtype.kind == 'f' and df[c].dtype != FEATURE_DTYPE:
+            df[c] = df[c].astype(FEATURE_DTYPE)
+    return df
+
+def summarize_counts(counts: Dict, total: int) -> Dict:
+    """Percentages per risk level from {label: count}."""
     return {
-        label: round((count / total) * 100, 1) if total > 0 else 0
-        for label, count in counts.items()
+        label: round((int(counts.get(label, 0)) / total) * 100, 1) if total > 0 else 0
+        for label in RISK_LEVELS
     }
 
+def class_counts_from_codes(codes: np.ndarray, class_texts: np.ndarray) -> Dict:
+    """{label text: count}: bincount over class indices, folding classes that share a text."""
+    counts = {}
+    for text, n in zip(class_texts, np.bincount(codes, minlength=len(class_texts))):
+        counts[text] = counts.get(text, 0) + int(n)
+    return counts
+
+def risk_summary_from_codes(codes: np.ndarray, class_texts: np.ndarray) -> Dict:
+    """Vectorized risk summary: class counts folded into risk level percentages."""
+    return summarize_counts(class_counts_from_codes(codes, class_texts), len(codes))
+
+def label_text(p) -> str:
+    """Display text for one model class (string classes pass through, ints use LABEL_MAP)."""
+    if isinstance(p, (str, np.str_)):
+        return str(p)
+    try:
+        return LABEL_MAP.get(int(p), str(p))
+    except (ValueError, TypeError):
+        return str(p)
+
+def stored_class_text(cls: str) -> str:
+    """Display text for a class label stored as a string in the risk cache."""
+    return label_text(int(cls) if cls.lstrip("-").isdigit() else cls)
+
+def encode_classes(preds):
+    """Map predictions to (codes, classes): codes index into the sorted unique classes."""
+    classes = getattr(MODEL, "classes_", None)
+    if classes is not None:
+        codes = np.searchsorted(classes, preds)
+        if len(codes) and (codes.max() >= len(classes) or not np.array_equal(classes[codes], preds)):
+            classes = None
+    if classes is None:
+        classes, codes = np.unique(preds, return_inverse=True)
+    return codes.astype(np.intp), np.asarray(classes)
+
 def ensure_bins(df: pd.DataFrame) -> pd.DataFrame:
     """
     If model expects lat_bin/lon_bin but they are missing, infer from lat/lon.
-    Strategy: lat_bin = int(lat), lon_bin = int(lon) when lat/lon present.
+    Strategy: lat_bin = int(lat), lon_bin = int(lon) when lat/lon present (NaN otherwise).
     """
     # only attempt if lat/lon present
     if 'lat_bin' not in df.columns and 'lat' in df.columns:
         logger.info("Auto-filling missing column: lat_bin from lat (int(lat))")
-        df['lat_bin'] = df['lat'].apply(lambda x: int(x) if pd.notna(x) else pd.NA)
+        df['lat_bin'] = np.trunc(pd.to_numeric(df['lat'], errors='coerce'))
     if 'lon_bin' not in df.columns and 'lon' in df.columns:
         logger.info("Auto-filling missing column: lon_bin from lon (int(lon))")
-        df['lon_bin'] = df['lon'].apply(lambda x: int(x) if pd.notna(x) else pd.NA)
+        df['lon_bin'] = np.trunc(pd.to_numeric(df['lon'], errors='coerce'))
     return df
 
+def model_feature_names():
+    """Feature order recorded by the model (or the first pipeline step that has one), else None."""
+    if hasattr(MODEL, "feature_names_in_"):
+        return list(MODEL.feature_names_in_)
+    try:
+        from sklearn.pipeline import Pipeline
+        if isinstance(MODEL, Pipeline):
+            for name, step in MODEL.named_steps.items():
+                if hasattr(step, "feature_names_in_"):
+                    return list(step.feature_names_in_)
+    except Exception:
+        pass
+    return None
+
+def model_inputs(df: pd.DataFrame, fill: float = 0.0) -> pd.DataFrame:
+    """
+    Model input frame in the trained feature order, built by api.features like the
+    training rows (derived features computed when missing, other gaps = fill).
+    """
+    names = model_feature_names() or EXPECTED_FEATURES
+    X = feature_matrix(df, names, FEATURE_DTYPE, fill)
+    return pd.DataFrame(X, columns=names, copy=False)
+
+def busy_response(message: str, retry_after: int, status: int = 429):
+    resp = jsonify({"error": message, "retry_after": retry_after})
+    resp.status_code = status
+    resp.headers["Retry-After"] = str(retry_after)
+    return resp
+
+def job_spec(store: bool = False) -> Dict:
+    """
+    Describe the current request as a job spec. Uploaded files (or the raw body)
+    are referred to by their content hash, so the same upload always yields the
+    same spec. With store=True they are also copied to the blob store, which is
+    only needed when the request is queued and replayed later.
+    """
+    blob = JOBS.store_blob if store else JOBS.hash_blob
+    spec = {"endpoint": request.endpoint, "path": request.path, "method": request.method,
+            "query": sorted([k, v] for k, v in request.args.items(multi=True)
+                            if k not in JOB_CONTROL_ARGS and k not in JOB_PRIVATE_ARGS),
+            "form": [], "files": [], "body": None}
+    if request.mimetype in ("multipart/form-data", "application/x-www-form-urlencoded"):
+        spec["form"] = sorted([k, v] for k, v in request.form.items(multi=True) if k not in JOB_PRIVATE_ARGS)
+        for field, storage in request.files.items(multi=True):
+            sha, size = blob(storage.stream)
+            storage.stream.seek(0)  # the view still reads the upload when the request runs now
+            spec["files"].append([field, {"sha256": sha, "size": size, "filename": storage.filename,
+                                          "content_type": storage.mimetype}])
+    else:
+        data = request.get_data()  # cached, so the view can still parse the body
+        sha, size = blob(io.BytesIO(data))
+        spec["body"] = {"sha256": sha, "size": size, "content_type": request.content_type}
+    return spec
+
+def job_cache_key(spec: Dict):
+    """Key under which the result of `spec` is cached, or None when the result must not be reused."""
+    if spec["endpoint"] not in CACHEABLE_ENDPOINTS or model_uses_temporal_features():
+        return None
+    return JOBS.job_key(spec, salt=f"{MODEL_VERSION}|{FAST_MODEL_VERSION}|{MODEL_ROUTING}|{FEATURE_DTYPE}|"
+                                     f"{CASCADE_MODE}|{CASCADE_CONFIDENCE}|{HISTOGRAM_CELL_DEG}")
+
+def run_job(spec: Dict, job_id: str):
+    """Replay a stored request through the normal Flask stack. Returns (status, json payload)."""
+    with contextlib.ExitStack() as stack:
+        kwargs = {}
+        if spec["body"] is not None:
+            body = spec["body"]
+            kwargs.update(input_stream=stack.enter_context(open(JOBS.blob_path(body["sha256"]), "rb")),
+                          content_type=body["content_type"], content_length=body["size"])
+        else:
+            data = MultiDict(spec["form"])
+            for field, f in spec["files"]:
+                data.add(field, (stack.enter_context(open(JOBS.blob_path(f["sha256"]), "rb")),
+                                 f["filename"], f["content_type"]))
+            kwargs["data"] = data
+        stack.enter_context(app.test_request_context(
+            spec["path"], method=spec["method"], query_string=spec["query"],
+            environ_overrides={JOB_ENVIRON_KEY: job_id}, **kwargs))
+        resp = app.full_dispatch_request()
+        return resp.status_code, resp.get_json(silent=True)
+
+JOBS.start(run_job)
+
+def job_reply(job: Dict, status: int):
+    return json_response(dict(job, status_url=f"/jobs/{job['id']}")), status
+
+def cached_response(job: Dict):
+    """The stored response of a finished job, answered without running anything."""
+    resp = json_response(job["result"])
+    resp.status_code = job["http_status"] or 200
+    resp.headers["X-Job-Id"] = job["id"]
+    resp.headers["X-Cache"] = "hit"
+    return resp
+
+def current_job_id():
+    """Id under which the running request stores its result files (async job or cached sync request)."""
+    return request.environ.get(JOB_ENVIRON_KEY) or g.get("job_id")
+
+def handle_heavy_request():
+    """
+    Content-hash a heavy request: answer from the cache when the same upload was
+    already processed, queue it when ?async=1, otherwise let it run now and
+    remember the result (see store_job_result). Returns a response or None.
+    Runs after admission, and uploads reach the blob store only when a job is queued.
+    """
+    spec = job_spec()
+    key = job_cache_key(spec)
+    refresh = request.args.get("refresh") in ("1", "true")
+    is_async = request.args.get("async") in ("1", "true")
+    existing = None if refresh else JOBS.find(key)
+    if existing is not None and existing["status"] == "done":
+        return job_reply(existing, 200) if is_async else cached_response(existing)
+    if is_async:
+        if existing is not None:
+            return job_reply(existing, 202)  # same upload already queued or running
+        job = JOBS.submit(job_spec(store=True), key)
+        if job is None:
+            return busy_response("Too many pending jobs", ADMISSION.pools["heavy"].retry_after())
+        return job_reply(job, 202)
+    if key is not None:
+        g.job_id = JOBS.new_id()
+        g.job_cache = (spec, key)
+    return None
+
+@app.before_request
+def admit_request():
+    """Body limits, per-pool admission (429 + Retry-After when saturated), then result cache and async hand-off."""
+    if request.environ.get(JOB_ENVIRON_KEY):
+        return None  # replayed job: the job workers already bound concurrency
+    pool = ADMISSION.pool_for(request.endpoint)
+    if pool is None:
+        return None
+    length = request.content_length or 0
+    limit = LIGHT_MAX_BODY_KB * 1024 if pool.name == "light" else MAX_UPLOAD_MB * 1024 * 1024
+    if length > limit:
+        return jsonify({"error": f"Request body too large ({length} bytes, limit {limit})"}), 413
+    if not pool.acquire():
+        return busy_response(f"Server busy ({pool.name} requests); retry later", pool.retry_after())
+    g.admission = (pool, time.perf_counter())  # released in release_admission, also after early replies
+    if pool.name == "heavy" and request.method == "POST":
+        JOBS.ensure_workers()
+        return handle_heavy_request()
+    return None
+
+@app.after_request
+def store_job_result(response):
+    """Keep the result of a cacheable request that ran synchronously."""
+    cache = g.pop("job_cache", None)
+    if cache is None:
+        return response
+    job_id = g.job_id
+    if response.status_code == 200 and response.is_json:
+        spec, key = cache
+        try:
+            JOBS.record(spec, key, job_id, response.status_code, response.get_json())
+            response.headers["X-Job-Id"] = job_id
+        except Exception:
+            logger.exception("Could not store job result")
+    else:
+        shutil.rmtree(os.path.join(JOBS.results_dir, job_id), ignore_errors=True)
+    return response
+
+@app.teardown_request
+def release_admission(exc):
+    admission = g.pop("admission", None)
+    if admission is not None:
+        pool, t0 = admission
+        pool.release(time.perf_counter() - t0)
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def job_status(job_id):
+    """Status of a job; the result and its stored files are included once it has finished."""
+    job = JOBS.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    return json_response(job), 200
+
+@app.route("/jobs/<job_id>/files/<name>", methods=["GET"])
+def job_file(job_id, name):
+    """Download a file stored by a finished job (e.g. predictions.npz of /process-h5)."""
+    job = JOBS.get(job_id)
+    if job is None or name not in job["files"]:
+        return jsonify({"error": "Unknown job file"}), 404
+    return send_from_directory(JOBS.result_dir(job_id), name, as_attachment=True)
+
+@app.before_request
+def start_request_profile():
+    """Start a profiler when the request carries a valid profiling token."""
+    mode = profile_request_options(request, PROFILE_TOKEN)
+    if mode is None or request.endpoint == "get_profile":
+        return None
+    try:
+        g.profile = RequestProfile(mode, pool_prefixes=PROFILE_POOL_THREADS)
+        g.profile.start()
+    except Exception:
+        # e.g. another profiler already active in this interpreter
+        logger.exception("Could not start request profiler")
+        g.profile = None
+
+@app.after_request
+def add_model_variant(response):
+    """Tell the client which model (full forest or distilled fast model) scored the request."""
+    variant = g.get("model_variant")
+    if variant:
+        response.headers["X-Model-Variant"] = variant
+    return response
+
+@app.after_request
+def finish_request_profile(response):
+    """
+    Stop the profiler, store the profile and reference it in the response headers.
+    Runs before a streamed body (/stream) is generated, so such profiles end there.
+    """
+    prof = g.pop("profile", None)
+    if prof is None:
+        return response
+    try:
+        prof.stop()
+        name = prof.save(PROFILE_DIR, label=request.endpoint or "request")
+        response.headers["X-Profile-Id"] = name
+        if prof.pool_name:
+            response.headers["X-Profile-Pool-Id"] = prof.pool_name
+        response.headers["X-Profile-Seconds"] = f"{prof.elapsed:.4f}"
+    except Exception:
+        logger.exception("Could not save request profile")
+    return response
+
+@app.route("/profiles/<name>", methods=["GET"])
+def get_profile(name):
+    """Download a stored profile (.prof or .folded); requires the profiling token."""
+    supplied = request.headers.get("X-Profile-Token") or request.args.get("profile_token")
+    if not token_matches(supplied, PROFILE_TOKEN):
+        return jsonify({"error": "Forbidden"}), 403
+    return send_from_directory(PROFILE_DIR, secure_filename(name), as_attachment=True)
+
 @app.route("/", methods=["GET"])
 def index():
     return render_template("index.html")
@@ -136,7 +644,10 @@ def index():
 @app.route("/health", methods=["GET"])
 def health():
     ok = MODEL is not None
-    return jsonify({"status":"ok" if ok else "model_missing", "model_path": MODEL_PATH, "scaler_loaded": SCALER is not None}), (200 if ok else 500)
+    return jsonify({"status":"ok" if ok else "model_missing", "model_path": MODEL_PATH, "scaler_loaded": SCALER is not None,
+                    "fast_model_loaded": FAST_MODEL is not None, "model_routing": MODEL_ROUTING,
+                    "warm_start": WARM_STATE, "admission": ADMISSION.stats(), "streams": STREAM_SLOTS.stats(),
+                    "jobs_pending": JOBS.pending}), (200 if ok else 500)
 
 @app.route("/predict-batch", methods=["POST"])
 def predict_batch():
@@ -147,132 +658,528 @@ def predict_batch():
         df = df_from_request(request)
     except Exception as e:
         return jsonify({"error": str(e)}), 400
-    
-    results, status = predict_internal(df)
-    if status != 200:
-        return results, status
-    
-    predictions = results.get_json()["results"]
-    summary = calculate_risk_summary(predictions)
 
-    return jsonify({
-        "total_records": len(predictions),
-        "risk_summary": summary,
-        "results": predictions[:100] # return first 100 for preview
+    try:
+        codes, probs, class_texts = predict_arrays(df, record=True)
+    except Exception as e:
+        return jsonify({"error": f"Prediction failed: {e}"}), 500
+
+    n = 100  # return first 100 for preview
+    preview_probs = probs[:n] if probs is not None else None
+    return json_response({
+        "total_records": len(codes),
+        "model": g.get("model_variant"),
+        "risk_summary": risk_summary_from_codes(codes, class_texts),
+        "results": encode_predictions(requested_layout(request), class_texts[codes[:n]], preview_probs)
     }), 200
 
-def predict_internal(df: pd.DataFrame):
-    """Refactored core prediction logic for reuse."""
+def record_history(codes, probs, class_texts, df: pd.DataFrame = None, timestamp=None):
+    """Append served predictions to the history log; never fails the request."""
+    if HISTORY is None:
+        return
+    try:
+        bins = {c: pd.to_numeric(df[c], errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+                for c in ("lat_bin", "lon_bin") if df is not None and c in df.columns}
+        fast = has_request_context() and g.get("model_variant") == "fast"
+        HISTORY.append(codes, class_texts, probs.max(axis=1) if probs is not None else None,
+                       bins.get("lat_bin"), bins.get("lon_bin"), ts=timestamp,
+                       version=FAST_MODEL_VERSION if fast else MODEL_VERSION)
+    except Exception:
+        logger.exception("Could not record prediction history")
+
+def predict_arrays(df: pd.DataFrame, record: bool = False, timestamp=None, prefilter=None):
+    """
+    Core prediction logic for reuse. Returns (codes, probs, class_texts):
+    codes index into class_texts, probs is None for models without predict_proba.
+    With record=True the predictions are appended to the history log at `timestamp`
+    (default now). `prefilter` (boolean mask of clear-sky rows) enables cascaded
+    scoring. Raises on prediction failure.
+    """
     # Convert numeric-like columns to numeric
-    for c in df.columns:
-        try:
-            df[c] = pd.to_numeric(df[c], errors='coerce')
-        except Exception: pass
+    df = coerce_numeric(df)
 
     df = ensure_bins(df)
-    
-    # Feature Engineering
-    if 'wind_shear' not in df.columns and 'wind_speed_100m' in df.columns and 'wind_speed_10m' in df.columns:
-        df['wind_shear'] = (df['wind_speed_100m'] - df['wind_speed_10m']).abs()
-    if 'dewpt_dep' not in df.columns and 'temperature_2m' in df.columns and 'dewpoint_2m' in df.columns:
-        df['dewpt_dep'] = df['temperature_2m'] - df['dewpoint_2m']
-
-    # Get feature order
-    feature_names = None
-    if hasattr(MODEL, "feature_names_in_"):
-        feature_names = list(MODEL.feature_names_in_)
-    
-    # Ensure all required columns exist in the dataframe before slicing
-    target_cols = feature_names if feature_names else EXPECTED_FEATURES
-    for col in target_cols:
-        if col not in df.columns:
-            df[col] = 0.0
 
-    X_for_pred = df[target_cols].copy()
+    # Feature engineering shared with training (missing inputs are filled with 0)
+    X_for_pred = model_inputs(df, fill=0.0)
 
-    X_for_pred_scaled = SCALER.transform(X_for_pred) if SCALER else X_for_pred
+    if prefilter is not None:
+        preds, probs = score_cascade(X_for_pred, prefilter)
+    else:
+        preds, probs = score_features(X_for_pred, SCALER)
+    codes, classes = encode_classes(preds)
+    class_texts = np.array([label_text(c) for c in classes], dtype=object)
+    if record:
+        record_history(codes, probs, class_texts, df, timestamp)
+    return codes, probs, class_texts
 
+def predict_internal(df: pd.DataFrame, layout: str = "records"):
+    """Refactored core prediction logic for reuse (JSON response form of predict_arrays)."""
     try:
-        preds = MODEL.predict(X_for_pred_scaled)
-        probs = MODEL.predict_proba(X_for_pred_scaled) if hasattr(MODEL, "predict_proba") else None
+        codes, probs, class_texts = predict_arrays(df)
     except Exception as e:
         return jsonify({"error": f"Prediction failed: {e}"}), 500
+    return json_response({"results": encode_predictions(layout, class_texts[codes], probs)}), 200
 
-    out = []
-    for i, p in enumerate(preds):
-        # If prediction is already a string (like 'Moderate'), use it directly
-        if isinstance(p, (str, np.str_)):
-            label = str(p)
-        else:
-            try:
-                label = LABEL_MAP.get(int(p), str(p))
-            except (ValueError, TypeError):
-                label = str(p)
-        
-        rec = {"index": i, "pred_text": label}
-        if probs is not None:
-            rec["probs"] = [float(x) for x in probs[i]]
-        out.append(rec)
-
-    return jsonify({"results": out}), 200
+def satellite_frame(df: pd.DataFrame, lat_bin, lon_bin) -> pd.DataFrame:
+    """Model inputs for satellite pixels (lat, lon, CTP, CTT): bins, temporal features and CTP mapping."""
+    df['lat_bin'] = lat_bin
+    df['lon_bin'] = lon_bin
+    if model_uses_temporal_features():
+        for name, values in TEMPORAL.features(df["lat"], df["lon"]).items():
+            df[name] = values
+    df['cloud_cover'] = df['CTP'].fillna(0) / 10 # dummy mapping
+    df['surface_pressure'] = 1013 # default
+    return df
+
+def analyze_h5(path: str, filename: str, detail: bool = True, job_id=None, result_name="predictions.npz",
+               temporal_turn=None):
+    """
+    Read, score and summarise one staged HDF5 product. Returns (payload, summary): the
+    /process-h5 response for the product (previews only with `detail`) and the class
+    counts / histogram parts that multi-file requests combine. `temporal_turn` is entered
+    around the temporal engine update (multi-file requests feed it in timestep order).
+    Raises UploadError when the file has no geolocation.
+    """
+    with h5py.File(path, "r") as h5:
+        # Geolocation and fill-value mask come from the cache; only science datasets are read
+        grid = GEO_CACHE.get(h5, product_type(filename))
+        if grid is None:
+            raise UploadError("No geospatial data found in H5")
+
+        ctp = h5.get("CTP")
+        ctt = h5.get("CTT")
+
+        df = pd.DataFrame({
+            "lat": grid.lat[grid.valid_idx].astype(FEATURE_DTYPE),
+            "lon": grid.lon[grid.valid_idx].astype(FEATURE_DTYPE),
+            "CTP": grid.valid(ctp, FEATURE_DTYPE) if ctp else np.nan,
+            "CTT": grid.valid(ctt, FEATURE_DTYPE) if ctt else np.nan
+        })
+        has_science = bool(ctp or ctt)
+
+    # Feed the temporal engine when the file name carries a timestep
+    info = parse_product_name(filename)
+    with temporal_turn or contextlib.nullcontext():
+        if info is not None and has_science:
+            TEMPORAL.update(info["timestep"], df["lat"], df["lon"], {"CTP": df["CTP"], "CTT": df["CTT"]})
+
+    # Prediction Integration
+    pred_df = satellite_frame(df.copy(), grid.lat_bin, grid.lon_bin)
+    # Clear-sky pixels (no CTP) share one input vector; the cascade scores them once
+    codes, probs, class_texts = predict_arrays(pred_df, record=True,
+                                               timestamp=info["timestep"] if info else None,
+                                               prefilter=pred_df["CTP"].isna().to_numpy())
+
+    # Calculate Aggregate Risk Summary
+    class_counts = class_counts_from_codes(codes, class_texts)
+    payload = {
+        "rows": len(codes),
+        "risk_summary": summarize_counts(class_counts, len(codes)),
+    }
+    if detail:
+        n_preview = 10  # Keep a small preview
+        csv_buf = io.StringIO()
+        df.to_csv(csv_buf, index=False)
+        payload.update({
+            "message": "H5 processed and analyzed (Global Summary)",
+            "predictions_preview": encode_predictions(
+                requested_layout(request), class_texts[codes[:n_preview]],
+                probs[:n_preview] if probs is not None else None),
+            "csv_preview": csv_buf.getvalue()[:2000]
+        })
+    else:
+        payload.update(file=filename, class_counts=class_counts,
+                       timestep=info["timestep"].isoformat() if info else None)
+    if g.get("cascade"):
+        payload["cascade"] = g.cascade
+    summary = {"class_counts": class_counts, "classes": class_texts, "histogram": None,
+               "model_variant": g.get("model_variant")}
+    cell_deg = histogram_cell_deg()
+    if cell_deg is not None:
+        # Counts per class per lat/lon cell, for regional maps without per-pixel downloads
+        summary["histogram"] = risk_histogram(df["lat"].to_numpy(), df["lon"].to_numpy(), codes,
+                                              len(class_texts), cell_deg)
+        if detail:
+            payload["risk_histogram"] = encode_histogram(*summary["histogram"], cell_deg, class_texts)
+    if job_id:
+        # Per-pixel predictions are kept with the job result for download
+        np.savez(os.path.join(JOBS.result_dir(job_id), result_name),
+                 lat=df["lat"].to_numpy(np.float32), lon=df["lon"].to_numpy(np.float32),
+                 pred=codes.astype(np.uint8),
+                 proba_max=(probs.max(axis=1) if probs is not None else np.ones(len(codes))).astype(np.float16),
+                 classes=class_texts.astype(str))
+        payload["predictions_file"] = f"/jobs/{job_id}/files/{result_name}"
+    return payload, summary
+
+def analyze_h5_batch(staged, job_id=None):
+    """
+    Analyse several staged products [(name, path)] on H5_WORKERS threads. Products
+    are taken in timestep order and feed the temporal engine in that order (one at
+    a time when the model reads temporal features). Returns the response payload
+    with per-file and combined summaries.
+    """
+    t0 = time.perf_counter()
+    order = sorted(range(len(staged)), key=lambda k: (
+        (parse_product_name(staged[k][0]) or {}).get("timestep") or datetime.min, k))
+    staged = [staged[k] for k in order]
+    events = [threading.Event() for _ in staged]
+
+    @contextlib.contextmanager
+    def in_order(k):
+        if k:
+            events[k - 1].wait()
+        try:
+            yield
+        finally:
+            events[k].set()
+
+    def run(k):
+        name, path = staged[k]
+        try:
+            return analyze_h5(path, name, detail=False, job_id=job_id, temporal_turn=in_order(k),
+                              result_name=f"predictions_{k:03d}_{secure_filename(name) or 'upload'}.npz")
+        except Exception as e:
+            status = 400 if isinstance(e, UploadError) else 500
+            return {"file": name, "error": str(e), "status": status}, None
+        finally:
+            events[k].set()
+
+    workers = 1 if model_uses_temporal_features() else max(1, min(H5_WORKERS, len(staged)))
+    # one copy of the request context per product, made here (worker threads have none to copy)
+    tasks = [copy_current_request_context(functools.partial(run, k)) for k in range(len(staged))]
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="h5") as pool:
+        results = [future.result() for future in [pool.submit(task) for task in tasks]]
+
+    files = [payload for payload, _ in results]
+    summaries = [summary for _, summary in results if summary is not None]
+    counts, rows = {}, 0
+    for summary in summaries:
+        for text, n in summary["class_counts"].items():
+            counts[text] = counts.get(text, 0) + n
+            rows += n
+    combined = {"files": len(files), "scored_files": len(summaries), "rows": rows,
+                "class_counts": counts, "risk_summary": summarize_counts(counts, rows)}
+    cell_deg = histogram_cell_deg()
+    if cell_deg is not None and summaries:
+        hist, lat_min, lon_min = merge_histograms([s["histogram"] for s in summaries], cell_deg)
+        combined["risk_histogram"] = encode_histogram(hist, lat_min, lon_min, cell_deg, summaries[0]["classes"])
+    variants = {s["model_variant"] for s in summaries if s["model_variant"]}
+    if variants:
+        g.model_variant = variants.pop() if len(variants) == 1 else "mixed"
+    return {"message": f"{len(summaries)} of {len(files)} H5 products analyzed", "workers": workers,
+            "seconds": round(time.perf_counter() - t0, 3), "combined": combined, "files": files}
 
 @app.route("/process-h5", methods=["POST"])
 def process_h5():
-    """Convert uploaded HDF5 to processed CSV format."""
-    if 'file' not in request.files:
+    """
+    Analyse uploaded HDF5 products. One `file` gives the original single-product response;
+    several `file` fields or a tar/zip bundle give per-file and combined summaries.
+    """
+    uploads = [f for f in request.files.getlist("file") if f.filename]
+    if not uploads:
         return jsonify({"error": "No file uploaded"}), 400
-    
-    f = request.files['file']
-    filename = secure_filename(f.filename)
-    # Save temporarily
-    tmp_path = os.path.join("/tmp", filename)
-    f.save(tmp_path)
 
     try:
-        with h5py.File(tmp_path, "r") as h5:
-            lat_ds = h5.get("Latitude") or h5.get("CSBT_Latitude")
-            lon_ds = h5.get("Longitude") or h5.get("CSBT_Longitude")
-            if lat_ds is None:
-                return jsonify({"error": "No geospatial data found in H5"}), 400
-            
-            lat = np.array(lat_ds).ravel()
-            lon = np.array(lon_ds).ravel()
-            ctp = h5.get("CTP")
-            ctt = h5.get("CTT")
-
-            # Simple masking for demo (using logic from process_mosdac_perfile.py)
-            mask = (lat != 32767)
-            df = pd.DataFrame({
-                "lat": lat[mask],
-                "lon": lon[mask],
-                "CTP": np.array(ctp).ravel()[mask] if ctp else np.nan,
-                "CTT": np.array(ctt).ravel()[mask] if ctt else np.nan
-            })
-            
-            # Prediction Integration
-            pred_df = df.copy()
-            pred_df['cloud_cover'] = pred_df['CTP'].fillna(0) / 10 # dummy mapping
-            pred_df['surface_pressure'] = 1013 # default
-            pred_json, status = predict_internal(pred_df)
-            predictions = pred_json.get_json()["results"]
-
-            # Calculate Aggregate Risk Summary
-            risk_summary = calculate_risk_summary(predictions)
-
-            csv_buf = io.StringIO()
-            df.to_csv(csv_buf, index=False)
-            return jsonify({
-                "message": "H5 processed and analyzed (Global Summary)",
-                "rows": len(predictions),
-                "risk_summary": risk_summary,
-                "predictions_preview": predictions[:10], # Keep a small preview
-                "csv_preview": csv_buf.getvalue()[:2000]
-            })
+        # Each product gets its own scratch file, so concurrent uploads of the same name cannot collide
+        with staged_uploads(((f.filename, f.stream) for f in uploads), scratch_dir=H5_SCRATCH_DIR,
+                            max_files=H5_MAX_FILES, max_bytes=H5_MAX_STAGED_MB * 1024 * 1024) as staged:
+            if not staged:
+                return jsonify({"error": "No HDF5 products found in upload"}), 400
+            if len(uploads) == 1 and not is_archive(uploads[0].filename):
+                payload, _ = analyze_h5(staged[0][1], secure_filename(uploads[0].filename),
+                                        job_id=current_job_id())
+            else:
+                payload = analyze_h5_batch(staged, job_id=current_job_id())
+            return json_response(dict(payload, model=g.get("model_variant")))
+    except UploadError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
-    finally:
-        if os.path.exists(tmp_path):
-            os.remove(tmp_path)
+
+@app.route("/risk-latest", methods=["GET"])
+def risk_latest():
+    """Summary of the most recent product scored by the ingestion daemon."""
+    summary = RISK_CACHE.summary()
+    if summary is None:
+        return jsonify({"error": "No ingested products yet"}), 404
+    counts = {}
+    for cls, n in summary.get("class_counts", {}).items():
+        text = stored_class_text(cls)
+        counts[text] = counts.get(text, 0) + n
+    return jsonify(dict(summary, risk_summary=summarize_counts(counts, summary.get("rows", 0)))), 200
+
+def stream_payloads(event, region):
+    """(prediction, alerts) payloads of one broadcast event for a client's region."""
+    counts = event.class_counts(region)
+    total = sum(counts.values())
+    s = event.summary
+    prediction = {
+        "seq": event.seq, "product": s.get("product"), "timestep": s.get("timestep"),
+        "file": s.get("file"), "latency_s": s.get("latency_s"), "region": region,
+        "rows": total, "class_counts": counts, "risk_summary": summarize_counts(counts, total),
+    }
+    return prediction, event.alerts(region)
+
+@app.route("/stream", methods=["GET"])
+def stream():
+    """
+    Server-Sent Events feed of ingested products: a `prediction` event per product,
+    an `alert` event when it has Severe cells, and heartbeat comments in between.
+    Optional ?region=lat_min,lat_max,lon_min,lon_max limits both to a bounding box.
+    At most MAX_STREAMS streams are open per process; more get 503 + Retry-After.
+    """
+    try:
+        region = parse_region(request.args.get("region"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if not STREAM_SLOTS.acquire():
+        return busy_response("Too many open streams; retry later", int(STREAM_HEARTBEAT), status=503)
+    last_id = request.headers.get("Last-Event-ID")
+    q = BROADCASTER.subscribe()
+
+    def events():
+        try:
+            yield f"retry: {int(STREAM_HEARTBEAT * 1000)}\n\n"
+            # start with the current state unless the client already has it (reconnect)
+            sent = int(last_id) if last_id and last_id.isdigit() else 0
+            event = BROADCASTER.latest
+            while True:
+                if event is not None and event.seq > sent:
+                    sent = event.seq
+                    prediction, alerts = stream_payloads(event, region)
+                    yield sse(prediction, "prediction", event.seq)
+                    if alerts:
+                        yield sse({"seq": event.seq, "timestep": prediction["timestep"], "cells": alerts}, "alert")
+                try:
+                    event = q.get(timeout=STREAM_HEARTBEAT)
+                except queue.Empty:
+                    event = None
+                    yield f": heartbeat {int(time.time())}\n\n"
+        finally:
+            BROADCASTER.unsubscribe(q)
+
+    resp = Response(events(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    def close():
+        # called when the client goes away, even before the body started
+        BROADCASTER.unsubscribe(q)
+        STREAM_SLOTS.release()
+
+    resp.call_on_close(close)
+    return resp
+
+def route_features(raw) -> Dict:
+    """Validated constant model inputs of a /route-risk body: {name in FEATURES: finite number}."""
+    if raw is None:
+        return {}
+    if not isinstance(raw, dict):
+        raise ValueError("features must be an object of model input names to numbers")
+    unknown = sorted(set(raw) - set(FEATURES))
+    if unknown:
+        raise ValueError(f"Unknown features {unknown}; expected a subset of {FEATURES}")
+    bad = sorted(k for k, v in raw.items()
+                 if isinstance(v, bool) or not isinstance(v, (int, float)) or not math.isfinite(v))
+    if bad:
+        raise ValueError(f"features {bad} must be finite numbers")
+    return {k: float(v) for k, v in raw.items()}
+
+def route_index():
+    """GridIndex over the latest cached grid, or None before anything was ingested."""
+    global ROUTE_INDEX
+    grid = RISK_CACHE.grid()
+    if grid is None:
+        return None
+    with ROUTE_INDEX_LOCK:
+        if ROUTE_INDEX is None or ROUTE_INDEX.seq != grid["seq"]:
+            ROUTE_INDEX = GridIndex(grid)
+        return ROUTE_INDEX
+
+@app.route("/route-risk", methods=["POST"])
+def route_risk():
+    """
+    Score flight routes against the latest ingested grid. Body:
+      {"waypoints": [{"lat", "lon", "alt_ft", "time"}, ...]}  or  {"routes": [{"id", "waypoints"}, ...]}
+    plus optional "spacing_km", "features" (constant model inputs, e.g. ERA5 winds)
+    and "include_samples". All samples of all routes are scored in one batch.
+    """
+    if MODEL is None:
+        return jsonify({"error": "Model not loaded"}), 500
+    data = request.get_json(silent=True) or {}
+    routes = data.get("routes") or ([{"id": data.get("id"), "waypoints": data.get("waypoints")}]
+                                    if data.get("waypoints") else None)
+    if not routes:
+        return jsonify({"error": "Send 'waypoints' or 'routes'"}), 400
+    try:
+        spacing = float(data.get("spacing_km", ROUTE_SPACING_KM))
+    except (TypeError, ValueError):
+        return jsonify({"error": "spacing_km must be a number"}), 400
+    if spacing < 0.1:
+        return jsonify({"error": "spacing_km must be at least 0.1"}), 400
+    try:
+        features = route_features(data.get("features"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # count the samples of every route from its leg lengths before allocating any
+    waypoints, n_samples = [], 0
+    for i, route in enumerate(routes):
+        try:
+            lat, lon, alt, t = parse_waypoints(route.get("waypoints"))
+        except ValueError as e:
+            return jsonify({"error": f"route {route.get('id') or i}: {e}"}), 400
+        n_samples += sample_count(lat, lon, spacing)
+        if n_samples > ROUTE_MAX_SAMPLES:
+            return jsonify({"error": f"Too many samples (> {ROUTE_MAX_SAMPLES}); increase spacing_km"}), 400
+        waypoints.append((route.get("id") or i, lat, lon, alt, t))
+
+    # sample every route
+    parsed = []
+    for route_id, lat, lon, alt, t in waypoints:
+        seg, frac, s_lat, s_lon, lengths = sample_polyline(lat, lon, spacing)
+        parsed.append((route_id, lat, lon, seg, s_lat, s_lon,
+                       interpolate(alt, seg, frac), interpolate(t, seg, frac), lengths))
+
+    index = route_index()
+    if index is None:
+        return jsonify({"error": "No ingested grid yet (start ingest_daemon.py)"}), 404
+    grid = index.grid
+    summary = RISK_CACHE.summary() or {}
+
+    s_lat = np.concatenate([p[4] for p in parsed])
+    s_lon = np.concatenate([p[5] for p in parsed])
+    n_segs = np.array([p[8].size for p in parsed])
+    seg_offset = np.cumsum(n_segs) - n_segs
+    group = np.concatenate([p[3] + off for p, off in zip(parsed, seg_offset)])
+
+    # nearest grid pixel per sample; samples without a pixel within range stay unscored
+    pix, dist_km = index.lookup(s_lat, s_lon, ROUTE_MAX_MATCH_KM)
+    hit = pix >= 0
+    rank = np.full(s_lat.size, -1, dtype=np.int64)
+    severe_prob = np.full(s_lat.size, np.nan)
+    if hit.any():
+        df = pd.DataFrame({"lat": s_lat[hit].astype(FEATURE_DTYPE), "lon": s_lon[hit].astype(FEATURE_DTYPE)})
+        for key in grid:
+            if key.startswith("feat_"):
+                df[key[5:]] = grid[key][pix[hit]].astype(FEATURE_DTYPE)
+        for col in ("CTP", "CTT"):
+            if col not in df.columns:
+                df[col] = np.nan
+        df = satellite_frame(df, np.trunc(s_lat[hit]).astype(np.int16), np.trunc(s_lon[hit]).astype(np.int16))
+        derived = sorted(set(features) & set(df.columns))
+        if derived:
+            return jsonify({"error": f"features {derived} come from the satellite grid and cannot be set"}), 400
+        for name, value in features.items():
+            df[name] = value
+        try:
+            codes, probs, class_texts = predict_arrays(df)
+        except Exception as e:
+            return jsonify({"error": f"Prediction failed: {e}"}), 500
+        class_rank = np.array([RISK_LEVELS.index(t) if t in RISK_LEVELS else -1 for t in class_texts])
+        rank[hit] = class_rank[codes]
+        severe_cols = [k for k, t in enumerate(class_texts) if t == "Severe"]
+        if probs is not None and severe_cols:
+            severe_prob[hit] = probs[:, severe_cols].sum(axis=1)
+
+    # per-segment aggregates, vectorized over all routes
+    n_groups = int(n_segs.sum())
+    n_levels = len(RISK_LEVELS)
+    seg_samples = np.bincount(group, minlength=n_groups)
+    level_counts = np.bincount(group[hit] * n_levels + np.maximum(rank[hit], 0),
+                               minlength=n_groups * n_levels).reshape(n_groups, n_levels)
+    seg_rank = np.full(n_groups, -1, dtype=np.int64)
+    np.maximum.at(seg_rank, group, rank)
+    seg_severe = np.full(n_groups, -1.0)
+    scored = hit & ~np.isnan(severe_prob)
+    np.maximum.at(seg_severe, group[scored], severe_prob[scored])
+
+    def nullable(values, decimals):
+        values = np.round(np.asarray(values, dtype=np.float64), decimals)
+        return np.where(np.isnan(values), None, values).tolist()
+
+    out_routes, start = [], 0
+    for (route_id, lat, lon, seg, r_lat, r_lon, r_alt, r_time, lengths), off in zip(parsed, seg_offset):
+        segments = []
+        for k in range(lengths.size):
+            gi = off + k
+            n_scored = int(level_counts[gi].sum())
+            segments.append({
+                "segment": k,
+                "from": [float(lat[k]), float(lon[k])],
+                "to": [float(lat[k + 1]), float(lon[k + 1])],
+                "length_km": round(float(lengths[k]), 1),
+                "n_samples": int(seg_samples[gi]),
+                "n_scored": n_scored,
+                "risk": RISK_LEVELS[seg_rank[gi]] if seg_rank[gi] >= 0 else None,
+                "max_severe_prob": round(float(seg_severe[gi]), 3) if seg_severe[gi] >= 0 else None,
+                "risk_summary": summarize_counts(dict(zip(RISK_LEVELS, level_counts[gi])), n_scored),
+            })
+        ranked = [s for s in segments if s["risk"] is not None]
+        worst = max(ranked, key=lambda s: (RISK_LEVELS.index(s["risk"]), s["max_severe_prob"] or 0.0)) if ranked else None
+        entry = {
+            "id": route_id,
+            "length_km": round(float(lengths.sum()), 1),
+            "n_samples": int(seg.size),
+            "n_scored": sum(s["n_scored"] for s in segments),
+            "risk": worst["risk"] if worst else None,
+            "worst_segment": worst,
+            "segments": segments,
+        }
+        if data.get("include_samples"):
+            sl = slice(start, start + seg.size)
+            times = pd.to_datetime(r_time, unit="s", utc=True)
+            entry["samples"] = {
+                "segment": seg.tolist(),
+                "lat": np.round(r_lat, 4).tolist(),
+                "lon": np.round(r_lon, 4).tolist(),
+                "alt_ft": nullable(r_alt, 0),
+                "time": [None if pd.isna(ts) else ts.isoformat() for ts in times],
+                "risk": [RISK_LEVELS[r] if r >= 0 else None for r in rank[sl]],
+                "severe_prob": nullable(severe_prob[sl], 3),
+                "grid_distance_km": nullable(dist_km[sl], 1),
+            }
+        start += seg.size
+        out_routes.append(entry)
+
+    return json_response({
+        "grid": {k: summary.get(k) for k in ("seq", "product", "timestep", "file")},
+        "spacing_km": spacing,
+        "n_samples": int(s_lat.size),
+        "n_scored": int(hit.sum()),
+        "routes": out_routes,
+    }), 200
+
+@app.route("/history/risk", methods=["GET"])
+def history_risk():
+    """
+    Risk percentages from the prediction history rollups.
+    Query: start/end (ISO, hour resolution), region=lat_min,lat_max,lon_min,lon_max
+    (integer bins) and group_by=hour|cell|total.
+    """
+    if HISTORY is None:
+        return jsonify({"error": "Prediction history is disabled"}), 404
+    group_by = request.args.get("group_by", "hour")
+    try:
+        region = parse_region(request.args.get("region"))
+        labels, keys, counts = HISTORY.aggregate(request.args.get("start"), request.args.get("end"),
+                                                 region, group_by)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    totals = counts.sum(axis=1)
+    groups = []
+    for i, total in enumerate(totals.tolist()):
+        label_counts = {}
+        for text, n in zip(labels, counts[i].tolist()):
+            label_counts[text] = label_counts.get(text, 0) + n
+        group = {"rows": total, "risk_summary": summarize_counts(label_counts, total)}
+        if "hour" in keys:
+            group["hour"] = pd.Timestamp(int(keys["hour"][i]) * 3600, unit="s").isoformat()
+        elif "lat_bin" in keys:
+            group["lat_bin"], group["lon_bin"] = int(keys["lat_bin"][i]), int(keys["lon_bin"][i])
+        groups.append(group)
+    return json_response({"group_by": group_by, "labels": labels, "rows": int(totals.sum()),
+                          "groups": groups}), 200
 
 @app.route("/mosdac-ingest", methods=["POST"])
 def mosdac_ingest():
@@ -290,6 +1197,11 @@ def mosdac_ingest():
     if "error" in result:
         return jsonify(result), 401
     
+    # Ingest the stream into the rolling CTP/CTT buffers (timesteps already seen are ignored)
+    for point in result["stream"]:
+        TEMPORAL.update(point["timestamp"], [lat], [lon], {"CTP": [point["CTP"]], "CTT": [point["CTT"]]})
+    temporal = {k: (None if np.isnan(v[0]) else float(v[0])) for k, v in TEMPORAL.features([lat], [lon]).items()}
+
     # Calculate prediction for the LATEST point in the stream
     latest_point = result["stream"][-1]
     mock_row = pd.DataFrame([{
@@ -298,15 +1210,21 @@ def mosdac_ingest():
         "surface_pressure": 1013, 
         "wind_speed_10m": 5, "wind_speed_100m": 12,
         "relative_humidity_2m": 70, 
-        "cloud_cover": latest_point["CTP"] / 10 # Map CTP to cloud cover
+        "cloud_cover": latest_point["CTP"] / 10, # Map CTP to cloud cover
+        # temporal features are only collected until a model is trained on them
+        **({k: (np.nan if v is None else v) for k, v in temporal.items()} if model_uses_temporal_features() else {})
     }])
-    pred_res, status = predict_internal(mock_row)
+    try:
+        codes, probs, class_texts = predict_arrays(mock_row)
+    except Exception as e:
+        return jsonify({"error": f"Prediction failed: {e}"}), 500
     
     return jsonify({
         "mosdac_status": "Live Streaming Active",
         "ingestion_info": result,
-        "current_prediction": pred_res.get_json()["results"][0]
-    }), status
+        "temporal_features": temporal,
+        "current_prediction": encode_predictions("records", class_texts[codes], probs)[0]
+    }), 200
 
 @app.route("/predict", methods=["POST"])
 def predict():
@@ -321,61 +1239,15 @@ def predict():
     original_index = df.index.tolist()
 
     # Convert numeric-like columns to numeric (best-effort)
-    for c in df.columns:
-        try:
-            df[c] = pd.to_numeric(df[c], errors='coerce')
-        except Exception:
-            pass
+    df = coerce_numeric(df)
 
     # Auto-create lat_bin/lon_bin if missing
     df = ensure_bins(df)
 
-    # --- Feature Engineering ---
-    # Calculate derived features if missing
-    if 'wind_shear' not in df.columns and 'wind_speed_100m' in df.columns and 'wind_speed_10m' in df.columns:
-        df['wind_shear'] = (df['wind_speed_100m'] - df['wind_speed_10m']).abs()
-    
-    if 'dewpt_dep' not in df.columns and 'temperature_2m' in df.columns and 'dewpoint_2m' in df.columns:
-        df['dewpt_dep'] = df['temperature_2m'] - df['dewpoint_2m']
-    # ---------------------------
-
-    # Try to obtain the trained feature order (feature_names_in_)
-    feature_names = None
-    try:
-        # direct attribute on estimator/pipeline
-        if hasattr(MODEL, "feature_names_in_"):
-            feature_names = list(MODEL.feature_names_in_)
-        else:
-            # if it's a Pipeline, search steps for the first estimator that recorded feature names
-            try:
-                from sklearn.pipeline import Pipeline
-                if isinstance(MODEL, Pipeline):
-                    for name, step in MODEL.named_steps.items():
-                        if hasattr(step, "feature_names_in_"):
-                            feature_names = list(step.feature_names_in_)
-                            break
-            except Exception:
-                feature_names = None
-    except Exception:
-        feature_names = None
-
-    # If we found a canonical feature order, reindex the dataframe to match it (fill missing cols with NaN)
-    X_for_pred = df
-    if feature_names:
-        logger.info(f"Reindexing input to model feature order: {feature_names}")
-        # ensure all feature names exist as columns (add with NaN if missing), then order them
-        for col in feature_names:
-            if col not in df.columns:
-                df[col] = pd.NA
-        X_for_pred = df[feature_names].copy()
-    else:
-        # Fallback: use hardcoded expected features
-        logger.info(f"No feature_names_in_ found on MODEL; using hardcoded list: {EXPECTED_FEATURES}")
-        # Ensure all columns exist
-        for col in EXPECTED_FEATURES:
-            if col not in df.columns:
-                df[col] = 0.0 # Fill missing with 0 or suitable default
-        X_for_pred = df[EXPECTED_FEATURES].copy()
+    # --- Feature Engineering (api/features.py, shared with training) ---
+    # Inputs are ordered like the model's recorded feature names (missing ones NaN),
+    # or like the training features (missing ones 0) when the model has none
+    X_for_pred = model_inputs(df, fill=np.nan if model_feature_names() else 0.0)
 
     # Apply scaling if available
     if SCALER:
@@ -390,28 +1262,51 @@ def predict():
 
     # Attempt prediction
     try:
-        preds = MODEL.predict(X_for_pred_scaled)
-        probs = MODEL.predict_proba(X_for_pred_scaled) if hasattr(MODEL, "predict_proba") else None
+        preds, probs = score_features(X_for_pred_scaled)
     except Exception as e:
         logger.exception("Primary prediction attempt failed")
         return jsonify({"error": f"Prediction failed: {e}"}), 500
 
-    out = []
-    for i, p in enumerate(preds):
-        # Handle string or int predictions
-        if isinstance(p, (int, np.integer, float, np.floating)):
-            pred_label = int(p)
-            pred_text = LABEL_MAP.get(pred_label, str(pred_label))
-        else:
-            pred_label = str(p)
-            pred_text = pred_label
+    # Handle string or int predictions: map each class once, then index by class code
+    codes, classes = encode_classes(preds)
+    class_labels = np.array([int(c) if isinstance(c, (int, np.integer, float, np.floating)) else str(c)
+                             for c in classes], dtype=object)
+    class_texts = np.array([label_text(c) for c in class_labels], dtype=object)
 
-        rec = {"index": original_index[i], "pred_label": pred_label, "pred_text": pred_text}
-        if probs is not None:
-            rec["probs"] = [float(x) for x in probs[i]]
-        out.append(rec)
+    record_history(codes, probs, class_texts, df)
 
-    return jsonify({"n_rows": len(out), "results": out}), 200
+    results = encode_predictions(requested_layout(request), class_texts[codes], probs,
+                                 index=np.asarray(original_index), pred_label=class_labels[codes])
+    return json_response({"n_rows": len(codes), "model": g.get("model_variant"), "results": results}), 200
+
+def warm_start(rows: int = WARM_START_ROWS) -> Dict:
+    """
+    Score a dummy batch (full model) and a single row (routed by MODEL_ROUTING) through
+    predict_arrays and the JSON encoder, so lazy imports and first-call allocations are
+    paid before the first request. Stays below SHARD_MIN_ROWS, so no pool is started
+    before gunicorn forks. Returns timings for /health.
+    """
+    t0 = time.perf_counter()
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame(rng.uniform(0, 100, (min(rows, SHARD_MIN_ROWS - 1), len(EXPECTED_FEATURES))),
+                      columns=EXPECTED_FEATURES)
+    timings = {}
+    for name, batch in (("batch", df), ("single", df.head(1).copy())):
+        t = time.perf_counter()
+        codes, probs, class_texts = predict_arrays(batch)
+        with app.test_request_context():
+            json_response({"results": encode_predictions("records", class_texts[codes], probs)})
+        timings[f"{name}_s"] = round(time.perf_counter() - t, 4)
+    return dict(timings, rows=len(df), seconds=round(time.perf_counter() - t0, 3))
+
+WARM_STATE = None
+if WARM_START and MODEL is not None:
+    try:
+        WARM_STATE = warm_start()
+        logger.info("Warm start: %s", WARM_STATE)
+    except Exception as e:
+        logger.exception("Warm start failed")
+        WARM_STATE = {"error": str(e)}
 
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=PORT, debug=True)
@@ -0,0 +1,116 @@
+"""
+Cascaded (early-exit) scoring for large satellite grids.
+
+Most of an INSAT-3D full disk is clear sky or obviously low risk. The full
+300-tree forest only needs to see the pixels where its answer is in doubt:
+
+1. Clear sky (exact). Clear pixels have no CTP, so all of their model inputs
+   are the same constants. When every prefiltered row really is identical,
+   the forest scores one of them and the result is copied to the rest. The
+   labels and probabilities are exactly what exhaustive scoring would give,
+   and the time saved grows with the clear-sky share of the disk.
+2. Cheap model (approximate, optional). The distilled fast model scores the
+   remaining pixels. Where it predicts an accepted class (Low) with at least
+   `confidence`, its answer is kept. Everything else, including every
+   non-Low call, goes to the forest, so a risky pixel is never labelled by
+   the cheap pass alone.
+
+`agreement` compares a cascaded result with exhaustive scoring, to validate
+the thresholds on real products.
+"""
+import time
+
+import numpy as np
+
+MODES = ("off", "exact", "fast")
+
+
+def identical_rows(X, rows):
+    """True when all `rows` of X (DataFrame or array) hold the same values (NaN equal to NaN)."""
+    arr = X.to_numpy() if hasattr(X, "to_numpy") else np.asarray(X)
+    if rows.size < 2:
+        return True
+    for j in range(arr.shape[1]):
+        col = arr[rows, j]
+        ref = col[0]
+        if not np.all((col == ref) | (np.isnan(col) & np.isnan(ref))):
+            return False
+    return True
+
+
+def take(X, rows):
+    return X.iloc[rows] if hasattr(X, "iloc") else X[rows]
+
+
+def cascade_predict(X, score_full, score_cheap=None, prefilter=None, mode="exact",
+                    confidence=0.9, accept=()):
+    """
+    Score X through the cascade. score_full/score_cheap: X -> (preds, probs).
+    `prefilter` is a boolean mask of rows expected to share one input vector
+    (clear sky). `accept` lists the classes the cheap model may decide alone.
+    Returns (preds, probs, stats); probs is None when the forest has no probabilities.
+    """
+    n = len(X)
+    t0 = time.perf_counter()
+    stats = {"mode": mode, "rows": n, "collapsed_rows": 0, "cheap_rows": 0}
+    if mode == "off" or n == 0:
+        preds, probs = score_full(X)
+        stats.update(full_model_rows=n, full_model_share=1.0, seconds=round(time.perf_counter() - t0, 3))
+        return preds, probs, stats
+
+    pending = np.ones(n, dtype=bool)
+    parts = []  # (row indices, preds, probs)
+
+    # stage 1: identical prefiltered rows are scored once
+    if prefilter is not None:
+        rows = np.flatnonzero(prefilter)
+        if rows.size > 1 and identical_rows(X, rows):
+            p, pr = score_full(take(X, rows[:1]))
+            parts.append((rows, np.repeat(p, rows.size), None if pr is None else np.repeat(pr, rows.size, axis=0)))
+            pending[rows] = False
+            stats["collapsed_rows"] = int(rows.size)
+
+    # stage 2: confident cheap-model calls of accepted classes
+    if mode == "fast" and score_cheap is not None and len(accept):
+        rows = np.flatnonzero(pending)
+        if rows.size:
+            p, pr = score_cheap(take(X, rows))
+            if pr is not None:
+                ok = np.isin(p, accept) & (pr.max(axis=1) >= confidence)
+                parts.append((rows[ok], p[ok], pr[ok]))
+                pending[rows[ok]] = False
+                stats["cheap_rows"] = int(ok.sum())
+
+    # stage 3: the forest on everything else
+    full_rows = np.flatnonzero(pending)
+    if full_rows.size:
+        p, pr = score_full(take(X, full_rows))
+        parts.append((full_rows, p, pr))
+
+    parts = [part for part in parts if part[0].size]
+    preds = np.empty(n, dtype=np.result_type(*[np.asarray(part[1]).dtype for part in parts]))
+    probs = None
+    if all(part[2] is not None for part in parts):
+        probs = np.empty((n, parts[0][2].shape[1]), dtype=np.float64)
+    for rows, p, pr in parts:
+        preds[rows] = p
+        if probs is not None:
+            probs[rows] = pr
+    stats.update(full_model_rows=int(full_rows.size), full_model_share=round(full_rows.size / n, 4),
+                 seconds=round(time.perf_counter() - t0, 3))
+    return preds, probs, stats
+
+
+def agreement(preds, probs, ref_preds, ref_probs):
+    """Label agreement, per-class confusion and max probability difference of a cascaded vs exhaustive result."""
+    preds, ref_preds = np.asarray(preds), np.asarray(ref_preds)
+    same = preds == ref_preds
+    # "expected->got" label pairs with their counts
+    pairs, counts = np.unique(np.char.add(np.char.add(ref_preds.astype(str), "->"), preds.astype(str)),
+                              return_counts=True)
+    confusion = {str(pair): int(c) for pair, c in zip(pairs, counts)}
+    out = {"rows": int(preds.size), "label_agreement": round(float(same.mean()), 6) if preds.size else 1.0,
+           "changed_rows": int((~same).sum()), "confusion": confusion}
+    if probs is not None and ref_probs is not None and preds.size:
+        out["max_prob_diff"] = round(float(np.abs(probs - ref_probs).max()), 6)
+    return out
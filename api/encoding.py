@@ -0,0 +1,82 @@
+"""
+Response encoding for prediction results.
+
+Two layouts are supported:
+  - records:  the original list of per-row dicts ({"index", "pred_text", "probs", ...})
+  - columnar: one array per field ({"index": [...], "pred_text": [...], "probs": [[...]]}),
+    which avoids building a dict per row and is much smaller on the wire
+Arrays are converted with ndarray.tolist() (C speed) rather than per-element
+float() calls, and orjson is used for serialization when it is installed.
+"""
+import json
+
+import numpy as np
+from flask import Response, jsonify
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+LAYOUTS = ("records", "columnar")
+
+
+def _tolist(values):
+    return values.tolist() if isinstance(values, np.ndarray) else list(values)
+
+
+def _columns(pred_text, probs=None, index=None, pred_label=None):
+    n = len(pred_text)
+    cols = {"index": _tolist(index) if index is not None else list(range(n))}
+    if pred_label is not None:
+        cols["pred_label"] = _tolist(pred_label)
+    cols["pred_text"] = _tolist(pred_text)
+    if probs is not None:
+        cols["probs"] = _tolist(probs)
+    return cols
+
+
+def encode_records(pred_text, probs=None, index=None, pred_label=None):
+    """List of per-row dicts (the original response schema)."""
+    cols = _columns(pred_text, probs, index, pred_label)
+    keys = list(cols)
+    return [dict(zip(keys, row)) for row in zip(*cols.values())]
+
+
+def encode_columnar(pred_text, probs=None, index=None, pred_label=None):
+    """Dict of per-field arrays."""
+    cols = _columns(pred_text, probs, index, pred_label)
+    cols["layout"] = "columnar"
+    return cols
+
+
+def encode_predictions(layout, pred_text, probs=None, index=None, pred_label=None):
+    if layout == "columnar":
+        return encode_columnar(pred_text, probs, index, pred_label)
+    return encode_records(pred_text, probs, index, pred_label)
+
+
+def requested_layout(req, default="records"):
+    """Response layout from the `layout` query parameter."""
+    layout = (req.args.get("layout") or default).lower()
+    return layout if layout in LAYOUTS else default
+
+
+def _default(obj):
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def json_response(payload):
+    """Serialize payload with orjson (NumPy-aware) when available, else Flask's jsonify."""
+    if orjson is not None:
+        body = orjson.dumps(payload, default=_default,
+                            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+        return Response(body, mimetype="application/json")
+    try:
+        return jsonify(payload)
+    except TypeError:
+        return Response(json.dumps(payload, default=_default), mimetype="application/json")
@@ -0,0 +1,155 @@
+"""
+Model features shared by training and serving.
+
+utils.make_features_and_labels (training) and /predict / predict_arrays
+(serving) both build their inputs here, so the two cannot drift apart. The
+functions work on plain float arrays. A "frame" is a DataFrame or any dict of
+equal-length arrays.
+
+- derive_features: wind shear and dewpoint depression, when the frame lacks them
+- feature_matrix:  the model's input matrix, in feature order
+- features_and_labels: training rows for one ERA5 series. It fills short gaps,
+  computes the instability proxy and applies the risk thresholds, all without
+  copying the frame.
+- iter_features_and_labels: walks a multi-year, multi-location history one
+  location (or one input frame) at a time. Memory is then bounded by the
+  longest single series rather than by the whole history.
+
+FEATURE_DTYPE is the float precision of extracted arrays and model inputs for
+the API and the MOSDAC scripts alike.
+"""
+import os
+
+import numpy as np
+
+# Feature precision: float32 halves memory/bandwidth on large grids (the forest works in float32 internally)
+FEATURE_DTYPE = np.dtype(os.getenv("FEATURE_DTYPE", "float64"))
+# Model inputs, in training order
+FEATURES = ["wind_speed_10m", "wind_speed_100m", "wind_shear", "relative_humidity_2m", "cloud_cover",
+            "surface_pressure", "dewpt_dep"]
+# ERA5 hourly variables used for training (see utils.fetch_era5_hourly)
+RAW_VARIABLES = ["temperature_2m", "dewpoint_2m", "surface_pressure", "wind_speed_10m", "wind_speed_100m",
+                 "relative_humidity_2m", "cloud_cover"]
+LOCATION_COLUMNS = ("lat", "lon")
+LABELS = ["Low", "Moderate", "Severe"]
+# instability thresholds: (-999, 10] Low, (10, 25] Moderate, (25, 999] Severe; anything else is unlabelled
+LABEL_EDGES = np.array([-999.0, 10.0, 25.0, 999.0])
+INTERP_LIMIT = 3   # longest run of missing hours filled by interpolation
+
+
+def as_float(values, dtype=np.float64):
+    return np.asarray(values, dtype=dtype)
+
+
+def n_rows(frame):
+    if hasattr(frame, "shape"):
+        return frame.shape[0]
+    return len(next(iter(frame.values()))) if len(frame) else 0
+
+
+def interpolate_gaps(values, limit=INTERP_LIMIT):
+    """
+    Linear interpolation of NaN runs, filling at most `limit` values after each
+    valid one. After the last valid value, that value is carried forward; before
+    the first, values stay NaN. This matches pandas' Series.interpolate(limit=limit).
+    """
+    v = np.asarray(values, dtype=np.float64)
+    missing = np.isnan(v)
+    if not missing.any() or missing.all():
+        return v
+    v = v.copy()
+    idx = np.arange(v.size)
+    last_valid = np.maximum.accumulate(np.where(missing, -1, idx))
+    fill = missing & (last_valid >= 0) & (idx - last_valid <= limit)
+    valid = np.flatnonzero(~missing)
+    v[fill] = np.interp(idx[fill], valid, v[valid])
+    return v
+
+
+def derive_features(frame):
+    """Derived inputs missing from `frame`: {name: float array}."""
+    out = {}
+    if "wind_shear" not in frame and "wind_speed_100m" in frame and "wind_speed_10m" in frame:
+        out["wind_shear"] = np.abs(as_float(frame["wind_speed_100m"]) - as_float(frame["wind_speed_10m"]))
+    if "dewpt_dep" not in frame and "temperature_2m" in frame and "dewpoint_2m" in frame:
+        out["dewpt_dep"] = as_float(frame["temperature_2m"]) - as_float(frame["dewpoint_2m"])
+    return out
+
+
+def feature_matrix(frame, names=FEATURES, dtype=np.float64, fill=0.0):
+    """
+    (rows, len(names)) input matrix in `names` order. Columns come from `frame`;
+    derived features are computed when missing; any other missing column is `fill`.
+    """
+    derived = derive_features(frame)
+    X = np.empty((n_rows(frame), len(names)), dtype=dtype)
+    for j, name in enumerate(names):
+        if name in frame:
+            X[:, j] = as_float(frame[name])
+        elif name in derived:
+            X[:, j] = derived[name]
+        else:
+            X[:, j] = fill
+    return X
+
+
+def instability(frame):
+    """Instability proxy the labels are thresholded on."""
+    shear = frame["wind_shear"] if "wind_shear" in frame else derive_features(frame)["wind_shear"]
+    return (0.5 * as_float(shear) + 0.3 * (100 - as_float(frame["relative_humidity_2m"]))
+            + 0.2 * as_float(frame["cloud_cover"]))
+
+
+def label_codes(values):
+    """Index into LABELS per value (int8), -1 outside the thresholds or NaN."""
+    codes = np.searchsorted(LABEL_EDGES, values, side="left") - 1
+    return np.where((codes >= 0) & (codes < len(LABELS)), codes, -1).astype(np.int8)
+
+
+def features_and_labels(frame, dtype=np.float64, limit=INTERP_LIMIT):
+    """
+    Training rows for one continuous hourly series. Gaps of up to `limit` hours
+    are interpolated, and rows still missing an input (or outside the label
+    thresholds) are dropped. Inputs are only copied where values change. Returns
+    (X, codes, positions): X in FEATURES order, label codes into LABELS, and the
+    row positions in `frame` that X and codes came from.
+    """
+    cols = {c: interpolate_gaps(frame[c], limit) for c in RAW_VARIABLES}
+    cols.update(derive_features(cols))
+    codes = label_codes(instability(cols))
+    keep = codes >= 0
+    for c in RAW_VARIABLES:
+        keep &= ~np.isnan(cols[c])
+    if keep.all():
+        return feature_matrix(cols, FEATURES, dtype), codes, np.arange(keep.size)
+    positions = np.flatnonzero(keep)
+    return feature_matrix({c: v[positions] for c, v in cols.items()}, FEATURES, dtype), codes[positions], positions
+
+
+def location_slices(frame):
+    """Slices of consecutive rows with the same lat/lon (the whole frame when it has no location columns)."""
+    n = n_rows(frame)
+    if n == 0 or not all(c in frame for c in LOCATION_COLUMNS):
+        return [slice(0, n)]
+    change = np.zeros(n, dtype=bool)
+    change[0] = True
+    for c in LOCATION_COLUMNS:
+        v = as_float(frame[c])
+        change[1:] |= v[1:] != v[:-1]
+    starts = np.flatnonzero(change)
+    return [slice(a, b) for a, b in zip(starts, np.append(starts[1:], n))]
+
+
+def iter_features_and_labels(frames, dtype=np.float64, limit=INTERP_LIMIT):
+    """
+    features_and_labels over an iterable of frames (e.g. one per fetched
+    location/period, or CSV chunks split on series boundaries). Each frame is
+    further split into its per-location series. Yields (frame_number, X, codes,
+    positions), with positions relative to that frame.
+    """
+    for k, frame in enumerate(frames):
+        # float64 DataFrame columns convert without a copy; per-location parts are slices of them
+        cols = {c: as_float(frame[c]) for c in RAW_VARIABLES}
+        for sl in location_slices(frame):
+            X, codes, positions = features_and_labels({c: v[sl] for c, v in cols.items()}, dtype, limit)
+            yield k, X, codes, positions + sl.start
@@ -0,0 +1,230 @@
+"""
+Geolocation cache for MOSDAC L2B products.
+
+INSAT-3D/3DR are geostationary, so the Latitude/Longitude datasets of a product
+are identical across timesteps. The cache stores, per product type and grid
+shape, the flattened lat/lon, the index of valid (non-fill) pixels and the
+integer lat/lon bins as .npy files under GEO_CACHE_DIR. Later files memory-map
+those arrays and only need their science datasets read from HDF5.
+
+Before a cached grid is reused, a sample of the file's geolocation is checked
+against it: the first, middle and last rows of both Latitude and Longitude.
+The grid is rebuilt if they differ. Products whose type cannot be parsed from
+the file name are keyed by grid shape and that sample, so unrelated unknown
+grids do not share an entry.
+
+Each build is written to a new version directory, GEO_CACHE_DIR/<key>/<version>/.
+A `current` pointer file is then swapped atomically to name it. Files that
+other processes may have memory-mapped are never rewritten in place. Old
+versions are unlinked, and open mappings of them stay valid.
+"""
+import os
+import re
+import json
+import uuid
+import shutil
+import hashlib
+import logging
+import threading
+from datetime import datetime
+
+import numpy as np
+
+logger = logging.getLogger("turbulence-api")
+
+FILL_VALUE = 32767  # lat/lon fill value in MOSDAC L2B products
+GEO_CACHE_DIR = os.getenv("GEO_CACHE_DIR", "geo_cache")
+
+# e.g. 3DIMG_18JUN2024_0000_L2B_CTP_V01R00.h5
+FILENAME_RE = re.compile(
+    r"^(?P<satellite>[0-9A-Z]+)_(?P<date>\d{2}[A-Z]{3}\d{4})_(?P<time>\d{4})_"
+    r"(?P<level>L[0-9A-Z]+)_(?P<product>[0-9A-Z]+)_(?P<version>V\d+R\d+)\.h5$"
+)
+
+
+def parse_product_name(path):
+    """Return satellite/timestep/product parsed from a MOSDAC file name, or None."""
+    m = FILENAME_RE.match(os.path.basename(path))
+    if not m:
+        return None
+    ts = datetime.strptime(m.group("date").title() + m.group("time"), "%d%b%Y%H%M")
+    return {"satellite": m.group("satellite"), "timestep": ts, "product": m.group("product")}
+
+
+def product_type(path):
+    """Product code from the file name (e.g. 'CTP'), or 'unknown'."""
+    info = parse_product_name(path or "")
+    return info["product"] if info else "unknown"
+
+
+def geo_datasets(f):
+    """(lat_ds, lon_ds) of an open HDF5 file, preferring Latitude/Longitude over CSBT_*."""
+    lat_ds = f.get("Latitude") or f.get("CSBT_Latitude")
+    lon_ds = f.get("Longitude") or f.get("CSBT_Longitude")
+    return lat_ds, lon_ds
+
+
+def valid_mask(lat, lon):
+    return (lat != FILL_VALUE) & ~np.isnan(lat) & ~np.isnan(lon)
+
+
+def fingerprint(lat, lon):
+    """Cheap grid identity: hash of a strided sample of the coordinates."""
+    step = max(1, lat.size // 4096)
+    h = hashlib.sha1()
+    h.update(np.ascontiguousarray(lat[::step], dtype=np.float32).tobytes())
+    h.update(np.ascontiguousarray(lon[::step], dtype=np.float32).tobytes())
+    return h.hexdigest()[:12]
+
+
+def sample_rows(ds):
+    """First, middle and last grid rows of a geolocation dataset (first/last 1024 values if 1-D)."""
+    shape = ds.shape
+    if len(shape) < 2:
+        n = min(1024, shape[0])
+        return [np.asarray(ds[:n]), np.asarray(ds[shape[0] - n:])]
+    return [np.asarray(ds[..., row, :]) for row in sorted({0, shape[-2] // 2, shape[-2] - 1})]
+
+
+def sample_fingerprint(lat_ds, lon_ds):
+    """Grid identity from sample_rows of both Latitude and Longitude, read without loading the grid."""
+    h = hashlib.sha1(str(tuple(lat_ds.shape)).encode())
+    for ds in (lat_ds, lon_ds):
+        for row in sample_rows(ds):
+            h.update(np.ascontiguousarray(row, dtype=np.float64).tobytes())
+    return h.hexdigest()[:12]
+
+
+class GeoGrid:
+    """Flattened geolocation of one product grid plus its valid-pixel index and bins."""
+
+    def __init__(self, key, shape, lat, lon, valid_idx, lat_bin, lon_bin, fp, sample_fp=None):
+        self.key = key
+        self.shape = tuple(shape)
+        self.lat = lat
+        self.lon = lon
+        self.valid_idx = valid_idx
+        self.lat_bin = lat_bin
+        self.lon_bin = lon_bin
+        self.fingerprint = fp
+        self.sample_fp = sample_fp
+
+    @property
+    def size(self):
+        return self.lat.size
+
+    @property
+    def n_valid(self):
+        return self.valid_idx.size
+
+    def valid(self, arr, dtype=None):
+        """Flatten a per-pixel array (or HDF5 dataset) and keep the valid pixels."""
+        return np.asarray(arr, dtype=dtype).ravel()[self.valid_idx]
+
+
+class GeoCache:
+    """Per-process cache of GeoGrids, persisted as memory-mapped .npy files."""
+
+    FILES = ("lat", "lon", "valid_idx", "lat_bin", "lon_bin")
+
+    def __init__(self, cache_dir=GEO_CACHE_DIR, verify=True):
+        self.cache_dir = cache_dir
+        self.verify = verify
+        self._grids = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key_for(product, shape, sample_fp=None):
+        """Cache key: product and shape; unknown products also carry the sample fingerprint."""
+        key = f"{product}_{'x'.join(str(d) for d in shape)}"
+        return f"{key}_{sample_fp}" if product == "unknown" and sample_fp else key
+
+    def get(self, f, product="unknown"):
+        """GeoGrid for an open HDF5 file, or None if it has no geolocation."""
+        lat_ds, lon_ds = geo_datasets(f)
+        if lat_ds is None or lon_ds is None:
+            return None
+        sample_fp = sample_fingerprint(lat_ds, lon_ds) if self.verify or product == "unknown" else None
+        key = self.key_for(product, lat_ds.shape, sample_fp)
+        with self._lock:
+            grid = self._grids.get(key) or self._load(key)
+            if grid is not None and sample_fp is not None and grid.sample_fp != sample_fp:
+                logger.warning(f"Geolocation changed for {key}; rebuilding cache")
+                grid = None
+            if grid is None:
+                grid = self._build(key, lat_ds, lon_ds, sample_fp)
+            self._grids[key] = grid
+        return grid
+
+    def _dir(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def _load(self, key):
+        d = self._dir(key)
+        try:
+            with open(os.path.join(d, "current")) as fh:
+                version = fh.read().strip()
+        except FileNotFoundError:
+            return None
+        vdir = os.path.join(d, version)
+        try:
+            with open(os.path.join(vdir, "meta.json")) as fh:
+                meta = json.load(fh)
+            arrays = {name: np.load(os.path.join(vdir, f"{name}.npy"), mmap_mode="r") for name in self.FILES}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable geo cache {vdir}: {e}")
+            return None
+        return GeoGrid(key, meta["shape"], fp=meta["fingerprint"], sample_fp=meta.get("sample_fingerprint"),
+                       **arrays)
+
+    def _build(self, key, lat_ds, lon_ds, sample_fp=None):
+        lat = np.asarray(lat_ds).ravel()
+        lon = np.asarray(lon_ds).ravel()
+        valid_idx = np.flatnonzero(valid_mask(lat, lon)).astype(np.int64)
+        # int(lat) truncation, as ensure_bins does in the API
+        lat_bin = np.trunc(lat[valid_idx]).astype(np.int16)
+        lon_bin = np.trunc(lon[valid_idx]).astype(np.int16)
+        fp = fingerprint(lat, lon)
+        sample_fp = sample_fp or sample_fingerprint(lat_ds, lon_ds)
+        arrays = {"lat": lat, "lon": lon, "valid_idx": valid_idx, "lat_bin": lat_bin, "lon_bin": lon_bin}
+        d = self._dir(key)
+        version = f"{sample_fp}-{uuid.uuid4().hex[:8]}"
+        try:
+            # a fresh directory nobody has mapped yet, published by swapping the pointer
+            os.makedirs(os.path.join(d, version))
+            for name, arr in arrays.items():
+                np.save(os.path.join(d, version, f"{name}.npy"), arr)
+            with open(os.path.join(d, version, "meta.json"), "w") as fh:
+                json.dump({"shape": list(lat_ds.shape), "fingerprint": fp, "sample_fingerprint": sample_fp,
+                           "n_valid": int(valid_idx.size)}, fh)
+            tmp = os.path.join(d, f".current-{uuid.uuid4().hex}")
+            with open(tmp, "w") as fh:
+                fh.write(version)
+            os.replace(tmp, os.path.join(d, "current"))
+            self._prune(d, version)
+            logger.info(f"Cached geolocation {key}: {valid_idx.size}/{lat.size} valid pixels -> {d}/{version}")
+            loaded = self._load(key)
+            if loaded is not None:
+                return loaded
+        except OSError as e:
+            logger.warning(f"Could not persist geo cache {d}: {e}")
+        return GeoGrid(key, lat_ds.shape, fp=fp, sample_fp=sample_fp, **arrays)
+
+    @staticmethod
+    def _prune(d, keep):
+        """
+        Remove superseded versions (and files of the old flat layout); mappings of them
+        stay valid. Versions without meta.json may still be written by another process.
+        """
+        for name in os.listdir(d):
+            path = os.path.join(d, name)
+            if name in (keep, "current") or name.startswith("."):
+                continue
+            if os.path.isdir(path):
+                if os.path.exists(os.path.join(path, "meta.json")):
+                    shutil.rmtree(path, ignore_errors=True)
+            else:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
@@ -0,0 +1,337 @@
+"""
+Append-only columnar log of served predictions, with hourly rollups.
+
+Layout under HISTORY_DIR:
+  active/<column>.bin   raw little-endian columns, appended per request
+  segments/*.npz        compacted, time-sorted immutable segments
+  rollup.npz            counts per (hour, lat_bin, lon_bin) x label
+  meta.json             labels, model versions, segment list, active rows already compacted
+
+Columns (12 bytes/row): ts uint32 (epoch seconds), lat_bin/lon_bin int16 (NO_BIN when
+the row had no position), label uint8 (index into meta "labels"), prob float16
+(max class probability), version uint8 (index into meta "versions").
+
+Compaction moves the active rows into a segment and folds them into the
+rollup. Queries read the rollup plus the (bounded) active rows, never the
+segments. Writers from several API processes serialize on an flock, and
+queries take it while they read so they never see rows half moved.
+"""
+import os
+import json
+import time
+import fcntl
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import numpy as np
+
+logger = logging.getLogger("turbulence-api")
+
+HISTORY_DIR = os.getenv("HISTORY_DIR", "prediction_history")
+COMPACT_ROWS = int(os.getenv("HISTORY_COMPACT_ROWS", 2_000_000))
+NO_BIN = np.iinfo(np.int16).min
+COLUMNS = {
+    "ts": np.uint32,
+    "lat_bin": np.int16,
+    "lon_bin": np.int16,
+    "label": np.uint8,
+    "prob": np.float16,
+    "version": np.uint8,
+}
+GROUP_BY = ("hour", "cell", "total")
+
+
+def to_epoch_seconds(ts):
+    """datetime (naive = UTC), ISO string or number -> epoch seconds."""
+    if ts is None:
+        return time.time()
+    if isinstance(ts, (int, float, np.integer, np.floating)):
+        return float(ts)
+    if isinstance(ts, str):
+        ts = datetime.fromisoformat(ts.replace("Z", "+00:00"))
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return ts.timestamp()
+
+
+def _bins(values, n):
+    if values is None:
+        return np.full(n, NO_BIN, dtype=np.int16)
+    arr = np.asarray(values, dtype=np.float64)
+    return np.where(np.isnan(arr), NO_BIN, np.trunc(arr)).astype(np.int16)
+
+
+def _keys(ts, lat_bin, lon_bin):
+    hour = np.asarray(ts, dtype=np.int64) // 3600
+    return (hour << 32) | ((lat_bin.astype(np.int64) + 32768) << 16) | (lon_bin.astype(np.int64) + 32768)
+
+
+def _split_keys(keys):
+    hour = keys >> 32
+    lat_bin = ((keys >> 16) & 0xFFFF) - 32768
+    lon_bin = (keys & 0xFFFF) - 32768
+    return hour, lat_bin, lon_bin
+
+
+def rollup(keys, labels, n_labels):
+    """Group rows by key -> (unique keys, counts[n_keys, n_labels])."""
+    uniq, inv = np.unique(keys, return_inverse=True)
+    counts = np.bincount(inv * n_labels + labels, minlength=uniq.size * n_labels)
+    return uniq, counts.reshape(uniq.size, n_labels).astype(np.uint32)
+
+
+def merge_rollups(keys_a, counts_a, keys_b, counts_b):
+    n_labels = max(counts_a.shape[1], counts_b.shape[1])
+    pad = lambda c: np.pad(c, ((0, 0), (0, n_labels - c.shape[1])))
+    keys = np.concatenate([keys_a, keys_b])
+    counts = np.vstack([pad(counts_a), pad(counts_b)]).astype(np.uint64)
+    uniq, inv = np.unique(keys, return_inverse=True)
+    merged = np.zeros((uniq.size, n_labels), dtype=np.uint64)
+    np.add.at(merged, inv, counts)
+    return uniq, merged.astype(np.uint32)
+
+
+class PredictionHistory:
+    def __init__(self, root=HISTORY_DIR, compact_rows=COMPACT_ROWS):
+        self.root = root
+        self.compact_rows = compact_rows
+        self.active_dir = os.path.join(root, "active")
+        self.segment_dir = os.path.join(root, "segments")
+        os.makedirs(self.active_dir, exist_ok=True)
+        os.makedirs(self.segment_dir, exist_ok=True)
+        self._thread_lock = threading.Lock()
+        self._compacting = threading.Event()
+
+    # --- storage helpers -------------------------------------------------
+
+    @contextmanager
+    def _locked(self):
+        """Exclusive lock across threads and processes."""
+        with self._thread_lock, open(os.path.join(self.root, ".lock"), "a") as fh:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fh, fcntl.LOCK_UN)
+
+    def _meta_path(self):
+        return os.path.join(self.root, "meta.json")
+
+    def _read_meta(self):
+        try:
+            with open(self._meta_path()) as fh:
+                return json.load(fh)
+        except (OSError, ValueError):
+            return {"labels": [], "versions": [], "segments": [], "compacted_rows": 0}
+
+    def _write_meta(self, meta):
+        tmp = self._meta_path() + ".tmp"
+        with open(tmp, "w") as fh:
+            json.dump(meta, fh, indent=1)
+        os.replace(tmp, self._meta_path())
+
+    def _column_path(self, name):
+        return os.path.join(self.active_dir, f"{name}.bin")
+
+    def _active_rows(self):
+        """Rows present in every column (a crash mid-append can leave columns uneven)."""
+        rows = []
+        for name, dtype in COLUMNS.items():
+            try:
+                rows.append(os.path.getsize(self._column_path(name)) // np.dtype(dtype).itemsize)
+            except OSError:
+                rows.append(0)
+        return min(rows)
+
+    def _repair(self, meta):
+        """Trim uneven columns and reset a stale compaction marker. Caller holds the lock."""
+        n = self._active_rows()
+        for name, dtype in COLUMNS.items():
+            path = self._column_path(name)
+            if os.path.exists(path) and os.path.getsize(path) != n * np.dtype(dtype).itemsize:
+                os.truncate(path, n * np.dtype(dtype).itemsize)
+        if meta.get("compacted_rows", 0) > n:
+            meta["compacted_rows"] = 0  # active files were truncated after the last compaction
+            self._write_meta(meta)
+        return n
+
+    def _read_active(self, meta):
+        n = self._active_rows()
+        skip = meta.get("compacted_rows", 0) if meta.get("compacted_rows", 0) <= n else 0
+        cols = {}
+        for name, dtype in COLUMNS.items():
+            path = self._column_path(name)
+            arr = np.fromfile(path, dtype=dtype, count=n) if os.path.exists(path) else np.empty(0, dtype)
+            cols[name] = arr[skip:n]
+        return cols
+
+    def _read_rollup(self, meta):
+        name = meta.get("rollup")
+        if not name:
+            return np.empty(0, np.int64), np.zeros((0, max(1, len(meta["labels"]))), np.uint32)
+        with np.load(os.path.join(self.root, name)) as npz:
+            return npz["keys"], npz["counts"]
+
+    # --- writing ---------------------------------------------------------
+
+    def append(self, codes, class_texts, proba_max=None, lat_bin=None, lon_bin=None, ts=None, version="unknown"):
+        """
+        Log one batch of predictions. codes index into class_texts; lat_bin/lon_bin
+        are per-row (NaN -> no position); ts is one timestamp for the batch.
+        Returns the number of rows written.
+        """
+        codes = np.asarray(codes)
+        n = codes.size
+        if n == 0:
+            return 0
+        with self._locked():
+            meta = self._read_meta()
+            self._repair(meta)
+            labels, versions = meta["labels"], meta["versions"]
+            known = (len(labels), len(versions))
+            label_ids = []
+            for text in class_texts:
+                if str(text) not in labels:
+                    labels.append(str(text))
+                label_ids.append(labels.index(str(text)))
+            if version not in versions:
+                versions.append(version)
+            if len(labels) > 256 or len(versions) > 256:
+                raise ValueError("prediction history supports at most 256 labels and model versions")
+            if (len(labels), len(versions)) != known:
+                self._write_meta(meta)  # only new labels / versions change meta on the append path
+
+            cols = {
+                "ts": np.full(n, int(to_epoch_seconds(ts)), dtype=np.uint32),
+                "lat_bin": _bins(lat_bin, n),
+                "lon_bin": _bins(lon_bin, n),
+                "label": np.asarray(label_ids, dtype=np.uint8)[codes],
+                "prob": (np.asarray(proba_max, dtype=np.float16) if proba_max is not None
+                         else np.full(n, np.nan, dtype=np.float16)),
+                "version": np.full(n, versions.index(version), dtype=np.uint8),
+            }
+            for name, dtype in COLUMNS.items():
+                with open(self._column_path(name), "ab") as fh:
+                    fh.write(np.ascontiguousarray(cols[name], dtype=dtype).tobytes())
+            pending = self._active_rows() - meta.get("compacted_rows", 0)
+        if pending >= self.compact_rows and not self._compacting.is_set():
+            self._compacting.set()
+            threading.Thread(target=self._compact_in_background, daemon=True).start()
+        return n
+
+    def _compact_in_background(self):
+        try:
+            self.compact()
+        except Exception:
+            logger.exception("Prediction history compaction failed")
+        finally:
+            self._compacting.clear()
+
+    def compact(self):
+        """Move the active rows into a time-sorted segment and fold them into the rollup."""
+        with self._locked():
+            meta = self._read_meta()
+            total = self._repair(meta)
+            cols = self._read_active(meta)
+            n = cols["ts"].size
+            if n == 0:
+                return 0
+            order = np.argsort(cols["ts"], kind="stable")
+            cols = {k: v[order] for k, v in cols.items()}
+            name = f"seg_{int(cols['ts'][0])}_{int(cols['ts'][-1])}_{n}.npz"
+            tmp = os.path.join(self.segment_dir, "tmp_" + name)
+            np.savez_compressed(tmp, **cols)
+            os.replace(tmp, os.path.join(self.segment_dir, name))
+
+            keys, counts = rollup(_keys(cols["ts"], cols["lat_bin"], cols["lon_bin"]),
+                                  cols["label"].astype(np.int64), max(1, len(meta["labels"])))
+            old_keys, old_counts = self._read_rollup(meta)
+            keys, counts = merge_rollups(old_keys, old_counts, keys, counts)
+            rollup_name = f"rollup_{len(meta['segments']) + 1}.npz"
+            tmp = os.path.join(self.root, "tmp_" + rollup_name)
+            np.savez(tmp, keys=keys, counts=counts)
+            os.replace(tmp, os.path.join(self.root, rollup_name))
+
+            # meta first (rows up to `total` are compacted), then truncate the active columns
+            old_rollup = meta.get("rollup")
+            meta.update(rollup=rollup_name, segments=meta["segments"] + [name], compacted_rows=total)
+            self._write_meta(meta)
+            for col in COLUMNS:
+                path = self._column_path(col)
+                if os.path.exists(path):
+                    os.truncate(path, 0)
+            meta["compacted_rows"] = 0
+            self._write_meta(meta)
+            if old_rollup and old_rollup != rollup_name:
+                try:
+                    os.remove(os.path.join(self.root, old_rollup))
+                except OSError:
+                    pass
+        logger.info(f"Compacted {n} prediction rows into {name}")
+        return n
+
+    # --- queries ---------------------------------------------------------
+
+    def aggregate(self, start=None, end=None, region=None, group_by="hour"):
+        """
+        Label counts from the rollup plus the active rows, filtered to [start, end)
+        at hour resolution and to region (lat_min, lat_max, lon_min, lon_max on the
+        integer bins). Returns (labels, group keys dict of arrays, counts[n_groups, n_labels]).
+        """
+        if group_by not in GROUP_BY:
+            raise ValueError(f"group_by must be one of {GROUP_BY}")
+        # one consistent snapshot: compaction moves rows from active into the rollup under the lock
+        with self._locked():
+            meta = self._read_meta()
+            keys, counts = self._read_rollup(meta)
+            active = self._read_active(meta)
+        if active["ts"].size:
+            a_keys, a_counts = rollup(_keys(active["ts"], active["lat_bin"], active["lon_bin"]),
+                                      active["label"].astype(np.int64), max(1, len(meta["labels"])))
+            keys, counts = merge_rollups(keys, counts, a_keys, a_counts)
+        labels = meta["labels"]
+        counts = np.pad(counts, ((0, 0), (0, max(0, len(labels) - counts.shape[1]))))[:, :len(labels)]
+
+        hour, lat_bin, lon_bin = _split_keys(keys)
+        mask = np.ones(keys.size, dtype=bool)
+        if start is not None:
+            mask &= hour >= int(to_epoch_seconds(start)) // 3600
+        if end is not None:
+            mask &= hour < -(-int(to_epoch_seconds(end)) // 3600)
+        if region is not None:
+            lat_min, lat_max, lon_min, lon_max = region
+            mask &= ((lat_bin != NO_BIN) & (lat_bin >= lat_min) & (lat_bin <= lat_max) &
+                     (lon_bin >= lon_min) & (lon_bin <= lon_max))
+        hour, lat_bin, lon_bin, counts = hour[mask], lat_bin[mask], lon_bin[mask], counts[mask]
+
+        if group_by == "total":
+            return labels, {}, counts.sum(axis=0, keepdims=True)
+        if group_by == "hour":
+            group_keys = hour
+        else:
+            group_keys = ((lat_bin + 32768) << 16) | (lon_bin + 32768)
+        uniq, inv = np.unique(group_keys, return_inverse=True)
+        grouped = np.zeros((uniq.size, len(labels)), dtype=np.uint64)
+        np.add.at(grouped, inv, counts)
+        if group_by == "hour":
+            return labels, {"hour": uniq}, grouped
+        return labels, {"lat_bin": (uniq >> 16) - 32768, "lon_bin": (uniq & 0xFFFF) - 32768}, grouped
+
+    def stats(self):
+        meta = self._read_meta()
+        return {
+            "active_rows": self._active_rows() - meta.get("compacted_rows", 0),
+            "segments": len(meta["segments"]),
+            "labels": meta["labels"],
+            "versions": meta["versions"],
+        }
+
+
+if __name__ == "__main__":
+    import sys
+    history = PredictionHistory()
+    if len(sys.argv) > 1 and sys.argv[1] == "compact":
+        print("Compacted rows:", history.compact())
+    print(history.stats())
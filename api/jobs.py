@@ -0,0 +1,322 @@
+"""
+Background job queue for heavy endpoints.
+
+Jobs are stored in a SQLite database (JOB_DIR/jobs.sqlite3), so all API
+processes share one queue. Any process can accept a job, run it, or answer a
+poll. Uploaded files and raw request bodies of queued jobs are stored once
+under JOB_DIR/blobs, named by their SHA-256. A job is described by a JSON spec: path,
+method, query, form fields, and the hashes of its files or body.
+
+On cacheable endpoints, jobs with the same spec (and model) share a `job_key`.
+A finished job is returned for every later submission with that key, so
+re-uploading a file does not process it again. Files a job produces, such as
+per-pixel predictions, are written to JOB_DIR/results/<job id>/.
+
+Each process runs `workers` threads. A worker claims the oldest queued job
+inside an IMMEDIATE transaction and runs it through the runner callback,
+runner(spec, job_id) -> (http_status, json_payload). When a process starts its
+workers, jobs left 'running' by a process on this host that no longer exists
+go back to the queue.
+"""
+import os
+import json
+import time
+import uuid
+import shutil
+import socket
+import sqlite3
+import hashlib
+import logging
+import threading
+
+logger = logging.getLogger("turbulence-api")
+
+JOB_DIR = os.getenv("JOB_DIR", "job_store")
+JOB_TTL_SECONDS = float(os.getenv("JOB_TTL_HOURS", 7 * 24)) * 3600
+POLL_SECONDS = 1.0
+CLEANUP_EVERY_SECONDS = 600
+CHUNK_BYTES = 1 << 20
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id          TEXT PRIMARY KEY,
+    job_key     TEXT,
+    endpoint    TEXT NOT NULL,
+    spec        TEXT NOT NULL,
+    blobs       TEXT NOT NULL DEFAULT '',
+    status      TEXT NOT NULL,
+    created     REAL NOT NULL,
+    started     REAL,
+    finished    REAL,
+    worker      TEXT,
+    http_status INTEGER,
+    result      TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_by_key ON jobs (job_key, status);
+CREATE INDEX IF NOT EXISTS jobs_by_status ON jobs (status, created);
+"""
+
+
+def spec_blobs(spec):
+    """SHA-256 hashes of all blobs a job spec refers to."""
+    shas = [f["sha256"] for _, f in spec.get("files", [])]
+    if spec.get("body"):
+        shas.append(spec["body"]["sha256"])
+    return shas
+
+
+class JobStore:
+    def __init__(self, job_dir=JOB_DIR, workers=1, max_pending=8, ttl=JOB_TTL_SECONDS):
+        self.job_dir = job_dir
+        self.db_path = os.path.join(job_dir, "jobs.sqlite3")
+        self.blob_dir = os.path.join(job_dir, "blobs")
+        self.results_dir = os.path.join(job_dir, "results")
+        self.workers = max(1, workers)
+        self.max_pending = max_pending
+        self.ttl = ttl
+        os.makedirs(self.blob_dir, exist_ok=True)
+        os.makedirs(self.results_dir, exist_ok=True)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition()
+        self._runner = None
+        self._pid = None
+        self._last_cleanup = 0.0
+        self.worker_name = f"{socket.gethostname()}:{os.getpid()}"
+        with self._db() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(SCHEMA)
+
+    def _db(self):
+        """Per-thread connection in autocommit mode (transactions are explicit)."""
+        db = getattr(self._local, "db", None)
+        if db is None or self._local.pid != os.getpid():
+            db = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            db.row_factory = sqlite3.Row
+            self._local.db, self._local.pid = db, os.getpid()
+        return db
+
+    # --- blobs and result files ---
+
+    def hash_blob(self, stream):
+        """SHA-256 and size of a stream without storing it. Returns (sha256, size)."""
+        digest = hashlib.sha256()
+        size = 0
+        while True:
+            chunk = stream.read(CHUNK_BYTES)
+            if not chunk:
+                break
+            digest.update(chunk)
+            size += len(chunk)
+        return digest.hexdigest(), size
+
+    def store_blob(self, stream):
+        """Copy a stream into the blob store while hashing it. Returns (sha256, size)."""
+        digest = hashlib.sha256()
+        tmp = os.path.join(self.blob_dir, f".{uuid.uuid4().hex}.tmp")
+        size = 0
+        with open(tmp, "wb") as fh:
+            while True:
+                chunk = stream.read(CHUNK_BYTES)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                fh.write(chunk)
+                size += len(chunk)
+        sha = digest.hexdigest()
+        if os.path.exists(self.blob_path(sha)):
+            os.remove(tmp)
+            os.utime(self.blob_path(sha))
+        else:
+            os.replace(tmp, self.blob_path(sha))
+        return sha, size
+
+    def blob_path(self, sha):
+        return os.path.join(self.blob_dir, sha)
+
+    def result_dir(self, job_id):
+        """Directory for files produced by a job (created on demand)."""
+        path = os.path.join(self.results_dir, job_id)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def result_files(self, job_id):
+        try:
+            return sorted(os.listdir(os.path.join(self.results_dir, job_id)))
+        except OSError:
+            return []
+
+    # --- jobs ---
+
+    @staticmethod
+    def new_id():
+        return uuid.uuid4().hex
+
+    @staticmethod
+    def job_key(spec, salt=""):
+        """Content key of a job spec; `salt` carries anything else the result depends on (model version)."""
+        canonical = json.dumps({k: spec.get(k) for k in ("endpoint", "method", "query", "form", "files", "body")},
+                               sort_keys=True)
+        return hashlib.sha256(f"{salt}\n{canonical}".encode()).hexdigest()
+
+    def _job(self, row):
+        if row is None:
+            return None
+        job = {k: row[k] for k in ("id", "endpoint", "status", "created", "started", "finished", "http_status")}
+        job["result"] = json.loads(row["result"]) if row["result"] else None
+        job["files"] = self.result_files(row["id"])
+        return job
+
+    def get(self, job_id):
+        if not job_id or not all(c in "0123456789abcdef" for c in job_id):
+            return None
+        return self._job(self._db().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+
+    def find(self, job_key):
+        """Most recent job with this key that has not failed (queued, running or done), or None."""
+        if job_key is None:
+            return None
+        row = self._db().execute(
+            "SELECT * FROM jobs WHERE job_key = ? AND status != 'failed' ORDER BY created DESC LIMIT 1",
+            (job_key,)).fetchone()
+        return self._job(row)
+
+    @property
+    def pending(self):
+        return self._db().execute("SELECT COUNT(*) FROM jobs WHERE status IN ('queued', 'running')").fetchone()[0]
+
+    def _insert(self, job_id, job_key, spec, status, http_status=None, result=None):
+        now = time.time()
+        finished = now if status in ("done", "failed") else None
+        self._db().execute(
+            "INSERT INTO jobs (id, job_key, endpoint, spec, blobs, status, created, finished, http_status, result) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (job_id, job_key, spec["endpoint"], json.dumps(spec), " ".join(spec_blobs(spec)), status, now,
+             finished, http_status, json.dumps(result) if result is not None else None))
+
+    def submit(self, spec, job_key=None, job_id=None):
+        """
+        Queue a job for `spec` (its blobs must already be stored). Returns the job
+        dict, or None when too many jobs are pending.
+        """
+        self.maybe_cleanup()
+        if self.pending >= self.max_pending:
+            return None
+        job_id = job_id or self.new_id()
+        self._insert(job_id, job_key, spec, "queued")
+        self.ensure_workers()
+        with self._wakeup:
+            self._wakeup.notify()
+        return self.get(job_id)
+
+    def record(self, spec, job_key, job_id, http_status, payload):
+        """Store the result of a request that ran synchronously, so later submissions can reuse it."""
+        self.maybe_cleanup()
+        self._insert(job_id, job_key, spec, "done" if http_status < 400 else "failed", http_status, payload)
+
+    # --- workers ---
+
+    def start(self, runner):
+        """Set the job runner; worker threads start on first use (after any fork)."""
+        self._runner = runner
+
+    def ensure_workers(self):
+        """Start this process's worker threads once (e.g. in each gunicorn worker after fork)."""
+        if self._runner is None:
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self.worker_name = f"{socket.gethostname()}:{self._pid}"
+            self._requeue_orphans()
+            for i in range(self.workers):
+                threading.Thread(target=self._work, name=f"job-{i}", daemon=True).start()
+
+    def _requeue_orphans(self):
+        host = socket.gethostname()
+        rows = self._db().execute("SELECT id, worker FROM jobs WHERE status = 'running'").fetchall()
+        for row in rows:
+            w_host, _, w_pid = (row["worker"] or "").rpartition(":")
+            if w_host != host or not w_pid.isdigit() or int(w_pid) == os.getpid():
+                continue
+            try:
+                os.kill(int(w_pid), 0)
+            except ProcessLookupError:
+                logger.warning(f"Re-queueing job {row['id']} left by dead worker {row['worker']}")
+                self._db().execute("UPDATE jobs SET status = 'queued', started = NULL, worker = NULL "
+                                   "WHERE id = ? AND status = 'running'", (row["id"],))
+            except OSError:
+                pass
+
+    def _claim(self):
+        """Atomically move the oldest queued job to 'running'. Returns the row or None."""
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            row = db.execute("SELECT * FROM jobs WHERE status = 'queued' ORDER BY created LIMIT 1").fetchone()
+            if row is not None:
+                db.execute("UPDATE jobs SET status = 'running', started = ?, worker = ? WHERE id = ?",
+                           (time.time(), self.worker_name, row["id"]))
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+        return row
+
+    def _work(self):
+        while True:
+            try:
+                row = self._claim()
+            except sqlite3.Error:
+                logger.exception("Could not claim a job")
+                row = None
+            if row is None:
+                with self._wakeup:
+                    self._wakeup.wait(POLL_SECONDS)
+                continue
+            self._run(row)
+
+    def _run(self, row):
+        job_id = row["id"]
+        try:
+            status, payload = self._runner(json.loads(row["spec"]), job_id)
+        except Exception as e:
+            logger.exception(f"Job {job_id} failed")
+            status, payload = 500, {"error": str(e)}
+        if status >= 400:
+            shutil.rmtree(os.path.join(self.results_dir, job_id), ignore_errors=True)
+        self._db().execute("UPDATE jobs SET status = ?, finished = ?, http_status = ?, result = ? WHERE id = ?",
+                           ("done" if status < 400 else "failed", time.time(), status,
+                            json.dumps(payload) if payload is not None else None, job_id))
+
+    # --- retention ---
+
+    def maybe_cleanup(self):
+        now = time.time()
+        if now - self._last_cleanup >= CLEANUP_EVERY_SECONDS:
+            self._last_cleanup = now
+            try:
+                self.cleanup()
+            except (OSError, sqlite3.Error):
+                logger.exception("Job cleanup failed")
+
+    def cleanup(self):
+        """Drop finished jobs older than the TTL with their result files, then unreferenced blobs."""
+        cutoff = time.time() - self.ttl
+        db = self._db()
+        expired = [r[0] for r in db.execute(
+            "SELECT id FROM jobs WHERE status IN ('done', 'failed') AND finished < ?", (cutoff,))]
+        for job_id in expired:
+            shutil.rmtree(os.path.join(self.results_dir, job_id), ignore_errors=True)
+        db.execute("DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished < ?", (cutoff,))
+
+        referenced = set()
+        for (blobs,) in db.execute("SELECT blobs FROM jobs"):
+            referenced.update(blobs.split())
+        for entry in os.scandir(self.blob_dir):
+            try:
+                if entry.name not in referenced and entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+            except OSError:
+                pass
@@ -0,0 +1,91 @@
+"""
+Build-time preparation of the model artifacts for the API image.
+
+`python -m api.model_store compile <src_dir> <out_dir>` loads every .joblib
+artifact with the libraries installed in the image and scores a dummy row with
+each estimator. A model that does not unpickle or predict under the pinned
+versions therefore fails the build instead of the first request. The step then
+writes each artifact back uncompressed, with the highest pickle protocol, so
+the API loads it without decompression or version conversion. Other files are
+copied unchanged, and a manifest records the library versions and hashes.
+
+Memory-mapping (joblib mmap_mode) was measured and is not used: scikit-learn
+copies the tree arrays into its own buffers on unpickle, so a mapped file
+loads more slowly and saves no memory. Workers share the model through
+gunicorn --preload instead (see gunicorn.conf.py).
+"""
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import sys
+import time
+
+import joblib
+import numpy as np
+
+
+def sha256(path):
+    with open(path, "rb") as fh:
+        return hashlib.sha256(fh.read()).hexdigest()
+
+
+def check_estimator(obj):
+    """Score one dummy row with obj (when it predicts or transforms) so incompatibilities surface now."""
+    n_features = getattr(obj, "n_features_in_", None)
+    if n_features is None:
+        return
+    X = np.zeros((1, n_features))
+    names = getattr(obj, "feature_names_in_", None)
+    if names is not None:
+        import pandas as pd
+        X = pd.DataFrame(X, columns=names)
+    if hasattr(obj, "predict"):
+        obj.predict(X)
+    elif hasattr(obj, "transform"):
+        obj.transform(X)
+
+
+def compile_artifacts(src_dir, out_dir):
+    """Validate and re-serialise src_dir/*.joblib into out_dir; returns the manifest."""
+    import sklearn
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = {"python": sys.version.split()[0], "numpy": np.__version__, "joblib": joblib.__version__,
+                "sklearn": sklearn.__version__, "artifacts": {}}
+    for name in sorted(os.listdir(src_dir)):
+        src = os.path.join(src_dir, name)
+        dst = os.path.join(out_dir, name)
+        if not os.path.isfile(src):
+            continue
+        if not name.endswith(".joblib"):
+            shutil.copyfile(src, dst)
+            continue
+        t0 = time.perf_counter()
+        obj = joblib.load(src)
+        check_estimator(obj)
+        joblib.dump(obj, dst, compress=0, protocol=pickle.HIGHEST_PROTOCOL)
+        t1 = time.perf_counter()
+        joblib.load(dst)
+        manifest["artifacts"][name] = {"source_sha256": sha256(src), "sha256": sha256(dst),
+                                       "bytes": os.path.getsize(dst), "compile_s": round(t1 - t0, 3),
+                                       "load_s": round(time.perf_counter() - t1, 3)}
+    with open(os.path.join(out_dir, "manifest.json"), "w") as fh:
+        json.dump(manifest, fh, indent=2)
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prepare model artifacts for the API image")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("compile", help="validate and re-serialise *.joblib artifacts")
+    p.add_argument("src_dir")
+    p.add_argument("out_dir")
+    args = parser.parse_args()
+    if args.command == "compile":
+        print(json.dumps(compile_artifacts(args.src_dir, args.out_dir), indent=2))
+
+
+if __name__ == "__main__":
+    main()
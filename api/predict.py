@@ -1,46 +1,284 @@
 # predict.py
 import sys
+import json
+import time
+import argparse
+import h5py
 import pandas as pd
 from joblib import load
 import numpy as np
 import os
+try:
+    from api.sharding import ShardedPredictor
+    from api.geocache import GeoCache, product_type
+    from api.features import FEATURES, derive_features, feature_matrix
+except ImportError:
+    from sharding import ShardedPredictor
+    from geocache import GeoCache, product_type
+    from features import FEATURES, derive_features, feature_matrix
 
 SCALER = "model_artifacts/scaler.joblib"
 MODEL  = "model_artifacts/rf_model.joblib"
+# max allowed |p32 - p64| per class probability when validating the float32 path.
+# Rounding can flip a split exactly at a threshold, so allow a few tree votes (300 trees -> 1/300 each).
+PRECISION_TOLERANCE = 0.02
+
+# Batch scoring of mosdac_data archives
+BATCH_CHUNK_ROWS = 500000               # rows scored per chunk (bounds memory)
+BATCH_PATTERNS = (".csv", ".csv.gz", ".h5")
+CHECKPOINT_NAME = "_checkpoint.json"
+GEO_CACHE = GeoCache()                  # lat/lon + valid-pixel index, read once per product grid
 
 def get_expected_features(scaler):
     # If scaler was fitted on a DataFrame, it often has feature_names_in_
     if hasattr(scaler, "feature_names_in_"):
         return list(scaler.feature_names_in_)
-    # fallback to common default (six features used earlier)
-    return ["wind_speed_10m","wind_speed_100m","wind_shear",
-            "relative_humidity_2m","cloud_cover","surface_pressure"]
+    # fallback to the training features (api/features.py)
+    return list(FEATURES)
 
-def predict_dataframe(df):
+def load_artifacts():
+    """Load (scaler, model, features) once for repeated scoring."""
     scaler = load(SCALER)
     model  = load(MODEL)
-    features = get_expected_features(scaler)
+    return scaler, model, get_expected_features(scaler)
+
+def predict_dataframe(df, dtype="float64", n_workers=None, artifacts=None, predictor=None):
+    """
+    Score df with the saved model. Pass `predictor` (a ShardedPredictor) to reuse
+    its worker pool across calls; otherwise a pool is created and shut down here.
+    """
+    scaler, model, features = artifacts or load_artifacts()
 
-    # ensure DataFrame contains all expected features
-    missing = [f for f in features if f not in df.columns]
+    # ensure DataFrame contains all expected features (wind_shear/dewpt_dep are derived like in training)
+    derived = derive_features(df)
+    missing = [f for f in features if f not in df.columns and f not in derived]
     if missing:
         raise ValueError(f"Input is missing required feature columns: {missing}")
 
-    X = df[features].values
-    Xs = scaler.transform(X)
-    preds = model.predict(Xs)
-    probs = model.predict_proba(Xs)
+    X = pd.DataFrame(feature_matrix(df, features, dtype), columns=features, index=df.index, copy=False)
+    # row blocks are scaled and scored on all cores
+    if predictor is not None:
+        preds, probs, _ = predictor.predict(X, scaler)
+    else:
+        with ShardedPredictor(model, n_workers=n_workers) as own:
+            preds, probs, _ = own.predict(X, scaler)
     return preds, probs, features
 
+def compare_precision(df, tolerance=PRECISION_TOLERANCE):
+    """
+    Score df with float64 and float32 features and report how far apart they are.
+    Returns a dict with label agreement and the max absolute probability difference.
+    """
+    artifacts = load_artifacts()
+    with ShardedPredictor(artifacts[1]) as predictor:
+        preds64, probs64, _ = predict_dataframe(df, dtype="float64", artifacts=artifacts, predictor=predictor)
+        preds32, probs32, _ = predict_dataframe(df, dtype="float32", artifacts=artifacts, predictor=predictor)
+    return precision_report(preds64, probs64, preds32, probs32, tolerance)
+
+def compare_precision_h5(path, tolerance=PRECISION_TOLERANCE, max_rows=BATCH_CHUNK_ROWS):
+    """
+    compare_precision for a raw L2B product: the first max_rows valid pixels are read
+    through the same path as batch scoring (GeoCache grid, CTP/CTT) once as float64 and
+    once as float32, so the reduced-precision read is checked too, not just the model.
+    """
+    artifacts = load_artifacts()
+    scaler, _, features = artifacts
+    with ShardedPredictor(artifacts[1]) as predictor:
+        scored = []
+        for dtype in ("float64", "float32"):
+            chunks, rows = [], 0
+            for chunk in iter_h5_chunks(path, max_rows, dtype=dtype):
+                chunks.append(chunk)
+                rows += len(chunk)
+                if rows >= max_rows:
+                    break
+            if not chunks:
+                return precision_report(*[np.empty(0)] * 4, tolerance)
+            df = pd.concat(chunks, ignore_index=True).head(max_rows)
+            preds, probs, _ = predictor.predict(mosdac_features(df, features).astype(dtype), scaler)
+            scored += [preds, probs]
+    return precision_report(*scored, tolerance)
+
+def precision_report(preds64, probs64, preds32, probs32, tolerance):
+    max_diff = float(np.abs(probs64 - probs32).max()) if len(preds64) else 0.0
+    return {
+        "rows": len(preds64),
+        "label_agreement": float((preds64 == preds32).mean()) if len(preds64) else 1.0,
+        "max_prob_diff": max_diff,
+        "within_tolerance": bool(max_diff <= tolerance),
+    }
+
+def mosdac_features(df, features):
+    """
+    Build the model feature frame for processed MOSDAC rows (lat, lon, CTP, CTT),
+    using the same mapping as /process-h5: cloud_cover from CTP, standard
+    surface pressure, and 0.0 for meteorological inputs the product lacks.
+    """
+    X = pd.DataFrame(index=df.index)
+    for f in features:
+        if f in df.columns:
+            X[f] = pd.to_numeric(df[f], errors="coerce")
+        elif f == "cloud_cover" and "CTP" in df.columns:
+            X[f] = pd.to_numeric(df["CTP"], errors="coerce").fillna(0) / 10  # dummy mapping
+        elif f == "surface_pressure":
+            X[f] = 1013.0
+        else:
+            X[f] = 0.0
+    return X
+
+def iter_csv_chunks(path, chunk_rows):
+    for chunk in pd.read_csv(path, chunksize=chunk_rows):
+        yield chunk
+
+def iter_h5_chunks(path, chunk_rows, dtype=None):
+    """
+    Yield lat/lon/CTP/CTT frames of the valid pixels of a raw L2B file, a block of grid
+    rows at a time; values are cast to `dtype` when given (default: as stored).
+    """
+    with h5py.File(path, "r") as f:
+        grid = GEO_CACHE.get(f, product_type(path))
+        if grid is None:
+            raise ValueError("No geospatial data found in H5")
+        ctp_ds, ctt_ds = f.get("CTP"), f.get("CTT")
+        shape = grid.shape
+        n_rows = shape[-2] if len(shape) >= 2 else shape[0]
+        row_width = shape[-1] if len(shape) >= 2 else 1
+        step = max(1, chunk_rows // row_width)
+        for start in range(0, n_rows, step):
+            stop = min(start + step, n_rows)
+            sl = np.s_[..., start:stop, :] if len(shape) >= 2 else np.s_[start:stop]
+            # valid pixels inside this block of rows (valid_idx is sorted, leading axes are singleton)
+            lo, hi = np.searchsorted(grid.valid_idx, [start * row_width, stop * row_width])
+            sel = grid.valid_idx[lo:hi]
+            local = sel - start * row_width
+            def read(ds):
+                if ds is None or ds.shape != shape:
+                    return np.full(sel.size, np.nan, dtype=dtype)
+                return np.asarray(ds[sl], dtype=dtype).ravel()[local]
+            yield pd.DataFrame({"lat": np.asarray(grid.lat[sel], dtype=dtype),
+                                "lon": np.asarray(grid.lon[sel], dtype=dtype),
+                                "CTP": read(ctp_ds), "CTT": read(ctt_ds)})
+
+def find_batch_inputs(root):
+    paths = []
+    for dirpath, _, files in os.walk(root):
+        for name in files:
+            if name.endswith(BATCH_PATTERNS):
+                paths.append(os.path.join(dirpath, name))
+    return sorted(paths)
+
+def load_checkpoint(path):
+    if os.path.exists(path):
+        with open(path) as fh:
+            return json.load(fh)
+    return {}
+
+def save_checkpoint(path, state):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as fh:
+        json.dump(state, fh, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+def score_file(path, out_path, artifacts, predictor, dtype="float64", chunk_rows=BATCH_CHUNK_ROWS):
+    """
+    Score one input in chunks and write compact predictions (lat, lon, pred code,
+    proba_max) to out_path as gzipped CSV. pred is the index into model.classes_.
+    Returns the number of rows scored.
+    """
+    scaler, model, features = artifacts
+    chunks = iter_h5_chunks(path, chunk_rows) if path.endswith(".h5") else iter_csv_chunks(path, chunk_rows)
+    tmp_path = out_path + ".partial"
+    rows = 0
+    written = False
+    for chunk in chunks:
+        if chunk.empty:
+            continue
+        X = mosdac_features(chunk, features).astype(dtype)
+        preds, probs, _ = predictor.predict(X, scaler)
+        out = pd.DataFrame({
+            "pred": np.searchsorted(model.classes_, preds).astype(np.uint8),
+            "proba_max": probs.max(axis=1).round(3).astype(np.float32),
+        })
+        for c in ("lat", "lon"):
+            if c in chunk.columns:
+                out.insert(0 if c == "lat" else 1, c, chunk[c].to_numpy())
+        # gzip members can be concatenated, so chunks are appended as they are scored
+        out.to_csv(tmp_path, index=False, compression="gzip", mode="ab" if written else "w", header=not written)
+        written = True
+        rows += len(out)
+    if not written:
+        pd.DataFrame(columns=["lat", "lon", "pred", "proba_max"]).to_csv(tmp_path, index=False, compression="gzip")
+    os.replace(tmp_path, out_path)
+    return rows
+
+def batch_score(in_dir, out_dir, dtype="float64", n_workers=None, chunk_rows=BATCH_CHUNK_ROWS):
+    """
+    Score every CSV/CSV.GZ/H5 under in_dir with one loaded model, writing
+    <out_dir>/<relative path>.pred.csv.gz. Finished files are recorded in a
+    checkpoint so an interrupted run resumes where it stopped.
+    """
+    artifacts = load_artifacts()
+    os.makedirs(out_dir, exist_ok=True)
+    ckpt_path = os.path.join(out_dir, CHECKPOINT_NAME)
+    state = load_checkpoint(ckpt_path)
+    print("Classes (pred codes):", {i: str(c) for i, c in enumerate(artifacts[1].classes_)})
+
+    total_rows, t_start = 0, time.perf_counter()
+    out_root = os.path.abspath(out_dir)
+    with ShardedPredictor(artifacts[1], n_workers=n_workers) as predictor:
+        for path in find_batch_inputs(in_dir):
+            if os.path.abspath(path).startswith(out_root + os.sep):
+                continue  # never re-score our own outputs
+            rel = os.path.relpath(path, in_dir)
+            st = os.stat(path)
+            done = state.get(rel)
+            if done and done.get("size") == st.st_size and done.get("mtime") == st.st_mtime:
+                print("SKIP (checkpoint):", rel)
+                continue
+            out_path = os.path.join(out_dir, rel + ".pred.csv.gz")
+            os.makedirs(os.path.dirname(out_path), exist_ok=True)
+            t0 = time.perf_counter()
+            try:
+                rows = score_file(path, out_path, artifacts, predictor, dtype=dtype, chunk_rows=chunk_rows)
+            except Exception as e:
+                print("ERROR scoring", rel, e)
+                continue
+            secs = time.perf_counter() - t0
+            total_rows += rows
+            state[rel] = {"size": st.st_size, "mtime": st.st_mtime, "rows": rows, "seconds": round(secs, 3)}
+            save_checkpoint(ckpt_path, state)
+            print(f"✔ {rel} → rows: {rows}  ({rows / secs if secs else 0:,.0f} rows/s)")
+    elapsed = time.perf_counter() - t_start
+    print(f"Scored {total_rows} rows in {elapsed:.1f}s ({total_rows / elapsed if elapsed else 0:,.0f} rows/s)")
+    return total_rows
+
 if __name__ == "__main__":
-    if len(sys.argv) == 2:
-        path = sys.argv[1]
+    parser = argparse.ArgumentParser(description="Score a CSV of features with the saved model")
+    parser.add_argument("path", nargs="?", help="CSV file to score, or .h5 with --check-precision (omit for a demo)")
+    parser.add_argument("--batch", metavar="DIR", help="Score every .csv/.csv.gz/.h5 under DIR (resumable)")
+    parser.add_argument("--out-dir", default="batch_predictions", help="Output directory for --batch")
+    parser.add_argument("--chunk-rows", type=int, default=BATCH_CHUNK_ROWS, help="Rows per chunk for --batch")
+    parser.add_argument("--dtype", choices=["float64", "float32"], default="float64", help="Feature precision")
+    parser.add_argument("--workers", type=int, default=None, help="Inference workers (default: all cores)")
+    parser.add_argument("--check-precision", action="store_true",
+                        help="Compare float32 against float64 predictions (for an .h5, including the read) "
+                             "and exit non-zero if outside tolerance")
+    args = parser.parse_args()
+
+    if args.batch:
+        batch_score(args.batch, args.out_dir, dtype=args.dtype, n_workers=args.workers, chunk_rows=args.chunk_rows)
+    elif args.path:
+        path = args.path
         if not os.path.exists(path):
             print(f"File not found: {path}")
             sys.exit(1)
+        if args.check_precision:
+            report = compare_precision_h5(path) if path.endswith(".h5") else compare_precision(pd.read_csv(path))
+            print("Precision check:", report)
+            sys.exit(0 if report["within_tolerance"] else 2)
         df = pd.read_csv(path)
-        preds, probs, features = predict_dataframe(df)
-        out = pd.DataFrame(df[features].reset_index(drop=True))
+        preds, probs, features = predict_dataframe(df, dtype=args.dtype, n_workers=args.workers)
+        out = pd.DataFrame(feature_matrix(df, features), columns=features)
         out["pred"] = preds
         out["proba_max"] = probs.max(axis=1)
         out.to_csv("predictions.csv", index=False)
@@ -59,5 +297,5 @@ if __name__ == "__main__":
         if "wind_shear" in demo_dict:
             demo_dict["wind_shear"] = abs(demo_dict["wind_speed_100m"] - demo_dict["wind_speed_10m"])
         demo = pd.DataFrame([demo_dict])
-        p, prob, features = predict_dataframe(demo)
+        p, prob, features = predict_dataframe(demo, dtype=args.dtype)
         print("Demo pred:", p[0], "prob:", prob[0].max())
@@ -0,0 +1,178 @@
+"""
+Opt-in profiling of individual API requests.
+
+A request is profiled only when it carries the admin token (PROFILE_TOKEN),
+either in the `X-Profile-Token` header or the `profile_token` query parameter.
+Two modes are supported:
+  - cprofile: deterministic cProfile stats saved as a .prof file
+    (open with snakeviz, or `flameprof file.prof > file.svg`)
+  - sample:   wall-clock stack sampling saved as folded stacks (.folded),
+    the input format of flamegraph.pl and speedscope
+
+cProfile only sees the thread that enabled it, and the request thread mostly
+waits while worker pools (sharded inference, multi-file /process-h5) do the
+work. Threads whose names start with one of `pool_prefixes` are therefore
+sampled as well. Their stacks are rooted at "<prefix> pool" and idle workers
+are skipped. In cprofile mode the pool samples go to a companion .folded file.
+Pools are shared by concurrent requests, so their samples can include other
+requests' work. Process pools cannot be sampled.
+"""
+import os
+import sys
+import time
+import uuid
+import hmac
+import cProfile
+import logging
+import threading
+from collections import Counter
+
+logger = logging.getLogger("turbulence-api")
+
+MODES = ("cprofile", "sample")
+
+
+def _folded(frame):
+    """Leaf-first list of "name (file:line)" entries for a frame's stack."""
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return stack
+
+
+def _idle_worker(frame):
+    """True when a pool thread is blocked waiting for work (ThreadPoolExecutor._worker at the leaf)."""
+    return frame.f_code.co_name == "_worker" and os.path.basename(frame.f_code.co_filename) == "thread.py"
+
+
+class SamplingProfiler:
+    """
+    Samples the stack of one thread (`thread_id`, may be None) and of busy threads
+    whose names start with one of `pool_prefixes` at a fixed interval, and counts
+    folded stacks.
+    """
+
+    def __init__(self, thread_id, interval=0.005, pool_prefixes=()):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.pool_prefixes = tuple(pool_prefixes)
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="request-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _pool_threads(self):
+        """{thread id: root label} of the live pool threads."""
+        if not self.pool_prefixes:
+            return {}
+        return {t.ident: f"{prefix} pool" for t in threading.enumerate()
+                for prefix in self.pool_prefixes if t.name.startswith(prefix)}
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            frame = frames.get(self.thread_id)
+            if frame is not None:
+                # folded stacks are root-first and ';'-separated
+                self.samples[";".join(reversed(_folded(frame)))] += 1
+            for ident, root in self._pool_threads().items():
+                frame = frames.get(ident)
+                if frame is not None and not _idle_worker(frame):
+                    self.samples[";".join([root] + list(reversed(_folded(frame))))] += 1
+
+    def dump(self, path):
+        with open(path, "w") as fh:
+            for stack, count in self.samples.most_common():
+                fh.write(f"{stack} {count}\n")
+
+
+class RequestProfile:
+    """
+    Profiles the current thread (and busy threads of the named pools) between
+    start() and stop(), then saves to disk.
+    """
+
+    def __init__(self, mode="cprofile", interval=0.005, pool_prefixes=()):
+        if mode not in MODES:
+            raise ValueError(f"Unknown profile mode '{mode}', expected one of {MODES}")
+        self.mode = mode
+        self.interval = interval
+        self.pool_prefixes = tuple(pool_prefixes)
+        self._profiler = None
+        self._pool_sampler = None
+        self.pool_name = None
+        self.started_at = None
+        self.elapsed = None
+
+    def start(self):
+        self.started_at = time.perf_counter()
+        if self.mode == "cprofile":
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+            if self.pool_prefixes:
+                self._pool_sampler = SamplingProfiler(None, self.interval, self.pool_prefixes)
+                self._pool_sampler.start()
+        else:
+            self._profiler = SamplingProfiler(threading.get_ident(), self.interval, self.pool_prefixes)
+            self._profiler.start()
+
+    def stop(self):
+        if self.mode == "cprofile":
+            self._profiler.disable()
+            if self._pool_sampler is not None:
+                self._pool_sampler.stop()
+        else:
+            self._profiler.stop()
+        self.elapsed = time.perf_counter() - self.started_at
+
+    def save(self, out_dir, label="request"):
+        """
+        Write the profile to out_dir and return the file name. In cprofile mode,
+        pool samples (if any) go to <name>.pool.folded, recorded in `pool_name`.
+        """
+        os.makedirs(out_dir, exist_ok=True)
+        ext = "prof" if self.mode == "cprofile" else "folded"
+        safe_label = "".join(c if c.isalnum() or c in "-_" else "_" for c in label) or "request"
+        name = f"{time.strftime('%Y%m%dT%H%M%S')}_{safe_label}_{uuid.uuid4().hex[:8]}.{ext}"
+        path = os.path.join(out_dir, name)
+        if self.mode == "cprofile":
+            self._profiler.dump_stats(path)
+            if self._pool_sampler is not None and self._pool_sampler.samples:
+                self.pool_name = f"{name}.pool.folded"
+                self._pool_sampler.dump(os.path.join(out_dir, self.pool_name))
+        else:
+            self._profiler.dump(path)
+        logger.info(f"Saved {self.mode} profile ({self.elapsed:.3f}s) -> {path}")
+        return name
+
+
+def token_matches(supplied, expected):
+    """Constant-time token check; profiling is disabled when no token is configured."""
+    if not expected or not supplied:
+        return False
+    return hmac.compare_digest(str(supplied), str(expected))
+
+
+def profile_request_options(req, expected_token):
+    """
+    Return the requested profile mode for a Flask request, or None when the
+    request did not ask for profiling or did not present a valid token.
+    """
+    supplied = req.headers.get("X-Profile-Token") or req.args.get("profile_token")
+    if supplied is None:
+        return None
+    if not token_matches(supplied, expected_token):
+        logger.warning("Rejected profiling request with invalid token")
+        return None
+    mode = (req.headers.get("X-Profile-Mode") or req.args.get("profile_mode") or "cprofile").lower()
+    return mode if mode in MODES else "cprofile"
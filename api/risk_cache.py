@@ -0,0 +1,155 @@
+"""
+Latest-risk cache shared by the ingestion daemon and the API.
+
+The daemon (ingest_daemon.py) publishes every scored product to RISK_CACHE_DIR:
+  - latest_grid.npz: lat, lon, pred (uint8 index into classes), proba_max (float16)
+                     and the satellite inputs per pixel (feat_CTP, feat_CTT, ...)
+  - latest.json:     product, timestep, file, per-class counts, latency, seq
+Each file is written under a unique temporary name and renamed into place, and
+the JSON goes last, so readers never see a half-written update. Publishes hold
+an exclusive file lock, so several daemon workers (or daemons) cannot interleave:
+`seq` increases by exactly one per publish and is stored in both files, so
+readers can tell whether the grid they loaded belongs to the summary they hold.
+A product older than the published timestep is refused rather than replacing
+newer data.
+
+Readers (API workers) stat the files and only reload them when the mtime changes.
+"""
+import os
+import json
+import fcntl
+import tempfile
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+logger = logging.getLogger("turbulence-api")
+
+RISK_CACHE_DIR = os.getenv("RISK_CACHE_DIR", "risk_cache")
+SUMMARY_NAME = "latest.json"
+GRID_NAME = "latest_grid.npz"
+
+
+class RiskCache:
+    """File-backed latest risk grid + summary, reloaded on change."""
+
+    def __init__(self, cache_dir=RISK_CACHE_DIR):
+        self.cache_dir = cache_dir
+        self._lock = threading.Lock()
+        self._summary, self._summary_mtime = None, None
+        self._grid, self._grid_mtime = None, None
+
+    @property
+    def summary_path(self):
+        return os.path.join(self.cache_dir, SUMMARY_NAME)
+
+    @property
+    def grid_path(self):
+        return os.path.join(self.cache_dir, GRID_NAME)
+
+    @contextmanager
+    def _locked(self):
+        """Exclusive lock across threads and processes for the read-modify-write of a publish."""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with open(os.path.join(self.cache_dir, ".lock"), "a") as fh:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fh, fcntl.LOCK_UN)
+
+    def _current(self):
+        """The summary on disk right now (bypassing the mtime cache), or {}."""
+        try:
+            with open(self.summary_path) as fh:
+                return json.load(fh)
+        except (OSError, ValueError):
+            return {}
+
+    def _replace(self, suffix, write):
+        """Write through `write(path)` to a unique temp file in the cache dir, then rename it to `suffix`."""
+        fd, tmp = tempfile.mkstemp(prefix=".publish-", suffix=os.path.splitext(suffix)[1], dir=self.cache_dir)
+        os.close(fd)
+        try:
+            write(tmp)
+            os.replace(tmp, os.path.join(self.cache_dir, suffix))
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    def publish(self, meta, lat, lon, codes, proba_max, classes, features=None):
+        """
+        Store one scored grid. `codes` index into `classes`; meta is any JSON-able
+        dict (product, timestep, file, latency, ...); `features` maps input name ->
+        per-pixel array and is stored as float32 for route queries. Returns the
+        stored summary, or None when meta["timestep"] is older than the published one.
+        """
+        codes = np.asarray(codes, dtype=np.uint8)
+        classes = [str(c) for c in classes]
+        counts = np.bincount(codes, minlength=len(classes))
+        with self._locked():
+            prev = self._current()
+            if meta.get("timestep") and prev.get("timestep") and meta["timestep"] < prev["timestep"]:
+                logger.info(f"Not publishing {meta.get('file')}: {meta['timestep']} is older than "
+                            f"the published {prev['timestep']}")
+                return None
+            seq = int(prev.get("seq", 0)) + 1
+
+            self._replace(GRID_NAME, lambda tmp: np.savez(
+                tmp, lat=np.asarray(lat, dtype=np.float32), lon=np.asarray(lon, dtype=np.float32),
+                pred=codes, proba_max=np.asarray(proba_max, dtype=np.float16),
+                classes=np.asarray(classes), seq=np.int64(seq),
+                **{f"feat_{k}": np.asarray(v, dtype=np.float32) for k, v in (features or {}).items()}))
+
+            summary = dict(meta, seq=seq, rows=int(codes.size), classes=classes,
+                           features=sorted(features or {}),
+                           class_counts={c: int(n) for c, n in zip(classes, counts)},
+                           published_at=time.time())
+
+            def write_summary(tmp):
+                with open(tmp, "w") as fh:
+                    json.dump(summary, fh)
+            self._replace(SUMMARY_NAME, write_summary)
+        return summary
+
+    @staticmethod
+    def _mtime(path):
+        try:
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+
+    def summary(self):
+        """Latest summary dict, or None if nothing has been published."""
+        mtime = self._mtime(self.summary_path)
+        with self._lock:
+            if mtime is None:
+                return None
+            if mtime != self._summary_mtime:
+                try:
+                    with open(self.summary_path) as fh:
+                        self._summary = json.load(fh)
+                    self._summary_mtime = mtime
+                except (OSError, ValueError) as e:
+                    logger.warning(f"Could not read risk summary: {e}")
+            return self._summary
+
+    def grid(self):
+        """Latest grid as a dict of arrays (lat, lon, pred, proba_max, classes, seq, feat_*), or None."""
+        mtime = self._mtime(self.grid_path)
+        with self._lock:
+            if mtime is None:
+                return None
+            if mtime != self._grid_mtime:
+                try:
+                    with np.load(self.grid_path) as npz:
+                        grid = {k: npz[k] for k in npz.files}
+                    grid["seq"] = int(grid["seq"])
+                    self._grid, self._grid_mtime = grid, mtime
+                except (OSError, ValueError) as e:
+                    logger.warning(f"Could not read risk grid: {e}")
+            return self._grid
@@ -0,0 +1,117 @@
+"""
+Flight-route sampling and grid lookup for /route-risk.
+
+A route is a polyline of waypoints (lat, lon, optional altitude and time).
+Every leg is sampled along the great circle every `spacing_km`. Altitude and
+time are interpolated linearly in distance. All legs of all routes are sampled
+in one vectorized pass. Satellite inputs for the samples come from the latest
+ingested grid through a KD-tree on unit-sphere coordinates (GridIndex), built
+once per published grid.
+"""
+from datetime import datetime, timezone
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def xyz(lat, lon):
+    la = np.radians(np.asarray(lat, dtype=np.float64))
+    lo = np.radians(np.asarray(lon, dtype=np.float64))
+    return np.column_stack((np.cos(la) * np.cos(lo), np.cos(la) * np.sin(lo), np.sin(la)))
+
+
+def to_epoch(ts):
+    """Seconds since the epoch for an ISO string (naive = UTC), NaN when missing."""
+    if ts in (None, ""):
+        return np.nan
+    dt = datetime.fromisoformat(str(ts).replace("Z", "+00:00"))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+def parse_waypoints(waypoints):
+    """List of waypoint dicts -> (lat, lon, alt_ft, epoch_s) arrays. Raises ValueError."""
+    if not isinstance(waypoints, list) or len(waypoints) < 2:
+        raise ValueError("a route needs at least two waypoints")
+    try:
+        lat = np.array([float(w["lat"]) for w in waypoints])
+        lon = np.array([float(w["lon"]) for w in waypoints])
+        alt = np.array([float(w.get("alt_ft", w.get("altitude", np.nan))) for w in waypoints])
+        t = np.array([to_epoch(w.get("time")) for w in waypoints])
+    except (KeyError, TypeError, ValueError) as e:
+        raise ValueError(f"invalid waypoint: {e}")
+    if np.any(np.abs(lat) > 90) or np.any(np.abs(lon) > 360):
+        raise ValueError("waypoint lat/lon out of range")
+    return lat, lon, alt, t
+
+
+def leg_angles(p):
+    """Great-circle angle (radians) of each leg between consecutive unit vectors."""
+    return np.arccos(np.clip(np.einsum("ij,ij->i", p[:-1], p[1:]), -1.0, 1.0))
+
+
+def samples_per_leg(length_km, spacing_km):
+    return np.maximum(1, np.ceil(np.asarray(length_km) / spacing_km))
+
+
+def sample_count(lat, lon, spacing_km):
+    """Number of samples sample_polyline would return, from the leg lengths alone (nothing is allocated per sample)."""
+    length_km = leg_angles(xyz(lat, lon)) * EARTH_RADIUS_KM
+    return int(samples_per_leg(length_km, spacing_km).sum()) + 1
+
+
+def sample_polyline(lat, lon, spacing_km):
+    """
+    Great-circle samples every spacing_km along the polyline, including both ends.
+    Returns (segment index, fraction along segment, sample lat, sample lon, segment lengths km).
+    Check sample_count first: the arrays grow with route length / spacing.
+    """
+    p = xyz(lat, lon)
+    a, b = p[:-1], p[1:]
+    omega = leg_angles(p)
+    length_km = omega * EARTH_RADIUS_KM
+    n = samples_per_leg(length_km, spacing_km).astype(np.int64)
+    seg = np.repeat(np.arange(len(a)), n)
+    frac = (np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n)) / np.repeat(n, n)
+    # the final waypoint closes the last segment
+    seg = np.append(seg, len(a) - 1)
+    frac = np.append(frac, 1.0)
+
+    om = omega[seg]
+    small = om < 1e-9
+    sin_om = np.where(small, 1.0, np.sin(om))
+    wa = np.where(small, 1.0 - frac, np.sin((1.0 - frac) * om) / sin_om)
+    wb = np.where(small, frac, np.sin(frac * om) / sin_om)
+    s = wa[:, None] * a[seg] + wb[:, None] * b[seg]
+    s /= np.linalg.norm(s, axis=1, keepdims=True)
+    s_lat = np.degrees(np.arcsin(np.clip(s[:, 2], -1.0, 1.0)))
+    s_lon = np.degrees(np.arctan2(s[:, 1], s[:, 0]))
+    return seg, frac, s_lat, s_lon, length_km
+
+
+def interpolate(values, seg, frac):
+    """Linear interpolation of per-waypoint values at (segment, fraction) samples."""
+    values = np.asarray(values, dtype=np.float64)
+    return values[seg] + (values[seg + 1] - values[seg]) * frac
+
+
+class GridIndex:
+    """Nearest-pixel lookup on one published risk grid."""
+
+    def __init__(self, grid):
+        self.seq = grid["seq"]
+        self.grid = grid
+        self.tree = cKDTree(xyz(grid["lat"], grid["lon"]))
+
+    def lookup(self, lat, lon, max_km):
+        """Index of the nearest grid pixel per point (-1 beyond max_km) and the distance in km."""
+        max_chord = 2 * np.sin(max_km / EARTH_RADIUS_KM / 2)
+        dist, idx = self.tree.query(xyz(lat, lon), distance_upper_bound=max_chord, workers=-1)
+        hit = np.isfinite(dist)
+        idx = np.where(hit, idx, -1)
+        # chord -> great-circle distance
+        dist_km = np.where(hit, 2 * np.arcsin(np.clip(np.where(hit, dist, 0) / 2, 0, 1)) * EARTH_RADIUS_KM, np.nan)
+        return idx, dist_km
@@ -0,0 +1,159 @@
+"""
+Sharded inference for large inputs (full-disk grids, big batch uploads).
+
+The feature matrix is split into row blocks which are scaled and scored on a
+worker pool, then labels, probabilities and per-class counts are merged.
+  - executor="thread":  sklearn's tree traversal releases the GIL, so threads
+    scale well and share the model and input without copies (default).
+  - executor="process": for engines that hold the GIL; the input is placed in
+    shared memory once and each worker scores its slice in place.
+Each shard runs the model with n_jobs=1 so the pool, not joblib, owns the cores.
+"""
+import os
+import copy
+import logging
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger("turbulence-api")
+
+DEFAULT_BLOCK_ROWS = 100_000
+
+# model held by each process worker (set by _init_process_worker)
+_WORKER_MODEL = None
+
+
+def single_threaded(model):
+    """Shallow copy of the estimator that scores on one core (fitted trees are shared, not copied)."""
+    if hasattr(model, "n_jobs"):
+        model = copy.copy(model)
+        model.n_jobs = 1
+    return model
+
+
+def score_block(model, scaler, X, columns=None):
+    """
+    Scale and score one block. Returns (labels, probs); probs is None when the
+    model has no predict_proba. Labels are derived from the probabilities so the
+    forest is traversed once instead of twice (predict + predict_proba).
+    """
+    if columns is not None and not isinstance(X, pd.DataFrame):
+        X = pd.DataFrame(X, columns=columns, copy=False)
+    Xs = scaler.transform(X) if scaler is not None else X
+    if hasattr(model, "predict_proba") and hasattr(model, "classes_"):
+        probs = model.predict_proba(Xs)
+        labels = model.classes_.take(np.argmax(probs, axis=1))
+        return labels, probs
+    return model.predict(Xs), None
+
+
+def class_counts(labels, classes):
+    """Count labels per class in `classes` order."""
+    idx = np.searchsorted(classes, labels)
+    idx = np.clip(idx, 0, len(classes) - 1)
+    valid = classes[idx] == labels
+    return np.bincount(idx[valid], minlength=len(classes))
+
+
+def _init_process_worker(model):
+    global _WORKER_MODEL
+    _WORKER_MODEL = single_threaded(model)
+
+
+def _score_shared_block(shm_name, shape, dtype, start, stop, scaler, columns):
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        X = np.ndarray(shape, dtype=dtype, buffer=shm.buf)[start:stop]
+        # copy out of the shared buffer before the segment is closed
+        labels, probs = score_block(_WORKER_MODEL, scaler, X.copy(), columns)
+    finally:
+        shm.close()
+    return labels, probs
+
+
+class ShardedPredictor:
+    """Scores large feature matrices in row blocks on a reusable worker pool."""
+
+    def __init__(self, model, n_workers=None, block_rows=DEFAULT_BLOCK_ROWS, executor="thread"):
+        if executor not in ("thread", "process"):
+            raise ValueError(f"Unknown executor '{executor}', expected 'thread' or 'process'")
+        self.model = model
+        self.n_workers = max(1, n_workers or os.cpu_count() or 1)
+        self.block_rows = max(1, int(block_rows))
+        self.executor = executor
+        self._shard_model = single_threaded(model)
+        self._pool = None
+
+    @property
+    def classes(self):
+        return getattr(self.model, "classes_", None)
+
+    def _get_pool(self):
+        if self._pool is None:
+            if self.executor == "thread":
+                self._pool = ThreadPoolExecutor(max_workers=self.n_workers, thread_name_prefix="shard")
+            else:
+                self._pool = ProcessPoolExecutor(max_workers=self.n_workers, initializer=_init_process_worker,
+                                                 initargs=(self.model,))
+        return self._pool
+
+    def _bounds(self, n_rows):
+        # at least one block per worker so small-but-sharded inputs still use every core
+        block = min(self.block_rows, max(1, -(-n_rows // self.n_workers)))
+        return [(s, min(s + block, n_rows)) for s in range(0, n_rows, block)]
+
+    def predict(self, X, scaler=None):
+        """
+        Scale (when a scaler is given) and score X (DataFrame or 2D array).
+        Returns (labels, probs, counts) where counts is the number of rows per
+        class in model.classes_ order (None when the model has no classes_).
+        """
+        columns = list(X.columns) if isinstance(X, pd.DataFrame) else None
+        n_rows = len(X)
+        bounds = self._bounds(n_rows)
+        if n_rows == 0 or len(bounds) == 1:
+            results = [score_block(self._shard_model, scaler, X, columns)]
+        elif self.executor == "thread":
+            pool = self._get_pool()
+            if columns is not None:
+                futures = [pool.submit(score_block, self._shard_model, scaler, X.iloc[s:e], columns) for s, e in bounds]
+            else:
+                futures = [pool.submit(score_block, self._shard_model, scaler, X[s:e]) for s, e in bounds]
+            results = [f.result() for f in futures]
+        else:
+            results = self._predict_processes(X, bounds, scaler, columns)
+
+        labels = np.concatenate([r[0] for r in results])
+        probs = None if results[0][1] is None else np.vstack([r[1] for r in results])
+        counts = None
+        if self.classes is not None:
+            counts = sum(class_counts(r[0], self.classes) for r in results)
+        logger.info(f"Sharded inference: {n_rows} rows in {len(bounds)} blocks on {self.n_workers} {self.executor} workers")
+        return labels, probs, counts
+
+    def _predict_processes(self, X, bounds, scaler, columns):
+        arr = np.ascontiguousarray(X.to_numpy() if columns is not None else X)
+        shm = shared_memory.SharedMemory(create=True, size=max(1, arr.nbytes))
+        try:
+            np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)[:] = arr
+            pool = self._get_pool()
+            futures = [pool.submit(_score_shared_block, shm.name, arr.shape, arr.dtype.str, s, e, scaler, columns)
+                       for s, e in bounds]
+            return [f.result() for f in futures]
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
@@ -0,0 +1,165 @@
+"""
+Server-Sent Events fan-out for live risk updates.
+
+One background thread per API process watches the risk cache that
+ingest_daemon.py publishes to. When a new product appears, the thread builds
+the event once. The event holds the product summary plus per-cell aggregates
+(CELL_DEG cells): class counts, Severe pixel count and max Severe probability.
+Every subscriber receives the same Event object. Only the region filter runs per
+client, and it reads the cell aggregates (a few thousand rows), never the full grid.
+
+Subscriber queues are bounded. A client that falls behind loses its oldest
+pending events. Each event is a complete snapshot, so only the newest one matters.
+"""
+import json
+import time
+import queue
+import logging
+import threading
+
+import numpy as np
+
+logger = logging.getLogger("turbulence-api")
+
+CELL_DEG = 1.0
+SUBSCRIBER_QUEUE = 8
+
+
+def sse(data, event=None, event_id=None):
+    """Format one SSE message."""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    if event:
+        lines.append(f"event: {event}")
+    payload = data if isinstance(data, str) else json.dumps(data)
+    lines.extend(f"data: {line}" for line in payload.split("\n"))
+    return "\n".join(lines) + "\n\n"
+
+
+def parse_region(text):
+    """'lat_min,lat_max,lon_min,lon_max' -> tuple of floats, None for no filter. Raises ValueError."""
+    if not text:
+        return None
+    parts = [float(p) for p in text.split(",")]
+    if len(parts) != 4 or parts[0] > parts[1] or parts[2] > parts[3]:
+        raise ValueError("region must be lat_min,lat_max,lon_min,lon_max")
+    return tuple(parts)
+
+
+class Event:
+    """One published product, aggregated into cells so per-client filters are cheap."""
+
+    def __init__(self, summary, grid, class_texts, cell_deg=CELL_DEG):
+        self.seq = int(summary["seq"])
+        self.summary = summary
+        self.class_texts = list(class_texts)
+        n_cls = len(self.class_texts)
+        cells_i = np.floor(grid["lat"] / cell_deg).astype(np.int64)
+        cells_j = np.floor(grid["lon"] / cell_deg).astype(np.int64)
+        span = int(np.ceil(360 / cell_deg)) + 1
+        ids = (cells_i + span) * (2 * span) + (cells_j + span)
+        uniq, inv = np.unique(ids, return_inverse=True)
+        n = uniq.size
+        pred = grid["pred"].astype(np.int64)
+        self.counts = np.bincount(inv * n_cls + pred, minlength=n * n_cls).reshape(n, n_cls)
+        # south-west corner of each cell
+        self.cell_lat = (uniq // (2 * span) - span) * cell_deg
+        self.cell_lon = (uniq % (2 * span) - span) * cell_deg
+        self.cell_deg = cell_deg
+        self.severe_prob = np.zeros(n, dtype=np.float32)
+        severe = [k for k, t in enumerate(self.class_texts) if t == "Severe"]
+        if severe:
+            is_severe = np.isin(pred, severe)
+            np.maximum.at(self.severe_prob, inv[is_severe], grid["proba_max"][is_severe].astype(np.float32))
+            self.severe = self.counts[:, severe].sum(axis=1)
+        else:
+            self.severe = np.zeros(n, dtype=np.int64)
+
+    def _mask(self, region):
+        if region is None:
+            return np.ones(self.cell_lat.size, dtype=bool)
+        lat_min, lat_max, lon_min, lon_max = region
+        # cells overlapping the region
+        return ((self.cell_lat + self.cell_deg > lat_min) & (self.cell_lat < lat_max) &
+                (self.cell_lon + self.cell_deg > lon_min) & (self.cell_lon < lon_max))
+
+    def class_counts(self, region=None):
+        """{class text: pixel count} inside the region."""
+        per_class = self.counts[self._mask(region)].sum(axis=0)
+        out = {}
+        for text, n in zip(self.class_texts, per_class):
+            out[text] = out.get(text, 0) + int(n)
+        return out
+
+    def alerts(self, region=None, limit=50):
+        """Cells with Severe pixels inside the region, most Severe pixels first."""
+        idx = np.flatnonzero(self._mask(region) & (self.severe > 0))
+        idx = idx[np.argsort(-self.severe[idx], kind="stable")][:limit]
+        return [{"lat": float(self.cell_lat[i]), "lon": float(self.cell_lon[i]),
+                 "cell_deg": self.cell_deg, "severe_pixels": int(self.severe[i]),
+                 "max_prob": round(float(self.severe_prob[i]), 3)} for i in idx]
+
+
+class Broadcaster:
+    """Watches a RiskCache and fans every new product out to subscriber queues."""
+
+    def __init__(self, cache, label_fn=str, poll=1.0):
+        self.cache = cache
+        self.label_fn = label_fn
+        self.poll = poll
+        self.latest = None
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._check_lock = threading.Lock()
+        self._thread = None
+
+    def subscribe(self):
+        q = queue.Queue(maxsize=SUBSCRIBER_QUEUE)
+        with self._lock:
+            self._subscribers.add(q)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="risk-broadcaster", daemon=True)
+                self._thread.start()
+        return q
+
+    def unsubscribe(self, q):
+        with self._lock:
+            self._subscribers.discard(q)
+
+    @property
+    def n_subscribers(self):
+        return len(self._subscribers)
+
+    def check(self):
+        """Build and fan out an Event if the cache holds a newer product. Returns the event or None."""
+        with self._check_lock:
+            summary = self.cache.summary()
+            if summary is None or (self.latest is not None and summary["seq"] == self.latest.seq):
+                return None
+            grid = self.cache.grid()
+            if grid is None or grid["seq"] != summary["seq"]:
+                return None  # grid and summary mid-update; retry next poll
+            event = Event(summary, grid, [self.label_fn(c) for c in summary["classes"]])
+            self.latest = event
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for q in subscribers:
+            while True:
+                try:
+                    q.put_nowait(event)
+                    break
+                except queue.Full:
+                    try:
+                        q.get_nowait()  # drop the oldest snapshot for slow clients
+                    except queue.Empty:
+                        pass
+        return event
+
+    def _run(self):
+        while True:
+            try:
+                self.check()
+            except Exception:
+                logger.exception("Risk broadcaster failed to publish an update")
+            time.sleep(self.poll)
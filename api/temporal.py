@@ -0,0 +1,181 @@
+"""
+Incremental temporal features over satellite time series.
+
+Each grid cell (CELL_DEG x CELL_DEG degrees) keeps a ring buffer of its last
+`window` CTP/CTT observations. Running sums are updated as values enter and
+leave the buffer, so ingesting a timestep costs O(cells touched) and never
+rescans history. Per cell the engine exposes:
+  - <VAR>_mean:   rolling mean over the window
+  - <VAR>_delta:  latest minus previous observation
+  - <VAR>_rate:   delta per hour
+  - CTT_cooling_rate: -CTT_rate in K/h; rapid cloud-top cooling is a
+    convective turbulence signal
+All updates and lookups are vectorized over pixels; a whole full-disk grid can
+be ingested in one call.
+
+Buffers and running sums are both float64, so the exact value added to a sum is
+the one subtracted when it leaves the window; a sum is reset to 0 when its cell
+has no valid observation left. The state lives in process memory: each gunicorn
+worker keeps its own history, fed by the uploads that worker served.
+"""
+import threading
+from datetime import datetime, timezone
+
+import numpy as np
+
+CELL_DEG = 0.25
+DEFAULT_WINDOW = 8              # 8 x 15-min slots = 2 hours
+VARIABLES = ("CTP", "CTT")
+_EPOCH = datetime(2000, 1, 1, tzinfo=timezone.utc)
+
+
+def to_minutes(ts):
+    """Minutes since 2000-01-01 UTC for a datetime or ISO string (naive = UTC)."""
+    if isinstance(ts, str):
+        ts = datetime.fromisoformat(ts.replace("Z", "+00:00"))
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return int(round((ts - _EPOCH).total_seconds() / 60))
+
+
+class TemporalFeatureEngine:
+    """Per-cell ring buffers with running sums for rolling CTP/CTT features."""
+
+    def __init__(self, window=DEFAULT_WINDOW, cell_deg=CELL_DEG, variables=VARIABLES):
+        self.window = int(window)
+        self.cell_deg = float(cell_deg)
+        self.variables = tuple(variables)
+        self.n_lat = int(np.ceil(180 / self.cell_deg))
+        self.n_lon = int(np.ceil(360 / self.cell_deg))
+        # global cell id -> slot in the state arrays (-1 = never seen)
+        self._slot_of = np.full(self.n_lat * self.n_lon, -1, dtype=np.int32)
+        self._n_slots = 0
+        self._lock = threading.Lock()
+        self._alloc(1024)
+
+    def _alloc(self, capacity):
+        nv, w = len(self.variables), self.window
+        self._buf = np.full((nv, capacity, w), np.nan, dtype=np.float64)
+        self._times = np.zeros((capacity, w), dtype=np.int32)
+        self._sums = np.zeros((nv, capacity), dtype=np.float64)
+        self._valid = np.zeros((nv, capacity), dtype=np.int32)
+        self._head = np.zeros(capacity, dtype=np.int32)     # next write position
+        self._count = np.zeros(capacity, dtype=np.int32)    # observations held (<= window)
+        self._last = np.full(capacity, -2**31, dtype=np.int32)
+
+    def _grow(self, needed):
+        capacity = self._head.size
+        if needed <= capacity:
+            return
+        new_cap = max(needed, capacity * 2)
+        old = (self._buf, self._times, self._sums, self._valid, self._head, self._count, self._last)
+        self._alloc(new_cap)
+        self._buf[:, :capacity] = old[0]
+        self._times[:capacity] = old[1]
+        self._sums[:, :capacity] = old[2]
+        self._valid[:, :capacity] = old[3]
+        self._head[:capacity] = old[4]
+        self._count[:capacity] = old[5]
+        self._last[:capacity] = old[6]
+
+    @property
+    def n_cells(self):
+        return self._n_slots
+
+    @property
+    def feature_names(self):
+        names = ["temporal_n_obs"] + [f"{v}_{s}" for v in self.variables for s in ("mean", "delta", "rate")]
+        return names + (["CTT_cooling_rate"] if "CTT" in self.variables else [])
+
+    def cell_ids(self, lat, lon):
+        lat = np.asarray(lat, dtype=np.float64).ravel()
+        lon = np.asarray(lon, dtype=np.float64).ravel()
+        i = np.clip(((lat + 90) // self.cell_deg).astype(np.int64), 0, self.n_lat - 1)
+        j = np.clip((((lon + 180) % 360) // self.cell_deg).astype(np.int64), 0, self.n_lon - 1)
+        return i * self.n_lon + j
+
+    def update(self, timestamp, lat, lon, values):
+        """
+        Ingest one timestep. `values` maps variable name -> per-pixel array aligned
+        with lat/lon; pixels falling in the same cell are averaged. Cells whose last
+        observation is not older than `timestamp` are left unchanged. Returns the
+        number of cells updated.
+        """
+        t = to_minutes(timestamp)
+        cells = self.cell_ids(lat, lon)
+        if cells.size == 0:
+            return 0
+        uniq, inv = np.unique(cells, return_inverse=True)
+        means = []
+        for v in self.variables:
+            arr = np.asarray(values.get(v, np.full(cells.size, np.nan)), dtype=np.float64).ravel()
+            ok = ~np.isnan(arr)
+            s = np.bincount(inv[ok], weights=arr[ok], minlength=uniq.size)
+            n = np.bincount(inv[ok], minlength=uniq.size)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                means.append(np.where(n > 0, s / np.maximum(n, 1), np.nan))
+        means = np.vstack(means)
+
+        with self._lock:
+            slots = self._slot_of[uniq]
+            new = slots < 0
+            if new.any():
+                n_new = int(new.sum())
+                self._grow(self._n_slots + n_new)
+                slots[new] = np.arange(self._n_slots, self._n_slots + n_new, dtype=np.int32)
+                self._slot_of[uniq[new]] = slots[new]
+                self._n_slots += n_new
+            fresh = self._last[slots] < t
+            slots, means = slots[fresh], means[:, fresh]
+            if slots.size == 0:
+                return 0
+            pos = self._head[slots]
+            for k in range(len(self.variables)):
+                old = self._buf[k, slots, pos]
+                leaving = ~np.isnan(old)        # NaN for empty slots
+                self._sums[k, slots] -= np.where(leaving, old, 0.0)
+                self._valid[k, slots] -= leaving
+                entering = ~np.isnan(means[k])
+                self._sums[k, slots] += np.where(entering, means[k], 0.0)
+                self._valid[k, slots] += entering
+                # no rounding residue may survive in an empty window
+                self._sums[k, slots] = np.where(self._valid[k, slots] > 0, self._sums[k, slots], 0.0)
+                self._buf[k, slots, pos] = means[k]
+            self._times[slots, pos] = t
+            self._last[slots] = t
+            self._head[slots] = (pos + 1) % self.window
+            self._count[slots] = np.minimum(self._count[slots] + 1, self.window)
+            return int(slots.size)
+
+    def features(self, lat, lon):
+        """Temporal features for each lat/lon (NaN where a cell has too little history)."""
+        cells = self.cell_ids(lat, lon)
+        n = cells.size
+        out = {"temporal_n_obs": np.zeros(n, dtype=np.int32)}
+        for v in self.variables:
+            for suffix in ("mean", "delta", "rate"):
+                out[f"{v}_{suffix}"] = np.full(n, np.nan, dtype=np.float32)
+        with self._lock:
+            slots = self._slot_of[cells]
+            known = slots >= 0
+            s = slots[known]
+            if s.size:
+                count = self._count[s]
+                latest = (self._head[s] - 1) % self.window
+                prev = (self._head[s] - 2) % self.window
+                has_prev = count >= 2
+                dt_h = (self._times[s, latest] - self._times[s, prev]) / 60.0
+                out["temporal_n_obs"][known] = count
+                for k, v in enumerate(self.variables):
+                    with np.errstate(invalid="ignore", divide="ignore"):
+                        valid = self._valid[k, s]
+                        mean = np.where(valid > 0, self._sums[k, s] / np.maximum(valid, 1), np.nan)
+                        delta = self._buf[k, s, latest] - self._buf[k, s, prev]
+                        delta = np.where(has_prev, delta, np.nan)
+                        rate = np.where(has_prev & (dt_h > 0), delta / np.where(dt_h > 0, dt_h, 1), np.nan)
+                    out[f"{v}_mean"][known] = mean
+                    out[f"{v}_delta"][known] = delta
+                    out[f"{v}_rate"][known] = rate
+        if "CTT" in self.variables:
+            out["CTT_cooling_rate"] = -out["CTT_rate"]
+        return out
@@ -0,0 +1,79 @@
+"""
+Staging of uploaded HDF5 products for /process-h5.
+
+Each product is copied into its own uniquely named scratch file (mkstemp), so
+concurrent uploads of the same product name can no longer overwrite each
+other mid-read. Tar bundles (plain or gz/bz2/xz compressed) and zip bundles
+are unpacked one member at a time into their own scratch files. Members are
+never extracted by path, so archive paths cannot escape the scratch
+directory. Non-HDF5 members are skipped. The file count and the total staged
+size are capped, which keeps a small compressed bundle from filling the disk.
+"""
+import os
+import tarfile
+import tempfile
+import zipfile
+from contextlib import contextmanager, suppress
+
+H5_SUFFIXES = (".h5", ".hdf5", ".he5")
+ARCHIVE_SUFFIXES = (".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz", ".zip")
+CHUNK = 1 << 20
+
+
+class UploadError(ValueError):
+    """The upload cannot be staged or analysed (bad bundle, too many files, too large, no geolocation)."""
+
+
+def is_archive(filename):
+    return (filename or "").lower().endswith(ARCHIVE_SUFFIXES)
+
+
+def archive_members(filename, stream):
+    """(name, stream) of the HDF5 members of a tar/zip bundle, in archive order."""
+    try:
+        if filename.lower().endswith(".zip"):
+            with zipfile.ZipFile(stream) as zf:
+                for info in zf.infolist():
+                    if not info.is_dir() and info.filename.lower().endswith(H5_SUFFIXES):
+                        with zf.open(info) as member:
+                            yield os.path.basename(info.filename), member
+        else:
+            # streaming mode: members are read in order, so the upload need not be seekable
+            with tarfile.open(fileobj=stream, mode="r|*") as tar:
+                for info in tar:
+                    if info.isfile() and info.name.lower().endswith(H5_SUFFIXES):
+                        yield os.path.basename(info.name), tar.extractfile(info)
+    except (tarfile.TarError, zipfile.BadZipFile, EOFError, OSError) as e:
+        raise UploadError(f"Cannot read bundle {filename}: {e}") from e
+
+
+@contextmanager
+def staged_uploads(uploads, scratch_dir=None, max_files=96, max_bytes=None):
+    """
+    Copy uploads ((filename, binary stream) pairs; bundles are unpacked) to unique
+    scratch files. Yields [(name, path)] in upload order and removes the files on exit.
+    """
+    paths, staged, total = [], [], 0
+    try:
+        for filename, stream in uploads:
+            members = archive_members(filename, stream) if is_archive(filename) else [(filename, stream)]
+            for name, src in members:
+                if len(staged) >= max_files:
+                    raise UploadError(f"Too many files (limit {max_files})")
+                fd, path = tempfile.mkstemp(prefix="upload-", suffix=".h5", dir=scratch_dir)
+                paths.append(path)
+                with os.fdopen(fd, "wb") as out:
+                    while True:
+                        block = src.read(CHUNK)
+                        if not block:
+                            break
+                        total += len(block)
+                        if max_bytes is not None and total > max_bytes:
+                            raise UploadError(f"Uploaded products exceed {max_bytes // (1024 * 1024)} MB")
+                        out.write(block)
+                staged.append((name, path))
+        yield staged
+    finally:
+        for path in paths:
+            with suppress(OSError):
+                os.remove(path)
@@ -0,0 +1,307 @@
+"""
+Benchmark runner.
+
+    python -m benchmarks.run                      # full suite -> benchmarks/results/<timestamp>.json
+    python -m benchmarks.run --quick              # small inputs (smoke test, ~1 min)
+    python -m benchmarks.run --cases predict      # only cases whose name contains "predict"
+    python -m benchmarks.run --compare benchmarks/baseline.json
+
+Each case runs in its own spawned interpreter, so imports, caches and memory
+from one case do not leak into the next. A case has an untimed setup (build
+inputs, import modules, warm caches) and a run step that is timed `repeat`
+times. For each case the report records:
+  - min and median seconds, and throughput (items per second, from the median)
+  - setup_peak_rss_mb: the process's peak RSS after setup
+  - peak_rss_mb: the peak RSS after the runs
+  - peak_increase_mb: peak_rss_mb minus setup_peak_rss_mb, the extra memory the run step needed
+
+Synthetic inputs are generated deterministically into --work-dir and reused by
+later runs. --compare flags cases that are more than --tolerance slower, or
+need more than --tolerance more peak memory, than the given report. In that
+case the exit status is 1.
+"""
+import os
+import io
+import sys
+import json
+import time
+import logging
+import warnings
+import platform
+import argparse
+import resource
+import statistics
+import contextlib
+import subprocess
+import multiprocessing as mp
+from datetime import datetime
+
+import numpy as np
+
+from benchmarks.synthetic import FULL_DISK, product_name, write_insat_h5, era5_frame
+
+WORK_DIR = os.getenv("BENCH_WORK_DIR", "/tmp/turbulence-bench")
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+# Input sizes: full suite vs --quick
+SIZES = {
+    "full": {"grid": FULL_DISK, "era5": (24 * 365 * 3, 20), "train_hours": 24 * 365,
+             "predict_rows": (1, 10_000, 1_000_000)},
+    "quick": {"grid": (400, 400), "era5": (24 * 30, 4), "train_hours": 24 * 30,
+              "predict_rows": (1, 1_000, 10_000)},
+}
+SINGLE_ROW_CALLS = 50   # predict_internal[1] times this many single-row calls per run
+
+
+def max_rss_mb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024  # bytes on macOS, KiB elsewhere
+
+
+def h5_input(ctx):
+    """Path and on-disk pixel count of the synthetic L2B CTP file (written once per grid shape)."""
+    shape = ctx["sizes"]["grid"]
+    path = os.path.join(ctx["work_dir"], f"h5_{shape[0]}x{shape[1]}", product_name("CTP"))
+    meta = path + ".json"
+    if not os.path.exists(meta):
+        pixels = write_insat_h5(path, shape)
+        with open(meta, "w") as fh:
+            json.dump({"pixels": pixels}, fh)
+    with open(meta) as fh:
+        return path, json.load(fh)["pixels"]
+
+
+# --- cases: setup(ctx, arg) -> (run, items, unit) ---
+
+def warm_geo_cache(cache, path):
+    """Build the geolocation cache for `path` outside the timing (later files of a product reuse it)."""
+    import h5py
+    from api.geocache import product_type
+    with h5py.File(path, "r") as f:
+        cache.get(f, product_type(path))
+
+
+def setup_read_mosdac(ctx, arg):
+    import read_mosdac
+    path, _ = h5_input(ctx)
+    warm_geo_cache(read_mosdac.GEO_CACHE, path)
+    shape = ctx["sizes"]["grid"]
+    return (lambda: read_mosdac.process_file(path)), shape[0] * shape[1], "pixels"
+
+
+def setup_read_mosdac_stream(ctx, arg):
+    import read_mosdac_stream
+    path, _ = h5_input(ctx)
+    out = os.path.join(ctx["work_dir"], "mosdac_flat.csv")
+
+    def run():
+        if os.path.exists(out):
+            os.remove(out)
+        read_mosdac_stream.HEADER_WRITTEN = False
+        read_mosdac_stream.process_file(path, out)
+
+    warm_geo_cache(read_mosdac_stream.GEO_CACHE, path)
+    shape = ctx["sizes"]["grid"]
+    return run, shape[0] * shape[1], "pixels"
+
+
+def setup_make_features(ctx, arg):
+    from utils import make_features_and_labels
+    hours, locations = ctx["sizes"]["era5"]
+    df = era5_frame(hours, locations)
+    return (lambda: make_features_and_labels(df)), len(df), "rows"
+
+
+def setup_train(ctx, arg):
+    import train_model
+    df = era5_frame(ctx["sizes"]["train_hours"])
+    train_model.MODEL_DIR = os.path.join(ctx["work_dir"], "model_artifacts")
+    os.makedirs(train_model.MODEL_DIR, exist_ok=True)
+    train_model.fetch_era5_hourly = lambda *args, **kwargs: df.copy()
+    run = lambda: train_model.train_for_location(28.6, 77.2, "2021-01-01", "2021-12-31")
+    return run, len(df), "rows"
+
+
+def setup_predict_internal(ctx, arg):
+    from api import app as api_app
+    rows = int(arg)
+    hours = max(1, min(rows, 24 * 365))
+    frame = era5_frame(hours, locations=max(1, -(-rows // hours))).head(rows)
+    frame = frame.drop(columns=["time"])
+    if "lat" not in frame:
+        frame["lat"], frame["lon"] = 28.6, 77.2
+    calls = SINGLE_ROW_CALLS if rows == 1 else 1
+
+    def run(df=frame, n=calls):
+        with api_app.app.test_request_context():
+            for _ in range(n):
+                resp, status = api_app.predict_internal(df.copy())
+                if status != 200:
+                    raise RuntimeError(resp.get_data(as_text=True)[:200])
+
+    run(frame.head(1), 1)  # warm-up (lazy imports, first-call allocations) without raising the peak
+    return run, rows * calls, "rows"
+
+
+def setup_process_h5(ctx, arg):
+    from api import app as api_app
+    path, pixels = h5_input(ctx)
+    warm_geo_cache(api_app.GEO_CACHE, path)
+    client = api_app.app.test_client()
+    with open(path, "rb") as fh:
+        payload = fh.read()
+
+    def run():
+        # ?refresh=1: bypass the job result cache so the file is really processed
+        resp = client.post("/process-h5?refresh=1", content_type="multipart/form-data",
+                           data={"file": (io.BytesIO(payload), os.path.basename(path))})
+        if resp.status_code != 200:
+            raise RuntimeError(resp.get_data(as_text=True)[:200])
+
+    return run, pixels, "pixels"
+
+
+CASES = {
+    "read_mosdac.process_file": (setup_read_mosdac, 1),
+    "read_mosdac_stream.process_file": (setup_read_mosdac_stream, 1),
+    "utils.make_features_and_labels": (setup_make_features, 3),
+    "train_model.train_for_location": (setup_train, 1),
+    "predict_internal": (setup_predict_internal, 3),
+    "POST /process-h5": (setup_process_h5, 1),
+}
+
+
+def case_names(sizes):
+    names = []
+    for name in CASES:
+        if name == "predict_internal":
+            names += [f"predict_internal[{n}]" for n in sizes["predict_rows"]]
+        else:
+            names.append(name)
+    return names
+
+
+def run_case(name, ctx, repeat, conn):
+    """Child process: set up, time `repeat` runs, send the measurements back."""
+    logging.disable(logging.INFO)  # the API logs every request at INFO
+    warnings.simplefilter("ignore")
+    try:
+        base, _, arg = name.partition("[")
+        setup, default_repeat = CASES[base]
+        repeat = repeat or default_repeat
+        with contextlib.redirect_stdout(io.StringIO()):
+            run, items, unit = setup(ctx, arg.rstrip("]"))
+            setup_peak = max_rss_mb()
+            seconds = []
+            for _ in range(repeat):
+                t0 = time.perf_counter()
+                run()
+                seconds.append(time.perf_counter() - t0)
+        median = statistics.median(seconds)
+        peak = max_rss_mb()
+        conn.send({"items": items, "unit": unit, "repeat": repeat, "seconds": [round(s, 4) for s in seconds],
+                   "min_s": round(min(seconds), 4), "median_s": round(median, 4),
+                   "throughput_per_s": round(items / median, 1) if median > 0 else None,
+                   "setup_peak_rss_mb": round(setup_peak, 1), "peak_rss_mb": round(peak, 1),
+                   "peak_increase_mb": round(peak - setup_peak, 1)})
+    except Exception as e:
+        conn.send({"error": f"{type(e).__name__}: {e}"})
+    finally:
+        conn.close()
+
+
+def environment():
+    import pandas as pd
+    import sklearn
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {"python": platform.python_version(), "platform": platform.platform(), "cpu_count": os.cpu_count(),
+            "numpy": np.__version__, "pandas": pd.__version__, "sklearn": sklearn.__version__,
+            "git_commit": commit}
+
+
+def compare(report, baseline, tolerance):
+    """Print median time / peak memory ratios against a baseline report; returns the regressed cases."""
+    regressions = []
+    print(f"\n{'case':40s} {'time':>8s} {'memory':>8s}")
+    for name, cur in report["cases"].items():
+        ref = baseline.get("cases", {}).get(name)
+        if not ref or "error" in ref or "error" in cur:
+            continue
+        t_ratio = cur["median_s"] / ref["median_s"] if ref["median_s"] else float("nan")
+        m_ratio = (cur["peak_increase_mb"] + 1) / (ref["peak_increase_mb"] + 1)
+        flag = ""
+        if t_ratio > 1 + tolerance or m_ratio > 1 + tolerance:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:40s} {t_ratio:7.2f}x {m_ratio:7.2f}x{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the benchmark suite")
+    parser.add_argument("--quick", action="store_true", help="Small inputs instead of full-disk sizes")
+    parser.add_argument("--cases", nargs="*", help="Only run cases whose name contains one of these")
+    parser.add_argument("--repeat", type=int, default=None, help="Timed runs per case (default per case)")
+    parser.add_argument("--work-dir", default=WORK_DIR, help="Synthetic inputs and scratch files")
+    parser.add_argument("--out", default=None, help="Report path (default benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--compare", default=None, help="Baseline report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown/memory growth (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    mode = "quick" if args.quick else "full"
+    ctx = {"work_dir": os.path.abspath(args.work_dir), "sizes": SIZES[mode]}
+    os.makedirs(ctx["work_dir"], exist_ok=True)
+    # keep the API's caches, job store and history away from the repository
+    for var, sub in (("GEO_CACHE_DIR", "geo_cache"), ("JOB_DIR", "jobs"), ("RISK_CACHE_DIR", "risk_cache"),
+                     ("PROFILE_DIR", "profiles")):
+        os.environ[var] = os.path.join(ctx["work_dir"], sub)
+    os.environ["HISTORY_ENABLED"] = "0"
+
+    names = [n for n in case_names(ctx["sizes"]) if not args.cases or any(c in n for c in args.cases)]
+    report = {"created": datetime.now().isoformat(timespec="seconds"), "mode": mode,
+              "sizes": {k: list(v) if isinstance(v, tuple) else v for k, v in ctx["sizes"].items()},
+              "environment": environment(), "cases": {}}
+
+    spawn = mp.get_context("spawn")
+    for name in names:
+        print(f"{name} ...", flush=True)
+        parent, child = spawn.Pipe(duplex=False)
+        proc = spawn.Process(target=run_case, args=(name, ctx, args.repeat, child))
+        proc.start()
+        child.close()
+        try:
+            result = parent.recv()
+        except EOFError:
+            proc.join()
+            result = {"error": f"benchmark process died (exit code {proc.exitcode})"}
+        proc.join()
+        report["cases"][name] = result
+        if "error" in result:
+            print(f"  ERROR {result['error']}")
+        else:
+            print(f"  {result['median_s']:.3f} s median, {result['throughput_per_s']:,.0f} {result['unit']}/s, "
+                  f"peak +{result['peak_increase_mb']:.0f} MB (RSS {result['peak_rss_mb']:.0f} MB)")
+
+    out = args.out or os.path.join(RESULTS_DIR, f"{datetime.now():%Y%m%d-%H%M%S}-{mode}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as fh:
+        json.dump(report, fh, indent=2)
+    print(f"Wrote {out}")
+
+    if args.compare:
+        with open(args.compare) as fh:
+            baseline = json.load(fh)
+        if baseline.get("mode") != mode:
+            print(f"Warning: baseline was recorded in {baseline.get('mode')} mode, this run is {mode}")
+        regressions = compare(report, baseline, args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
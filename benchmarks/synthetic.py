@@ -0,0 +1,112 @@
+"""
+Synthetic inputs for the benchmarks.
+
+- INSAT-3D-shaped L2B HDF5 files: a geostationary full disk centred on 82 E,
+  with (1, rows, cols) float32 Latitude/Longitude (32767 off the disk), CTP/CTT
+  with NaN over clear sky, and a scalar `time`. FULL_DISK is 2816 x 2805
+  (7.9M pixels). Clouds come in coherent patches, not pixel noise, so
+  compression, caching and cascaded scoring behave like they do on real data.
+- ERA5-shaped hourly frames (Open-Meteo variable names) for one or more
+  locations, with the diurnal cycle and spread of the real archive.
+"""
+import os
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+FULL_DISK = (2816, 2805)
+SUB_LON = 82.0          # INSAT-3D/3DR sub-satellite longitude
+FILL_VALUE = 32767
+ERA5_VARIABLES = ["temperature_2m", "dewpoint_2m", "surface_pressure", "wind_speed_10m",
+                  "wind_speed_100m", "relative_humidity_2m", "cloud_cover"]
+
+
+def product_name(product="CTP", timestep=datetime(2024, 6, 18, 0, 0)):
+    """MOSDAC-style file name, e.g. 3DIMG_18JUN2024_0000_L2B_CTP_V01R00.h5."""
+    return f"3DIMG_{timestep.strftime('%d%b%Y').upper()}_{timestep.strftime('%H%M')}_L2B_{product}_V01R00.h5"
+
+
+def smooth_field(rng, shape, block=64):
+    """Spatially coherent noise in [0, 1): random coarse grid, upsampled and blended."""
+    coarse = rng.random((shape[0] // block + 2, shape[1] // block + 2))
+    rows = np.arange(shape[0]) / block
+    cols = np.arange(shape[1]) / block
+    r0, c0 = rows.astype(int), cols.astype(int)
+    fr, fc = (rows - r0)[:, None], (cols - c0)[None, :]
+    top = coarse[r0][:, c0] * (1 - fc) + coarse[r0][:, c0 + 1] * fc
+    bottom = coarse[r0 + 1][:, c0] * (1 - fc) + coarse[r0 + 1][:, c0 + 1] * fc
+    return (top * (1 - fr) + bottom * fr).astype(np.float32)
+
+
+def full_disk_geolocation(shape):
+    """float32 lat/lon of a geostationary disk (orthographic approximation); FILL_VALUE off the disk."""
+    y = np.linspace(1, -1, shape[0], dtype=np.float32)[:, None]
+    x = np.linspace(-1, 1, shape[1], dtype=np.float32)[None, :]
+    r2 = x * x + y * y
+    on_disk = r2 < 0.95 ** 2
+    z = np.sqrt(np.clip(1 - r2, 0, 1))
+    lat = np.degrees(np.arcsin(np.clip(y, -1, 1))).astype(np.float32) * np.ones_like(x)
+    lon = (SUB_LON + np.degrees(np.arctan2(x, z))).astype(np.float32)
+    lat = np.where(on_disk, lat, FILL_VALUE).astype(np.float32)
+    lon = np.where(on_disk, lon, FILL_VALUE).astype(np.float32)
+    return lat, lon
+
+
+def write_insat_h5(path, shape=FULL_DISK, clear_fraction=0.6, timestep=datetime(2024, 6, 18, 0, 0), seed=0):
+    """
+    Write one synthetic L2B file with Latitude, Longitude, CTP, CTT and time.
+    About `clear_fraction` of the on-disk pixels are clear sky (CTP/CTT NaN).
+    Returns the number of on-disk pixels.
+    """
+    import h5py
+
+    rng = np.random.default_rng(seed)
+    lat, lon = full_disk_geolocation(shape)
+    cloud = smooth_field(rng, shape)
+    on_disk = lat != FILL_VALUE
+    threshold = np.quantile(cloud[on_disk], clear_fraction)
+    cloudy = on_disk & (cloud >= threshold)
+    # cloud depth 0..1 above the clear-sky threshold; deep convection has low, cold tops
+    depth = np.clip((cloud - threshold) / max(1e-6, cloud[on_disk].max() - threshold), 0, 1)
+    ctp = np.where(cloudy, 950 - 800 * depth + rng.normal(0, 20, shape).astype(np.float32), np.nan)
+    ctt = np.where(cloudy, 295 - 100 * depth + rng.normal(0, 3, shape).astype(np.float32), np.nan)
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with h5py.File(path, "w") as f:
+        for name, arr in (("Latitude", lat), ("Longitude", lon), ("CTP", ctp), ("CTT", ctt)):
+            f.create_dataset(name, data=arr.astype(np.float32)[None, :, :])
+        f.create_dataset("time", data=np.array([timestep.timestamp()]))
+    return int(on_disk.sum())
+
+
+def era5_frame(hours, locations=1, start="2021-01-01", seed=0):
+    """
+    Hourly ERA5-like frame with the columns fetch_era5_hourly returns
+    (plus lat/lon when locations > 1), `hours` rows per location.
+    """
+    rng = np.random.default_rng(seed)
+    n = hours * locations
+    time = np.tile(pd.date_range(start, periods=hours, freq="h").values, locations)
+    hour_of_day = np.tile(np.arange(hours) % 24, locations)
+    diurnal = np.sin((hour_of_day - 9) / 24 * 2 * np.pi)
+    temp = 25 + 6 * diurnal + rng.normal(0, 3, n)
+    rh = np.clip(65 - 15 * diurnal + rng.normal(0, 12, n), 5, 100)
+    ws10 = np.abs(rng.gamma(2.0, 2.0, n))
+    df = pd.DataFrame({
+        "time": time,
+        "temperature_2m": temp,
+        "dewpoint_2m": temp - (100 - rh) / 5,
+        "surface_pressure": 1000 + rng.normal(0, 6, n),
+        "wind_speed_10m": ws10,
+        "wind_speed_100m": ws10 * rng.uniform(1.1, 2.5, n) + rng.gamma(1.5, 3.0, n),
+        "relative_humidity_2m": rh,
+        "cloud_cover": np.clip(rng.normal(45, 35, n), 0, 100),
+    })
+    # a few short gaps, as in the archive
+    gaps = rng.choice(n, size=n // 500, replace=False)
+    df.loc[gaps, "cloud_cover"] = np.nan
+    if locations > 1:
+        df.insert(1, "lat", np.repeat(rng.uniform(8, 35, locations).round(2), hours))
+        df.insert(2, "lon", np.repeat(rng.uniform(68, 97, locations).round(2), hours))
+    return df
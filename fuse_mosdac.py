@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+fuse_mosdac.py
+Join the separate INSAT-3D L2B products of each timestep (CTP, CMK, HEM, IMC, ...)
+from mosdac_data/*.h5 into one feature table per timestep, written to
+fused_csv/<satellite>_<YYYYmmddTHHMM>.csv.gz.
+
+Products are grouped by the timestep in their file name. The finest grid of the
+group is the reference; coarser grids (CTP at ~98k pixels) are resampled onto it
+by nearest neighbour through a precomputed index map. The geolocation of a
+geostationary product does not change between timesteps, so each index map is
+computed once and cached in GEO_CACHE_DIR (default geo_cache/) for every later
+timestep, next to the geolocation the API caches there.
+"""
+import os, glob
+from collections import OrderedDict
+import h5py
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+from api.features import FEATURE_DTYPE
+from api.geocache import GEO_CACHE_DIR, GeoCache, parse_product_name
+
+DATA_DIR = "mosdac_data"
+OUT_DIR = "fused_csv"
+MAX_MATCH_KM = 50.0         # reference pixels farther than this from any source pixel get NaN (CTP spacing ~36 km)
+CHUNK_SIZE = 500000         # rows per CSV write
+EARTH_RADIUS_KM = 6371.0
+
+GEO_VARS = {"Latitude", "Longitude", "CSBT_Latitude", "CSBT_Longitude", "time", "X", "Y", "GreyCount"}
+
+# geolocation of every product grid is read once and memory-mapped afterwards
+GEO_CACHE = GeoCache(GEO_CACHE_DIR)
+# index maps already loaded in this process: (src_key, dst_key) -> int32 array
+_INDEX_CACHE = {}
+
+
+def group_by_timestep(paths):
+    """{(satellite, timestep): {product: path}} in time order."""
+    groups = {}
+    for p in paths:
+        info = parse_product_name(p)
+        if info is None:
+            print("SKIP (unrecognised name):", os.path.basename(p))
+            continue
+        groups.setdefault((info["satellite"], info["timestep"]), {})[info["product"]] = p
+    return OrderedDict(sorted(groups.items(), key=lambda kv: kv[0][1]))
+
+
+def read_science(f, grid):
+    """All per-pixel datasets of the product at its valid pixels, fill values -> NaN."""
+    out = {}
+    for name, ds in f.items():
+        if name in GEO_VARS or not isinstance(ds, h5py.Dataset) or ds.size != grid.size:
+            continue
+        arr = grid.valid(ds, FEATURE_DTYPE)
+        fill = ds.attrs.get("_FillValue")
+        if fill is not None:
+            arr[arr == np.asarray(fill).ravel()[0]] = np.nan
+        out[name] = arr
+    return out
+
+
+def _xyz(lat, lon):
+    la, lo = np.radians(lat.astype(np.float64)), np.radians(lon.astype(np.float64))
+    return np.column_stack((np.cos(la) * np.cos(lo), np.cos(la) * np.sin(lo), np.sin(la)))
+
+
+def index_map(src, dst):
+    """
+    For every valid destination pixel, the position of the nearest valid source
+    pixel within src.valid_idx (-1 if farther than MAX_MATCH_KM). Cached in
+    memory and on disk.
+    """
+    src_key, dst_key = f"{src.key}_{src.fingerprint}", f"{dst.key}_{dst.fingerprint}"
+    if (src_key, dst_key) in _INDEX_CACHE:
+        return _INDEX_CACHE[(src_key, dst_key)]
+    path = os.path.join(GEO_CACHE_DIR, f"index_{src_key}__{dst_key}.npy")
+    if os.path.exists(path):
+        idx = np.load(path, mmap_mode="r")
+    else:
+        idx = np.full(dst.n_valid, -1, dtype=np.int32)
+        if src.n_valid and dst.n_valid:
+            tree = cKDTree(_xyz(src.lat[src.valid_idx], src.lon[src.valid_idx]))
+            # chord length on the unit sphere for the great-circle match radius
+            max_chord = 2 * np.sin(MAX_MATCH_KM / EARTH_RADIUS_KM / 2)
+            dist, nn = tree.query(_xyz(dst.lat[dst.valid_idx], dst.lon[dst.valid_idx]),
+                                  distance_upper_bound=max_chord, workers=-1)
+            hit = np.isfinite(dist)
+            idx[hit] = nn[hit]
+        os.makedirs(GEO_CACHE_DIR, exist_ok=True)
+        np.save(path, idx)
+        print(f"  cached index map {src_key} -> {dst_key}")
+    _INDEX_CACHE[(src_key, dst_key)] = idx
+    return idx
+
+
+def fuse_timestep(products):
+    """
+    Read every product of one timestep and return one DataFrame on the finest
+    grid: lat, lon and all science variables (prefixed with the product name on
+    name clashes).
+    """
+    grids = {}
+    for product, path in products.items():
+        with h5py.File(path, "r") as f:
+            grid = GEO_CACHE.get(f, product)
+            if grid is None:
+                print("SKIP (no geo):", os.path.basename(path))
+                continue
+            grids[product] = (grid, read_science(f, grid))
+    if not grids:
+        return None
+
+    ref = max(grids, key=lambda p: grids[p][0].size)
+    ref_grid = grids[ref][0]
+    columns = {"lat": ref_grid.lat[ref_grid.valid_idx].astype(FEATURE_DTYPE),
+               "lon": ref_grid.lon[ref_grid.valid_idx].astype(FEATURE_DTYPE)}
+
+    for product, (grid, variables) in grids.items():
+        same_grid = grid.size == ref_grid.size and grid.fingerprint == ref_grid.fingerprint
+        take = None if same_grid else np.asarray(index_map(grid, ref_grid))
+        for name, arr in variables.items():
+            col = name if name not in columns else f"{product}_{name}"
+            if same_grid:
+                columns[col] = arr
+            else:
+                vals = np.full(take.size, np.nan, dtype=FEATURE_DTYPE)
+                hit = take >= 0
+                vals[hit] = arr[take[hit]]
+                columns[col] = vals
+    return pd.DataFrame(columns)
+
+
+def write_csv(df, out_path, timestep):
+    """Write in chunks (gzip members can be appended) to bound peak memory."""
+    for start in range(0, max(len(df), 1), CHUNK_SIZE):
+        chunk = df.iloc[start:start + CHUNK_SIZE].copy()
+        chunk.insert(0, "time", timestep.isoformat())
+        chunk.to_csv(out_path, index=False, compression="gzip",
+                     mode="w" if start == 0 else "ab", header=start == 0)
+
+
+def main():
+    files = sorted(glob.glob(os.path.join(DATA_DIR, "*.h5")))
+    if not files:
+        print("No .h5 files found in", DATA_DIR)
+        return
+    os.makedirs(OUT_DIR, exist_ok=True)
+    for (satellite, timestep), products in group_by_timestep(files).items():
+        out_path = os.path.join(OUT_DIR, f"{satellite}_{timestep:%Y%m%dT%H%M}.csv.gz")
+        if os.path.exists(out_path):
+            print("SKIP (exists):", out_path)
+            continue
+        try:
+            print(f"Fusing {satellite} {timestep:%Y-%m-%d %H:%M}: {', '.join(sorted(products))}")
+            df = fuse_timestep(products)
+            if df is None:
+                continue
+            write_csv(df, out_path, timestep)
+            print("✔ Fused →", out_path, "rows:", len(df), "cols:", list(df.columns))
+        except Exception as e:
+            print("ERROR fusing", satellite, timestep, e)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,32 @@
+"""
+Gunicorn settings for the API (picked up by `gunicorn api.app:app` run from the repo root).
+
+The app is preloaded: models are loaded and warmed up once in the master
+(api.app warm_start) before the listening socket is opened, and workers fork
+from it with the model memory shared copy-on-write. Threaded workers keep
+admission control and /stream working (see api/admission.py).
+"""
+import gc
+import os
+import time
+
+STARTED = time.monotonic()
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8080')}"
+workers = int(os.getenv("WEB_CONCURRENCY", 2))
+# the preloaded app sizes its per-process shard pool from the worker count (api/app.py SHARD_WORKERS)
+os.environ["WEB_CONCURRENCY"] = str(workers)
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", 8))
+timeout = 120
+preload_app = True
+
+
+def when_ready(server):
+    server.log.info("Ready in %.2fs (app preloaded and warmed up)", time.monotonic() - STARTED)
+
+
+def pre_fork(server, worker):
+    # Move the preloaded objects out of the collector's generations, so collections in the
+    # workers do not write to (and un-share) their pages
+    gc.freeze()
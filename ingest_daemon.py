@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+ingest_daemon.py
+Long-running ingestion for mosdac_data/: every new INSAT-3D L2B .h5 product is
+scored as soon as it has finished landing, and the result is published to the
+risk cache (api/risk_cache.py) that the API serves from /risk-latest.
+
+  watcher  --(bounded queue)-->  workers  -->  risk cache
+The watcher polls DATA_DIR and treats a file as complete once its size and
+mtime have not changed for SETTLE_SECONDS. When the workers fall behind, the
+queue fills up and the watcher blocks instead of reading ahead (backpressure);
+files that land meanwhile are picked up on the next scan.
+
+Only products that carry cloud-top data (CTP and/or CTT, i.e. the L2B CTP
+product) are scored and published. CMK/HEM/IMC files would become all-clear-sky
+grids costing minutes of forest time and would displace the latest cloud
+grid, so they are recorded as skipped.
+
+Each published product logs its end-to-end latency: from the moment the file
+stopped changing on disk to the moment its risk grid was published.
+Processed files are recorded in ingest_state.json so a restart does not
+re-score them.
+
+Usage:
+  python ingest_daemon.py                  # watch mosdac_data/
+  python ingest_daemon.py --skip-existing  # only ingest files that arrive from now on
+"""
+import os
+import time
+import queue
+import signal
+import logging
+import argparse
+import threading
+
+import h5py
+import numpy as np
+import pandas as pd
+
+from api.features import FEATURE_DTYPE
+from api.geocache import GeoCache, product_type, parse_product_name
+from api.predict import load_artifacts, mosdac_features, load_checkpoint, save_checkpoint
+from api.risk_cache import RiskCache
+from api.sharding import ShardedPredictor
+
+DATA_DIR = "mosdac_data"
+STATE_FILE = "ingest_state.json"
+POLL_SECONDS = 2.0          # directory scan interval
+SETTLE_SECONDS = 2.0        # size/mtime unchanged this long -> write complete
+QUEUE_SIZE = 4              # products waiting to be scored (bounded -> backpressure)
+MAX_RETRIES = 3             # attempts for files that fail to open/score
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+logger = logging.getLogger("ingest-daemon")
+
+GEO_CACHE = GeoCache()
+
+
+class Watcher:
+    """Polls a directory and yields .h5 files whose writes have completed."""
+
+    def __init__(self, data_dir, settle=SETTLE_SECONDS):
+        self.data_dir = data_dir
+        self.settle = settle
+        self._pending = {}      # name -> (size, mtime_ns, unchanged_since, first_noticed)
+
+    def scan(self, skip):
+        """Names of complete files not in `skip`, with the time their write finished."""
+        ready = []
+        now = time.time()
+        try:
+            entries = list(os.scandir(self.data_dir))
+        except FileNotFoundError:
+            return ready
+        seen = set()
+        for entry in entries:
+            if not entry.name.endswith(".h5") or not entry.is_file() or entry.name in skip:
+                continue
+            seen.add(entry.name)
+            st = entry.stat()
+            sig = (st.st_size, st.st_mtime_ns)
+            prev = self._pending.get(entry.name)
+            if prev is None or prev[:2] != sig:
+                self._pending[entry.name] = sig + (now, prev[3] if prev else now)
+                continue
+            if now - st.st_mtime >= self.settle and now - prev[2] >= self.settle:
+                # copies that preserve an old mtime count from when they were first noticed
+                ready.append((entry.name, max(st.st_mtime, prev[3])))
+                del self._pending[entry.name]
+        for name in set(self._pending) - seen:  # deleted before it settled
+            del self._pending[name]
+        return sorted(ready, key=lambda item: item[1])
+
+
+class NoCloudData(Exception):
+    """The product has no CTP/CTT datasets, so there is nothing to score."""
+
+
+def score_product(path, artifacts, predictor):
+    """
+    Score the valid pixels of one L2B file. Returns (lat, lon, codes, proba_max, satellite inputs).
+    Raises NoCloudData for products without CTP/CTT.
+    """
+    scaler, model, features = artifacts
+    with h5py.File(path, "r") as f:
+        if "CTP" not in f and "CTT" not in f:
+            raise NoCloudData("no CTP/CTT datasets")
+        grid = GEO_CACHE.get(f, product_type(path))
+        if grid is None:
+            raise ValueError("no geolocation datasets")
+        ctp, ctt = f.get("CTP"), f.get("CTT")
+        df = pd.DataFrame({
+            "lat": grid.lat[grid.valid_idx].astype(FEATURE_DTYPE),
+            "lon": grid.lon[grid.valid_idx].astype(FEATURE_DTYPE),
+            "CTP": grid.valid(ctp, FEATURE_DTYPE) if ctp is not None else np.nan,
+            "CTT": grid.valid(ctt, FEATURE_DTYPE) if ctt is not None else np.nan,
+            "lat_bin": grid.lat_bin,
+            "lon_bin": grid.lon_bin,
+        })
+    X = mosdac_features(df, features).astype(FEATURE_DTYPE)
+    preds, probs, _ = predictor.predict(X, scaler)
+    codes = np.searchsorted(model.classes_, preds).astype(np.uint8)
+    proba_max = probs.max(axis=1) if probs is not None else np.ones(len(codes))
+    inputs = {c: df[c].to_numpy() for c in ("CTP", "CTT")}
+    return df["lat"].to_numpy(), df["lon"].to_numpy(), codes, proba_max, inputs
+
+
+class IngestDaemon:
+    def __init__(self, data_dir=DATA_DIR, state_path=STATE_FILE, n_workers=1,
+                 queue_size=QUEUE_SIZE, poll=POLL_SECONDS, settle=SETTLE_SECONDS):
+        self.data_dir = data_dir
+        self.state_path = state_path
+        self.poll = poll
+        self.watcher = Watcher(data_dir, settle)
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.stop_event = threading.Event()
+        self.state = load_checkpoint(state_path)
+        self.state_lock = threading.Lock()
+        self.in_flight = set()
+        self.failures = {}
+        self.cache = RiskCache()
+        self.artifacts = load_artifacts()
+        self.predictor = ShardedPredictor(self.artifacts[1])
+        self.n_workers = n_workers
+
+    def mark_existing(self):
+        """Record every file already present as done, so only new arrivals are ingested."""
+        for name in sorted(os.listdir(self.data_dir)) if os.path.isdir(self.data_dir) else []:
+            if name.endswith(".h5"):
+                self.state.setdefault(name, {"skipped": True})
+        save_checkpoint(self.state_path, self.state)
+
+    def _skip(self):
+        with self.state_lock:
+            return set(self.state) | self.in_flight | {n for n, k in self.failures.items() if k >= MAX_RETRIES}
+
+    def watch(self):
+        while not self.stop_event.is_set():
+            for name, landed_at in self.watcher.scan(self._skip()):
+                with self.state_lock:
+                    self.in_flight.add(name)
+                # blocks while the workers are saturated (backpressure)
+                while not self.stop_event.is_set():
+                    try:
+                        self.queue.put((name, landed_at), timeout=0.5)
+                        break
+                    except queue.Full:
+                        continue
+                if self.stop_event.is_set():
+                    return
+            self.stop_event.wait(self.poll)
+
+    def work(self):
+        while not self.stop_event.is_set() or not self.queue.empty():
+            try:
+                name, landed_at = self.queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            try:
+                self.ingest(name, landed_at)
+            finally:
+                with self.state_lock:
+                    self.in_flight.discard(name)
+                self.queue.task_done()
+
+    def ingest(self, name, landed_at):
+        path = os.path.join(self.data_dir, name)
+        t0 = time.time()
+        try:
+            st = os.stat(path)
+            lat, lon, codes, proba_max, inputs = score_product(path, self.artifacts, self.predictor)
+        except NoCloudData as e:
+            with self.state_lock:
+                self.state[name] = {"skipped": str(e)}
+                save_checkpoint(self.state_path, self.state)
+            logger.info(f"Skipping {name}: {e}")
+            return
+        except Exception as e:
+            with self.state_lock:
+                self.failures[name] = self.failures.get(name, 0) + 1
+                tries = self.failures[name]
+            logger.error(f"ERROR ingesting {name} (attempt {tries}/{MAX_RETRIES}): {e}")
+            return
+        scored_at = time.time()
+        info = parse_product_name(name)
+        meta = {
+            "file": name,
+            "product": info["product"] if info else product_type(name),
+            "timestep": info["timestep"].isoformat() if info else None,
+            "landed_at": landed_at,
+            "wait_s": round(t0 - landed_at, 3),       # settle + queue time
+            "score_s": round(scored_at - t0, 3),
+            "latency_s": round(time.time() - landed_at, 3),
+        }
+        summary = self.cache.publish(meta, lat, lon, codes, proba_max, self.artifacts[1].classes_, inputs)
+        if summary is None:
+            # a newer timestep was published meanwhile (e.g. by another worker)
+            with self.state_lock:
+                self.state[name] = {"size": st.st_size, "mtime": st.st_mtime, "rows": int(codes.size),
+                                    "skipped": "older than the published timestep"}
+                save_checkpoint(self.state_path, self.state)
+            return
+        latency = summary["latency_s"]
+        with self.state_lock:
+            self.state[name] = {"size": st.st_size, "mtime": st.st_mtime, "rows": int(codes.size),
+                                "latency_s": round(latency, 3), "seq": summary["seq"]}
+            save_checkpoint(self.state_path, self.state)
+        logger.info(f"✔ {name} → rows: {codes.size}  latency: {latency:.2f}s "
+                    f"(waited {meta['wait_s']:.2f}s, scored {meta['score_s']:.2f}s)  "
+                    f"counts: {summary['class_counts']}")
+
+    def run(self):
+        workers = [threading.Thread(target=self.work, name=f"ingest-worker-{i}", daemon=True)
+                   for i in range(self.n_workers)]
+        for w in workers:
+            w.start()
+        logger.info(f"Watching {os.path.abspath(self.data_dir)} (queue={self.queue.maxsize}, workers={self.n_workers})")
+        try:
+            self.watch()
+        finally:
+            self.stop_event.set()
+            for w in workers:
+                w.join()
+            self.predictor.shutdown()
+            logger.info("Ingest daemon stopped")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Watch a MOSDAC data directory and score new products")
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument("--state", default=STATE_FILE, help="Processed-file state (resume on restart)")
+    parser.add_argument("--workers", type=int, default=1, help="Products scored concurrently")
+    parser.add_argument("--queue-size", type=int, default=QUEUE_SIZE, help="Max products waiting to be scored")
+    parser.add_argument("--poll", type=float, default=POLL_SECONDS, help="Directory scan interval (s)")
+    parser.add_argument("--settle", type=float, default=SETTLE_SECONDS,
+                        help="Seconds a file must stay unchanged before it is ingested")
+    parser.add_argument("--skip-existing", action="store_true", help="Ignore files already in the directory")
+    args = parser.parse_args()
+
+    daemon = IngestDaemon(args.data_dir, args.state, n_workers=args.workers,
+                          queue_size=args.queue_size, poll=args.poll, settle=args.settle)
+    if args.skip_existing:
+        daemon.mark_existing()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: daemon.stop_event.set())
+    daemon.run()
+
+
+if __name__ == "__main__":
+    main()
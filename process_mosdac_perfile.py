@@ -9,12 +9,16 @@ import h5py
 import numpy as np
 import pandas as pd
 from datetime import datetime, timedelta
+from api.features import FEATURE_DTYPE
+from api.geocache import GeoCache, product_type
 
 DATA_DIR = "mosdac_data"
 OUT_DIR = "processed_csv"
 VARS = ["Latitude","Longitude","time","CTP","CTT"]
 
 os.makedirs(OUT_DIR, exist_ok=True)
+# Lat/lon and the valid-pixel index are identical across timesteps; computed once, memory-mapped afterwards
+GEO_CACHE = GeoCache()
 
 def h5_time_to_iso(h5_time_array):
     try:
@@ -32,9 +36,9 @@ def h5_time_to_iso(h5_time_array):
 
 def flat_or_fill(ds, n):
     if ds is None:
-        return np.full(n, np.nan)
-    arr = np.array(ds)
-    return arr.ravel() if arr.size else np.full(n, np.nan)
+        return np.full(n, np.nan, dtype=FEATURE_DTYPE)
+    arr = np.asarray(ds, dtype=FEATURE_DTYPE)
+    return arr.ravel() if arr.size else np.full(n, np.nan, dtype=FEATURE_DTYPE)
 
 files = sorted(glob.glob(os.path.join(DATA_DIR, "*.h5")))
 if not files:
@@ -49,24 +53,20 @@ for p in files:
         continue
     try:
         with h5py.File(p, "r") as f:
-            # prefer Latitude/Longitude, fall back to CSBT_*
-            lat_ds = f.get("Latitude") or f.get("CSBT_Latitude")
-            lon_ds = f.get("Longitude") or f.get("CSBT_Longitude")
-            if lat_ds is None or lon_ds is None:
+            # prefer Latitude/Longitude, fall back to CSBT_* (cached per product/grid shape)
+            grid = GEO_CACHE.get(f, product_type(p))
+            if grid is None:
                 print("SKIP (no geo):", base)
                 continue
-
-            lat = np.array(lat_ds)
-            lon = np.array(lon_ds)
-            n = lat.size
+            n = grid.size
 
             # read other vars if present
             ctp = f.get("CTP")
             ctt = f.get("CTT")
             time_ds = f.get("time")
 
-            lat_flat = lat.ravel()
-            lon_flat = lon.ravel()
+            lat_flat = grid.lat
+            lon_flat = grid.lon
             ctp_flat = flat_or_fill(ctp, n)
             ctt_flat = flat_or_fill(ctt, n)
             # convert time to iso strings (handles single timestamp or per-pixel)
@@ -82,9 +82,8 @@ for p in files:
                     # fallback: broadcast first
                     times = [tlist[0]] * n
 
-            # mask out fill values (latitude fill in these products is 32767)
-            valid_mask = (lat_flat != 32767) & (~np.isnan(lat_flat)) & (~np.isnan(lon_flat))
-            valid_idx = np.where(valid_mask)[0]
+            # fill values (latitude fill in these products is 32767) are already excluded
+            valid_idx = grid.valid_idx
             if valid_idx.size == 0:
                 print("NO VALID PIXELS:", base)
                 # still create an empty small CSV with header for bookkeeping
@@ -100,10 +99,11 @@ for p in files:
                 rows = {
                     "source_file": [base]*sel.size,
                     "time": [times[i] for i in sel],
-                    "lat": lat_flat[sel].astype(float),
-                    "lon": lon_flat[sel].astype(float),
-                    "CTP": [float(x) if (not np.isnan(x)) else None for x in ctp_flat[sel]],
-                    "CTT": [float(x) if (not np.isnan(x)) else None for x in ctt_flat[sel]],
+                    "lat": lat_flat[sel].astype(FEATURE_DTYPE),
+                    "lon": lon_flat[sel].astype(FEATURE_DTYPE),
+                    # NaN is written as an empty field, same as None
+                    "CTP": ctp_flat[sel],
+                    "CTT": ctt_flat[sel],
                 }
                 df = pd.DataFrame(rows)
                 # append or write
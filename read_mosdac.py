@@ -10,6 +10,8 @@ import h5py
 import numpy as np
 import pandas as pd
 from datetime import datetime, timedelta
+from api.features import FEATURE_DTYPE
+from api.geocache import GeoCache, product_type
 
 DATA_DIR = "mosdac_data"        # change if your download path differs
 OUT_CSV = "mosdac_flat.csv.gz"  # gzipped CSV
@@ -24,6 +26,9 @@ VARS = [
 ]
 # Optionally include radiances / other arrays you saw (CLRFR_TIR1, CSBT_TIR1, etc.)
 
+# Lat/lon are identical across timesteps of a product; read them once and memory-map afterwards
+GEO_CACHE = GeoCache()
+
 # Optional bounding box filter (lon_min, lat_min, lon_max, lat_max) or None
 BBOX = None
 # BBOX = (68.0, 6.0, 98.0, 37.0)  # example you used earlier
@@ -55,14 +60,10 @@ def process_file(path, bbox=None):
                 # try some common alternatives
                 pass
 
-        # read arrays
-        try:
-            lat = f["Latitude"][:]
-            lon = f["Longitude"][:]
-        except KeyError:
-            # try Geo arrays if present
-            lat = f.get("CSBT_Latitude")[:] if "CSBT_Latitude" in f else None
-            lon = f.get("CSBT_Longitude")[:] if "CSBT_Longitude" in f else None
+        # geolocation from the cache (Latitude/Longitude, falling back to CSBT_*)
+        grid = GEO_CACHE.get(f, product_type(path))
+        lat = grid.lat if grid is not None else None
+        lon = grid.lon if grid is not None else None
 
         # read CTP/CTT if present
         ctp = f["CTP"][:] if "CTP" in f else None
@@ -74,7 +75,9 @@ def process_file(path, bbox=None):
 
         # flatten arrays to 1D rows (assume 2D grids with same shape)
         def flat(x):
-            return np.array(x).ravel() if x is not None else np.full(lat.size, np.nan)
+            if x is None:
+                return np.full(lat.size, np.nan, dtype=FEATURE_DTYPE)
+            return np.asarray(x, dtype=FEATURE_DTYPE).ravel()
 
         lat_flat = flat(lat)
         lon_flat = flat(lon)
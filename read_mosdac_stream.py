@@ -3,34 +3,40 @@ import os, glob
 import h5py
 import numpy as np
 import pandas as pd
+from api.features import FEATURE_DTYPE
+from api.geocache import GeoCache, product_type
 
 DATA_DIR = "mosdac_data"
 OUT_CSV = "mosdac_flat.csv"
 
+# Lat/lon are identical across timesteps of a product; read them once and memory-map afterwards
+GEO_CACHE = GeoCache()
+
 # Write header once
 HEADER_WRITTEN = False
 
 def flat(arr, size):
-    return np.array(arr).ravel() if arr is not None else np.full(size, np.nan)
+    if arr is None:
+        return np.full(size, np.nan, dtype=FEATURE_DTYPE)
+    return np.asarray(arr, dtype=FEATURE_DTYPE).ravel()
 
 def process_file(path, out_file):
     global HEADER_WRITTEN
 
     with h5py.File(path, "r") as f:
-        # read variables
-        lat = f.get("Latitude")
-        lon = f.get("Longitude")
+        # read variables (lat/lon come from the geolocation cache)
+        grid = GEO_CACHE.get(f, product_type(path))
         ctp = f.get("CTP")
         ctt = f.get("CTT")
         time = f.get("time")
 
         # basic sanity
-        if lat is None or lon is None:
+        if grid is None:
             print(f"Skipping {path} — no lat/lon")
             return
 
-        lat = lat[:]
-        lon = lon[:]
+        lat = grid.lat
+        lon = grid.lon
         size = lat.size
 
         # flatten
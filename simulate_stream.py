@@ -82,6 +82,25 @@ def send_row_to_api(row):
     if pred_text and str(pred_text).lower().startswith("severe"):
         print("⚠ ALERT! Severe turbulence detected!")
 
+def listen(region=None):
+    """Print pipeline updates pushed by /stream instead of polling the model per row."""
+    url = API_URL.rsplit("/", 1)[0] + "/stream"
+    params = {"region": region} if region else None
+    with requests.get(url, params=params, stream=True, timeout=(10, None)) as resp:
+        resp.raise_for_status()
+        event = None
+        for line in resp.iter_lines(decode_unicode=True):
+            if line.startswith("event:"):
+                event = line.split(":", 1)[1].strip()
+            elif line.startswith("data:"):
+                data = json.loads(line.split(":", 1)[1])
+                if event == "prediction":
+                    print(f"▶ {data['timestep']} {data['product']}: {data['risk_summary']}")
+                elif event == "alert":
+                    print(f"⚠ ALERT! Severe turbulence in {len(data['cells'])} cells, e.g. {data['cells'][0]}")
+            elif not line:
+                event = None
+
 def simulate(csv_path):
     df = pd.read_csv(csv_path)
     print(f"Streaming {len(df)} samples...")
@@ -93,7 +112,11 @@ def simulate(csv_path):
 
 if __name__ == "__main__":
     import sys
+    if len(sys.argv) >= 2 and sys.argv[1] == "--listen":
+        listen(sys.argv[2] if len(sys.argv) > 2 else None)
+        exit(0)
     if len(sys.argv) != 2:
         print("Usage: python simulate_stream.py <csv_file>")
+        print("       python simulate_stream.py --listen [lat_min,lat_max,lon_min,lon_max]")
         exit(1)
     simulate(sys.argv[1])
\ No newline at end of file
@@ -0,0 +1,24 @@
+"""
+Shared test setup. api.app reads its configuration from the environment at
+import time, so every on-disk store is pointed at a throwaway directory before
+any test imports it.
+"""
+import os
+import sys
+import shutil
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+_SCRATCH = tempfile.mkdtemp(prefix="turbulence-tests-")
+for key, sub in (("JOB_DIR", "jobs"), ("GEO_CACHE_DIR", "geo_cache"), ("RISK_CACHE_DIR", "risk_cache"),
+                 ("HISTORY_DIR", "history"), ("PROFILE_DIR", "profiles"), ("H5_SCRATCH_DIR", "scratch")):
+    os.environ.setdefault(key, os.path.join(_SCRATCH, sub))
+    os.makedirs(os.environ[key], exist_ok=True)
+os.environ.setdefault("WARM_START", "0")
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(_SCRATCH, ignore_errors=True)
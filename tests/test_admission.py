@@ -0,0 +1,121 @@
+import io
+import os
+import threading
+import time
+
+import pytest
+
+import api.app as app_module
+from api.admission import AdmissionController, AdmissionPool
+from api.features import FEATURES
+from api.jobs import JobStore
+
+
+def test_pool_rejects_when_queue_is_full():
+    pool = AdmissionPool("heavy", max_concurrent=1, max_queue=0, wait_timeout=5)
+    assert pool.acquire()
+    assert not pool.acquire()
+    pool.release(2.0)
+    assert pool.acquire()
+    assert pool.stats()["rejected"] == 1
+
+
+def test_pool_waiter_times_out_and_gets_retry_estimate():
+    pool = AdmissionPool("heavy", max_concurrent=1, max_queue=1, wait_timeout=0.05)
+    assert pool.acquire()
+    t0 = time.monotonic()
+    assert not pool.acquire()
+    assert time.monotonic() - t0 >= 0.05
+    pool.release(4.0)
+    assert pool.retry_after() == 4
+
+
+def test_pool_waiter_gets_released_slot():
+    pool = AdmissionPool("heavy", max_concurrent=1, max_queue=1, wait_timeout=5)
+    assert pool.acquire()
+    got = []
+    waiter = threading.Thread(target=lambda: got.append(pool.acquire()))
+    waiter.start()
+    time.sleep(0.05)
+    pool.release()
+    waiter.join(5)
+    assert got == [True] and pool.stats()["active"] == 1
+
+
+def test_controller_routes_pools():
+    heavy = AdmissionPool("heavy", 1, 0, 0)
+    light = AdmissionPool("light", 1, 0, 0)
+    ctl = AdmissionController({"heavy": heavy, "light": light}, heavy_endpoints=["process_h5"], exempt=["health"])
+    assert ctl.pool_for("process_h5") is heavy
+    assert ctl.pool_for("predict") is light
+    assert ctl.pool_for("health") is None and ctl.pool_for(None) is None
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    if app_module.MODEL is None:
+        pytest.skip("model artifacts not available")
+    jobs = JobStore(str(tmp_path / "jobs"), workers=1)
+    jobs.start(app_module.run_job)
+    monkeypatch.setattr(app_module, "JOBS", jobs)
+    monkeypatch.setitem(app_module.ADMISSION.pools, "heavy", AdmissionPool("heavy", 1, 0, 0))
+    return app_module.app.test_client()
+
+
+def csv_upload(rows=3):
+    header = ",".join(FEATURES)
+    body = "\n".join([header] + [",".join(str(i + 1) for i in range(len(FEATURES)))] * rows) + "\n"
+    return {"file": (io.BytesIO(body.encode()), "batch.csv")}
+
+
+def test_rejected_heavy_request_stores_nothing(client):
+    pool = app_module.ADMISSION.pools["heavy"]
+    assert pool.acquire()
+    try:
+        resp = client.post("/predict-batch", data=csv_upload(), content_type="multipart/form-data")
+    finally:
+        pool.release()
+    assert resp.status_code == 429 and "Retry-After" in resp.headers
+    assert os.listdir(app_module.JOBS.blob_dir) == []
+    assert app_module.JOBS.pending == 0
+
+
+def test_sync_heavy_request_is_cached_without_blob(client):
+    first = client.post("/predict-batch", data=csv_upload(), content_type="multipart/form-data")
+    assert first.status_code == 200 and "X-Job-Id" in first.headers
+    second = client.post("/predict-batch", data=csv_upload(), content_type="multipart/form-data")
+    assert second.headers.get("X-Cache") == "hit"
+    assert second.get_json() == first.get_json()
+    assert os.listdir(app_module.JOBS.blob_dir) == []
+    assert app_module.ADMISSION.pools["heavy"].stats()["active"] == 0
+
+
+def test_failed_sync_request_stores_nothing(client):
+    resp = client.post("/predict-batch", data={"file": (io.BytesIO(b"\xff\xfe"), "bad.csv")},
+                       content_type="multipart/form-data")
+    assert resp.status_code >= 400
+    assert os.listdir(app_module.JOBS.blob_dir) == []
+
+
+def test_async_request_stores_blob_for_replay(client):
+    resp = client.post("/predict-batch?async=1", data=csv_upload(), content_type="multipart/form-data")
+    assert resp.status_code == 202
+    assert len(os.listdir(app_module.JOBS.blob_dir)) == 1
+    job_id = resp.get_json()["id"]
+    deadline = time.monotonic() + 30
+    while app_module.JOBS.get(job_id)["status"] not in ("done", "failed") and time.monotonic() < deadline:
+        time.sleep(0.05)
+    job = app_module.JOBS.get(job_id)
+    assert job["status"] == "done" and job["result"]["total_records"] == 3
+
+
+def test_job_spec_leaves_out_credentials():
+    with app_module.app.test_request_context("/predict-batch?profile_token=s3cret&profile_mode=sample&layout=columns",
+                                             method="POST", data=b"lat\n1\n", content_type="text/csv"):
+        spec = app_module.job_spec()
+    with app_module.app.test_request_context("/predict-batch?layout=columns",
+                                             method="POST", data=b"lat\n1\n", content_type="text/csv"):
+        plain = app_module.job_spec()
+    assert spec["query"] == [["layout", "columns"]]
+    assert "s3cret" not in repr(spec)
+    assert app_module.JOBS.job_key(spec) == app_module.JOBS.job_key(plain)
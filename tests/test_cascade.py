@@ -0,0 +1,85 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from api.cascade import agreement, cascade_predict, identical_rows
+from api.features import FEATURES
+
+
+@pytest.fixture(scope="module")
+def forest():
+    app_module = pytest.importorskip("api.app")
+    if app_module.MODEL is None:
+        pytest.skip("model artifacts not available")
+    return lambda X: app_module.score_features(X, app_module.SCALER, "full")
+
+
+def grid_frame(n=400, clear_share=0.6, seed=0):
+    rng = np.random.default_rng(seed)
+    X = pd.DataFrame(rng.uniform(0, 60, (n, len(FEATURES))), columns=FEATURES)
+    clear = rng.random(n) < clear_share
+    X.loc[clear, :] = 0.0  # clear sky: every input is the same constant
+    X.loc[clear, "surface_pressure"] = 1013.0
+    return X, clear
+
+
+def test_exact_mode_is_bitwise_identical_to_exhaustive(forest):
+    X, clear = grid_frame()
+    ref_preds, ref_probs = forest(X)
+    preds, probs, stats = cascade_predict(X, forest, prefilter=clear, mode="exact")
+    np.testing.assert_array_equal(preds, ref_preds)
+    np.testing.assert_array_equal(probs, ref_probs)
+    assert stats["collapsed_rows"] == clear.sum()
+    assert stats["full_model_rows"] == len(X) - clear.sum()
+
+
+def test_prefilter_rows_that_differ_are_not_collapsed(forest):
+    X, clear = grid_frame(seed=1)
+    X.loc[np.flatnonzero(clear)[0], "wind_speed_10m"] = 42.0
+    ref_preds, ref_probs = forest(X)
+    preds, probs, stats = cascade_predict(X, forest, prefilter=clear, mode="exact")
+    assert stats["collapsed_rows"] == 0
+    np.testing.assert_array_equal(preds, ref_preds)
+    np.testing.assert_array_equal(probs, ref_probs)
+
+
+def test_cheap_model_only_settles_confident_accepted_classes():
+    X = pd.DataFrame({"x": np.arange(6, dtype=float)})
+    cheap_preds = np.array(["Low", "Low", "Severe", "Low", "Moderate", "Low"])
+    cheap_conf = np.array([0.95, 0.5, 0.99, 0.9, 0.99, 0.91])
+
+    def cheap(part):
+        rows = part.index.to_numpy()
+        probs = np.column_stack([cheap_conf[rows], 1 - cheap_conf[rows]])
+        return cheap_preds[rows], probs
+
+    full_calls = []
+
+    def full(part):
+        full_calls.append(part.index.to_numpy())
+        return np.full(len(part), "Full", dtype=object), np.full((len(part), 2), 0.5)
+
+    preds, probs, stats = cascade_predict(X, full, cheap, mode="fast", confidence=0.9, accept=["Low"])
+    assert preds.tolist() == ["Low", "Full", "Full", "Low", "Full", "Low"]
+    np.testing.assert_array_equal(np.concatenate(full_calls), [1, 2, 4])
+    assert stats["cheap_rows"] == 3 and stats["full_model_rows"] == 3
+
+
+def test_off_mode_scores_everything_with_the_forest():
+    X = pd.DataFrame({"x": np.zeros(5)})
+    preds, _, stats = cascade_predict(X, lambda p: (np.zeros(len(p)), None), prefilter=np.ones(5, bool), mode="off")
+    assert stats["collapsed_rows"] == 0 and stats["full_model_rows"] == 5
+
+
+def test_identical_rows_treats_nan_as_equal():
+    arr = np.array([[1.0, np.nan], [1.0, np.nan], [1.0, 2.0]])
+    assert identical_rows(arr, np.array([0, 1]))
+    assert not identical_rows(arr, np.array([0, 2]))
+
+
+def test_agreement_reports_changed_rows():
+    report = agreement(np.array(["Low", "Severe"]), np.array([[0.9, 0.1], [0.2, 0.8]]),
+                       np.array(["Low", "Low"]), np.array([[0.9, 0.1], [0.6, 0.4]]))
+    assert report["changed_rows"] == 1 and report["label_agreement"] == 0.5
+    assert report["confusion"] == {"Low->Low": 1, "Low->Severe": 1}
+    assert report["max_prob_diff"] == 0.4
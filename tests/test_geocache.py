@@ -0,0 +1,57 @@
+import os
+
+import h5py
+import numpy as np
+
+from api.geocache import FILL_VALUE, GeoCache
+
+
+def write_product(path, lat, lon):
+    with h5py.File(path, "w") as f:
+        f["Latitude"] = lat
+        f["Longitude"] = lon
+    return path
+
+
+def grid_coords(shift=0.0):
+    lat, lon = np.meshgrid(np.linspace(-10, 10, 6), np.linspace(70, 80, 5) + shift, indexing="ij")
+    lat[0, 0] = FILL_VALUE
+    return lat.astype(np.float32), lon.astype(np.float32)
+
+
+def cached(cache, path, product="CTP"):
+    with h5py.File(path, "r") as f:
+        return cache.get(f, product)
+
+
+def test_grid_is_persisted_as_a_versioned_entry(tmp_path):
+    path = write_product(tmp_path / "a.h5", *grid_coords())
+    grid = cached(GeoCache(str(tmp_path / "cache")), path)
+    assert grid.n_valid == 29 and grid.valid_idx[0] == 1
+    entry = tmp_path / "cache" / grid.key
+    version = (entry / "current").read_text()
+    assert sorted(os.listdir(entry / version)) == sorted([f"{n}.npy" for n in GeoCache.FILES] + ["meta.json"])
+    reloaded = cached(GeoCache(str(tmp_path / "cache")), path)
+    assert isinstance(reloaded.lat, np.memmap)
+    np.testing.assert_array_equal(reloaded.valid_idx, grid.valid_idx)
+
+
+def test_longitude_change_rebuilds_without_touching_mapped_arrays(tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    old = cached(GeoCache(cache_dir), write_product(tmp_path / "a.h5", *grid_coords()))
+    old_lon = np.array(old.lon)
+    lat, lon = grid_coords(shift=0.5)  # same Latitude, shifted Longitude
+    new = cached(GeoCache(cache_dir), write_product(tmp_path / "b.h5", lat, lon))
+    assert new.key == old.key and new.sample_fp != old.sample_fp
+    np.testing.assert_array_equal(np.asarray(new.lon), lon.ravel())
+    np.testing.assert_array_equal(np.asarray(old.lon), old_lon)  # the old mapping still reads its own file
+    assert len([n for n in os.listdir(tmp_path / "cache" / old.key) if not n.startswith(".")]) == 2
+
+
+def test_unknown_products_are_keyed_by_shape_and_fingerprint(tmp_path):
+    cache = GeoCache(str(tmp_path / "cache"))
+    a = cached(cache, write_product(tmp_path / "a.h5", *grid_coords()), product="unknown")
+    b = cached(cache, write_product(tmp_path / "b.h5", *grid_coords(shift=3.0)), product="unknown")
+    again = cached(cache, write_product(tmp_path / "c.h5", *grid_coords()), product="unknown")
+    assert a.key != b.key and again.key == a.key
+    assert a.key.startswith("unknown_6x5_")
@@ -0,0 +1,145 @@
+import os
+import time
+import threading
+
+import numpy as np
+import pytest
+
+from api import history as history_module
+from api.history import PredictionHistory
+
+LABELS = np.array(["Low", "Moderate", "Severe"], dtype=object)
+T0 = 1_718_668_800  # 2024-06-18T00:00:00Z
+
+
+def fill(history, batches=6, rows=50, seed=0):
+    rng = np.random.default_rng(seed)
+    for i in range(batches):
+        history.append(rng.integers(0, 3, rows), LABELS, proba_max=rng.uniform(0.4, 1, rows),
+                       lat_bin=rng.integers(5, 9, rows).astype(float), lon_bin=rng.integers(70, 73, rows).astype(float),
+                       ts=T0 + (batches - i) * 1800)  # newest first, so compaction has to sort
+
+
+def totals(history, **kwargs):
+    labels, _, counts = history.aggregate(group_by="total", **kwargs)
+    return dict(zip(labels, counts[0].tolist()))
+
+
+def test_compaction_preserves_aggregates(tmp_path):
+    history = PredictionHistory(str(tmp_path), compact_rows=10 ** 9)
+    fill(history)
+    before = {g: history.aggregate(group_by=g) for g in ("hour", "cell")}
+    assert history.compact() == 300
+    assert history.stats()["active_rows"] == 0 and history.stats()["segments"] == 1
+    for group_by, (labels, keys, counts) in before.items():
+        after = history.aggregate(group_by=group_by)
+        assert after[0] == labels
+        for name in keys:
+            np.testing.assert_array_equal(after[1][name], keys[name])
+        np.testing.assert_array_equal(after[2], counts)
+    seg = os.path.join(history.segment_dir, history._read_meta()["segments"][0])
+    with np.load(seg) as npz:
+        assert np.all(np.diff(npz["ts"].astype(np.int64)) >= 0)
+
+
+def test_repeated_compactions_merge_rollups(tmp_path):
+    history = PredictionHistory(str(tmp_path), compact_rows=10 ** 9)
+    fill(history, seed=1)
+    history.compact()
+    fill(history, seed=2)
+    history.compact()
+    fill(history, batches=2, seed=3)  # left active
+    assert sum(totals(history).values()) == 700
+    assert history.stats()["segments"] == 2
+    assert len([n for n in os.listdir(tmp_path) if n.startswith("rollup_")]) == 1
+
+
+def test_filters_apply_to_compacted_and_active_rows(tmp_path):
+    history = PredictionHistory(str(tmp_path), compact_rows=10 ** 9)
+    history.append([0, 1, 2], LABELS, lat_bin=[5, 6, np.nan], lon_bin=[70, 71, np.nan], ts=T0)
+    history.compact()
+    history.append([2, 2], LABELS, lat_bin=[5, 5], lon_bin=[70, 70], ts=T0 + 7200)
+    assert totals(history) == {"Low": 1, "Moderate": 1, "Severe": 3}
+    assert totals(history, region=(5, 5, 70, 70)) == {"Low": 1, "Moderate": 0, "Severe": 2}
+    assert totals(history, start=T0 + 3600) == {"Low": 0, "Moderate": 0, "Severe": 2}
+
+
+def test_crash_before_truncation_does_not_double_count(tmp_path, monkeypatch):
+    history = PredictionHistory(str(tmp_path), compact_rows=10 ** 9)
+    fill(history, batches=2)
+    expected = totals(history)
+
+    def crash(path, length):
+        raise OSError("simulated crash")
+    with monkeypatch.context() as m:
+        m.setattr(history_module.os, "truncate", crash)
+        with pytest.raises(OSError):
+            history.compact()
+    assert totals(history) == expected  # rows are in the rollup and skipped in the active files
+    history.append([0], LABELS, ts=T0)
+    history.compact()
+    expected["Low"] += 1
+    assert totals(history) == expected
+
+
+def test_uneven_columns_are_trimmed(tmp_path):
+    history = PredictionHistory(str(tmp_path), compact_rows=10 ** 9)
+    history.append([0, 1], LABELS, ts=T0)
+    with open(history._column_path("ts"), "ab") as fh:
+        fh.write(b"\x00\x00")  # half-written row
+    history.append([2], LABELS, ts=T0)
+    assert totals(history) == {"Low": 1, "Moderate": 1, "Severe": 1}
+
+
+def test_background_compaction_triggers_at_threshold(tmp_path):
+    history = PredictionHistory(str(tmp_path), compact_rows=100)
+    fill(history, batches=3)
+    for _ in range(200):
+        if not history._compacting.is_set() and history.stats()["segments"]:
+            break
+        time.sleep(0.01)
+    assert history.stats()["segments"] >= 1
+    assert sum(totals(history).values()) == 150
+
+
+def test_meta_is_written_only_when_labels_or_versions_change(tmp_path, monkeypatch):
+    history = PredictionHistory(str(tmp_path), compact_rows=10 ** 9)
+    writes = []
+    write_meta = history._write_meta
+    monkeypatch.setattr(history, "_write_meta", lambda meta: writes.append(1) or write_meta(meta))
+    history.append([0, 1], LABELS, ts=T0, version="v1")
+    assert len(writes) == 1
+    for _ in range(5):
+        history.append([2], LABELS, ts=T0, version="v1")
+    assert len(writes) == 1
+    history.append([0], LABELS, ts=T0, version="v2")
+    assert len(writes) == 2 and history.stats()["versions"] == ["v1", "v2"]
+
+
+def test_aggregate_sees_consistent_snapshots_during_compaction(tmp_path):
+    history = PredictionHistory(str(tmp_path), compact_rows=10 ** 9)
+    done, seen, errors = threading.Event(), [], []
+
+    def writer():
+        try:
+            for i in range(40):
+                history.append(np.zeros(50, dtype=int), LABELS, ts=T0 + i)
+                history.compact()
+        finally:
+            done.set()
+
+    def reader():
+        try:
+            while not done.is_set():
+                seen.append(sum(totals(history).values()))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=writer), threading.Thread(target=reader)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not errors
+    assert all(n % 50 == 0 for n in seen) and seen == sorted(seen)
+    assert sum(totals(history).values()) == 2000
@@ -0,0 +1,15 @@
+import h5py
+import numpy as np
+import pytest
+
+import ingest_daemon
+
+
+def test_products_without_cloud_data_are_not_scored(tmp_path):
+    path = tmp_path / "3DIMG_18JUN2024_0000_L2B_CMK_V01R00.h5"
+    with h5py.File(path, "w") as f:
+        f["Latitude"] = np.zeros((4, 4), dtype=np.int16)
+        f["Longitude"] = np.zeros((4, 4), dtype=np.int16)
+        f["CMK"] = np.zeros((4, 4), dtype=np.uint8)
+    with pytest.raises(ingest_daemon.NoCloudData):
+        ingest_daemon.score_product(str(path), (None, None, None), predictor=None)
@@ -0,0 +1,79 @@
+import io
+import os
+import time
+
+from api.jobs import JobStore
+
+
+def spec_for(store, payload=b"lat,lon\n1,2\n"):
+    sha, size = store.store_blob(io.BytesIO(payload))
+    return {"endpoint": "predict_batch", "path": "/predict-batch", "method": "POST", "query": [], "form": [],
+            "files": [], "body": {"sha256": sha, "size": size, "content_type": "text/csv"}}
+
+
+def wait_done(store, job_id, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = store.get(job_id)
+        if job["status"] in ("done", "failed"):
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"job {job_id} did not finish")
+
+
+def test_hash_blob_matches_store_blob_without_writing(tmp_path):
+    store = JobStore(str(tmp_path))
+    assert store.hash_blob(io.BytesIO(b"abc" * 1000)) == store.store_blob(io.BytesIO(b"abc" * 1000))
+    assert os.listdir(store.blob_dir) == [store.hash_blob(io.BytesIO(b"abc" * 1000))[0]]
+
+
+def test_submit_runs_job_and_same_key_finds_it(tmp_path):
+    store = JobStore(str(tmp_path))
+    seen = []
+    store.start(lambda spec, job_id: (seen.append(job_id), (200, {"rows": spec["body"]["size"]}))[1])
+    spec = spec_for(store)
+    key = store.job_key(spec, salt="v1")
+    job = store.submit(spec, key)
+    done = wait_done(store, job["id"])
+    assert done["status"] == "done" and done["result"] == {"rows": spec["body"]["size"]}
+    assert seen == [job["id"]]
+    assert store.find(key)["id"] == job["id"]
+    assert store.find(store.job_key(spec, salt="v2")) is None
+
+
+def test_failed_jobs_are_not_reused(tmp_path):
+    store = JobStore(str(tmp_path))
+    store.start(lambda spec, job_id: (500, {"error": "boom"}))
+    spec = spec_for(store)
+    key = store.job_key(spec)
+    assert wait_done(store, store.submit(spec, key)["id"])["status"] == "failed"
+    assert store.find(key) is None
+
+
+def test_submit_refuses_when_too_many_pending(tmp_path):
+    store = JobStore(str(tmp_path), max_pending=2)
+    spec = spec_for(store)
+    assert store.submit(spec) is not None
+    assert store.submit(spec) is not None
+    assert store.submit(spec) is None  # no runner yet, so both stay queued
+
+
+def test_jobs_of_dead_worker_are_requeued(tmp_path):
+    store = JobStore(str(tmp_path))
+    job = store.submit(spec_for(store))
+    dead = f"{store.worker_name.rpartition(':')[0]}:{2 ** 22 + 12345}"
+    store._db().execute("UPDATE jobs SET status = 'running', worker = ? WHERE id = ?", (dead, job["id"]))
+    store.start(lambda spec, job_id: (200, {"ok": True}))
+    store.ensure_workers()
+    assert wait_done(store, job["id"])["status"] == "done"
+
+
+def test_cleanup_drops_expired_jobs_and_unreferenced_blobs(tmp_path):
+    store = JobStore(str(tmp_path), ttl=0)
+    spec = spec_for(store)
+    store.record(spec, store.job_key(spec), store.new_id(), 200, {"ok": True})
+    store.store_blob(io.BytesIO(b"orphan"))
+    time.sleep(0.01)
+    store.cleanup()
+    assert store.pending == 0
+    assert os.listdir(store.blob_dir) == []
@@ -0,0 +1,30 @@
+import pytest
+
+import api.app as app_module
+from api.features import FEATURES
+
+ROW = {name: float(i + 1) for i, name in enumerate(FEATURES)}
+
+
+@pytest.fixture
+def client():
+    if app_module.MODEL is None:
+        pytest.skip("model artifacts not available")
+    return app_module.app.test_client()
+
+
+def test_single_row_uses_full_model_by_default(client):
+    assert app_module.MODEL_ROUTING == "full"
+    resp = client.post("/predict", json=ROW)
+    assert resp.status_code == 200
+    assert resp.get_json()["model"] == "full"
+    assert resp.headers["X-Model-Variant"] == "full"
+
+
+def test_fast_model_is_opt_in_per_request(client):
+    if app_module.FAST_MODEL is None:
+        pytest.skip("fast model artifact not available")
+    resp = client.post("/predict?model=fast", json=ROW)
+    assert resp.status_code == 200
+    assert resp.get_json()["model"] == "fast"
+    assert resp.headers["X-Model-Variant"] == "fast"
@@ -0,0 +1,33 @@
+import glob
+
+import h5py
+import numpy as np
+import pytest
+
+from api.features import FEATURE_DTYPE
+
+
+def test_feature_dtype_is_defined_once():
+    sources = {path: open(path).read() for path in glob.glob("*.py") + glob.glob("api/*.py")}
+    readers = [path for path, src in sources.items() if 'getenv("FEATURE_DTYPE"' in src]
+    assert readers == ["api/features.py"]
+    assert FEATURE_DTYPE in (np.dtype("float32"), np.dtype("float64"))
+
+
+def test_h5_precision_check_covers_the_read_path(tmp_path):
+    predict = pytest.importorskip("api.predict")
+    try:
+        predict.load_artifacts()
+    except FileNotFoundError:
+        pytest.skip("model artifacts not available")
+    rng = np.random.default_rng(3)
+    lat, lon = np.meshgrid(np.linspace(5, 35, 40), np.linspace(60, 100, 50), indexing="ij")
+    path = tmp_path / "3RIMG_18JUN2024_0000_L2B_CTP_V01R00.h5"
+    with h5py.File(path, "w") as f:
+        f["Latitude"] = lat
+        f["Longitude"] = lon
+        f["CTP"] = rng.uniform(100, 1000, lat.shape)
+        f["CTT"] = rng.uniform(190, 300, lat.shape)
+    report = predict.compare_precision_h5(str(path), max_rows=1500)
+    assert report["rows"] == 1500
+    assert report["within_tolerance"] and report["label_agreement"] > 0.99
@@ -0,0 +1,44 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from api.profiling import RequestProfile
+
+
+def spin_in_pool(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def profiled_pool_run(mode, tmp_path):
+    with ThreadPoolExecutor(max_workers=2, thread_name_prefix="shard") as pool:
+        prof = RequestProfile(mode, interval=0.001, pool_prefixes=("shard",))
+        prof.start()
+        list(pool.map(spin_in_pool, [0.2, 0.2]))
+        prof.stop()
+        name = prof.save(str(tmp_path), label="test")
+    return prof, name
+
+
+def test_sample_mode_includes_pool_threads(tmp_path):
+    prof, name = profiled_pool_run("sample", tmp_path)
+    stacks = open(os.path.join(tmp_path, name)).read()
+    assert any(line.startswith("shard pool;") and "spin_in_pool" in line for line in stacks.splitlines())
+    assert "test_sample_mode_includes_pool_threads" in stacks  # the request thread itself
+
+
+def test_cprofile_mode_writes_pool_companion(tmp_path):
+    prof, name = profiled_pool_run("cprofile", tmp_path)
+    assert prof.pool_name == f"{name}.pool.folded"
+    assert "spin_in_pool" in open(os.path.join(tmp_path, prof.pool_name)).read()
+
+
+def test_idle_pool_threads_are_not_sampled(tmp_path):
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="shard") as pool:
+        pool.submit(int).result()  # start the worker, then leave it idle
+        prof = RequestProfile("sample", interval=0.001, pool_prefixes=("shard",))
+        prof.start()
+        time.sleep(0.1)
+        prof.stop()
+    assert not any(stack.startswith("shard pool") for stack in prof._profiler.samples)
@@ -0,0 +1,48 @@
+"""Every third-party package the code imports unconditionally is pinned in the requirements files."""
+import ast
+import glob
+import os
+import sys
+
+import pytest
+
+# import name -> distribution that provides it
+DISTRIBUTIONS = {"sklearn": "scikit-learn", "flask": "flask", "werkzeug": "flask"}
+
+
+def required_imports(paths):
+    local = {os.path.splitext(os.path.basename(p))[0] for p in glob.glob("*.py") + glob.glob("api/*.py")} | {"api"}
+    found = {}
+    for path in paths:
+        tree = ast.parse(open(path).read())
+        optional = {id(n) for t in ast.walk(tree) if isinstance(t, ast.Try) for b in t.body for n in ast.walk(b)}
+        for node in ast.walk(tree):
+            if id(node) in optional:
+                continue  # optional dependency or local-import fallback
+            if isinstance(node, ast.Import):
+                names = [a.name for a in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+                names = [node.module]
+            else:
+                continue
+            for name in names:
+                top = name.split(".")[0]
+                if top not in sys.stdlib_module_names and top not in local:
+                    found.setdefault(DISTRIBUTIONS.get(top, top), path)
+    return found
+
+
+def pinned(requirements):
+    """Distributions pinned to an exact version (name==version)."""
+    with open(requirements) as fh:
+        lines = [line.split("#")[0].strip() for line in fh]
+    return {line.split("==")[0].strip().lower() for line in lines if "==" in line}
+
+
+@pytest.mark.parametrize("requirements,paths", [
+    ("requirements.txt", glob.glob("*.py") + glob.glob("api/*.py")),
+    ("requirements-api.txt", glob.glob("api/*.py")),
+])
+def test_imports_are_pinned(requirements, paths):
+    missing = {dist: path for dist, path in required_imports(paths).items() if dist.lower() not in pinned(requirements)}
+    assert not missing, f"{requirements} lacks {missing}"
@@ -0,0 +1,50 @@
+import json
+import os
+import threading
+
+import numpy as np
+
+from api.risk_cache import RiskCache
+
+CLASSES = ["Low", "Moderate", "Severe"]
+
+
+def publish(cache, timestep, n=10, code=0):
+    return cache.publish({"file": f"{timestep}.h5", "timestep": timestep}, np.zeros(n), np.zeros(n),
+                         np.full(n, code), np.ones(n), CLASSES, {"CTP": np.zeros(n)})
+
+
+def test_publish_round_trip(tmp_path):
+    cache = RiskCache(str(tmp_path))
+    summary = publish(cache, "2024-06-18T00:00:00", n=4, code=1)
+    assert summary["seq"] == 1 and summary["class_counts"] == {"Low": 0, "Moderate": 4, "Severe": 0}
+    grid = cache.grid()
+    assert grid["seq"] == 1 and grid["pred"].tolist() == [1, 1, 1, 1] and "feat_CTP" in grid
+    assert cache.summary()["seq"] == 1
+
+
+def test_older_timestep_is_refused(tmp_path):
+    cache = RiskCache(str(tmp_path))
+    publish(cache, "2024-06-18T01:00:00")
+    assert publish(cache, "2024-06-18T00:30:00") is None
+    assert publish(cache, "2024-06-18T01:00:00")["seq"] == 2     # same timestep may be republished
+    with open(cache.summary_path) as fh:
+        assert json.load(fh)["timestep"] == "2024-06-18T01:00:00"
+
+
+def test_concurrent_publishes_get_unique_seqs(tmp_path):
+    caches = [RiskCache(str(tmp_path)) for _ in range(8)]   # separate instances, as in separate workers
+    results = []
+
+    def worker(cache):
+        for _ in range(5):
+            results.append(publish(cache, "2024-06-18T00:00:00", n=1000)["seq"])
+
+    threads = [threading.Thread(target=worker, args=(c,)) for c in caches]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sorted(results) == list(range(1, 41))
+    assert RiskCache(str(tmp_path)).grid()["seq"] == 40
+    assert not [f for f in os.listdir(tmp_path) if f.startswith(".publish-")]
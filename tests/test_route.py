@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+import api.app as app_module
+from api.risk_cache import RiskCache
+from api.route import sample_count, sample_polyline
+
+ROUTE = [{"lat": 10.0, "lon": 20.0, "alt_ft": 35000}, {"lat": 10.0, "lon": 20.5, "alt_ft": 35000}]
+
+
+@pytest.fixture
+def client(monkeypatch, tmp_path):
+    if app_module.MODEL is None:
+        pytest.skip("model artifacts not available")
+    cache = RiskCache(str(tmp_path))
+    lat, lon = np.meshgrid(np.linspace(9.5, 10.5, 5), np.linspace(19.5, 21.0, 7))
+    n = lat.size
+    cache.publish({"file": "t.h5", "timestep": "2024-06-18T00:00:00"}, lat.ravel(), lon.ravel(),
+                  np.zeros(n), np.ones(n), ["Low", "Moderate", "Severe"],
+                  {"CTP": np.full(n, 300.0), "CTT": np.full(n, 220.0)})
+    monkeypatch.setattr(app_module, "RISK_CACHE", cache)
+    monkeypatch.setattr(app_module, "ROUTE_INDEX", None)
+    return app_module.app.test_client()
+
+
+@pytest.mark.parametrize("spacing", [0.5, 7.0, 50.0, 1000.0])
+def test_sample_count_matches_sample_polyline(spacing):
+    lat, lon = np.array([10.0, 10.0, 45.0, 45.0]), np.array([20.0, 20.0, -70.0, 120.0])
+    assert sample_count(lat, lon, spacing) == sample_polyline(lat, lon, spacing)[0].size
+
+
+def test_too_many_samples_is_refused_before_sampling(client, monkeypatch):
+    monkeypatch.setattr(app_module, "ROUTE_MAX_SAMPLES", 10)
+    monkeypatch.setattr(app_module, "sample_polyline", lambda *a: pytest.fail("sampled an oversized route"))
+    resp = client.post("/route-risk", json={"waypoints": ROUTE, "spacing_km": 1})
+    assert resp.status_code == 400 and "Too many samples" in resp.get_json()["error"]
+
+
+@pytest.mark.parametrize("features", [
+    ["wind_speed_10m"],
+    {"lat": 1.0},
+    {"wind_speed_10m": "fast"},
+    {"wind_speed_10m": True},
+    {"wind_speed_10m": float("nan")},
+    {"cloud_cover": 50.0},          # derived from CTP by the satellite frame
+])
+def test_invalid_features_are_refused(client, features):
+    resp = client.post("/route-risk", json={"waypoints": ROUTE, "features": features})
+    assert resp.status_code == 400
+
+
+def test_constant_features_are_scored(client):
+    resp = client.post("/route-risk", json={"waypoints": ROUTE, "features": {"wind_speed_10m": 12, "wind_shear": 3.5}})
+    assert resp.status_code == 200
+    assert resp.get_json()["routes"][0]["segments"]
@@ -0,0 +1,52 @@
+import threading
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from api.features import FEATURES
+from api.sharding import ShardedPredictor
+
+
+def shard_threads():
+    return [t for t in threading.enumerate() if t.name.startswith("shard")]
+
+
+@pytest.fixture(scope="module")
+def artifacts():
+    predict = pytest.importorskip("api.predict")
+    try:
+        return predict, predict.load_artifacts()
+    except FileNotFoundError:
+        pytest.skip("model artifacts not available")
+
+
+def frame(rows):
+    rng = np.random.default_rng(1)
+    return pd.DataFrame(rng.uniform(0, 50, (rows, len(FEATURES))), columns=FEATURES)
+
+
+def test_sharded_matches_single_block_and_shuts_down(artifacts):
+    _, (scaler, model, features) = artifacts
+    X = frame(500)[features]
+    with ShardedPredictor(model, n_workers=2, block_rows=64) as predictor:
+        preds, probs, _ = predictor.predict(X, scaler)
+    assert predictor._pool is None and not shard_threads()
+    np.testing.assert_array_equal(preds, model.predict(scaler.transform(X)))
+    np.testing.assert_allclose(probs, model.predict_proba(scaler.transform(X)))
+
+
+def test_predict_dataframe_leaves_no_pool_behind(artifacts):
+    predict, loaded = artifacts
+    for _ in range(3):
+        predict.predict_dataframe(frame(50), artifacts=loaded, n_workers=2)
+    assert not shard_threads()
+
+
+def test_predict_dataframe_reuses_given_predictor(artifacts):
+    predict, loaded = artifacts
+    with ShardedPredictor(loaded[1], n_workers=2, block_rows=16) as predictor:
+        predict.predict_dataframe(frame(50), artifacts=loaded, predictor=predictor)
+        pool = predictor._pool
+        predict.predict_dataframe(frame(50), artifacts=loaded, predictor=predictor)
+        assert predictor._pool is pool
@@ -0,0 +1,36 @@
+import pytest
+
+import api.app as app_module
+from api.admission import AdmissionPool
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(app_module, "STREAM_SLOTS", AdmissionPool("stream", 2, 0, 0))
+    return app_module.app.test_client()
+
+
+def test_streams_beyond_limit_get_503_and_slots_are_released(client):
+    first = client.get("/stream", buffered=False)
+    second = client.get("/stream", buffered=False)
+    assert first.status_code == second.status_code == 200
+    assert next(first.response).startswith(b"retry:")
+
+    refused = client.get("/stream")
+    assert refused.status_code == 503
+    assert int(refused.headers["Retry-After"]) > 0
+    assert client.post("/predict", json={}).status_code != 503  # other routes are unaffected
+
+    first.close()
+    assert app_module.STREAM_SLOTS.stats()["active"] == 1
+    third = client.get("/stream", buffered=False)
+    assert third.status_code == 200
+    second.close()
+    third.close()
+    assert app_module.STREAM_SLOTS.stats()["active"] == 0
+    assert app_module.BROADCASTER.n_subscribers == 0
+
+
+def test_bad_region_does_not_take_a_slot(client):
+    assert client.get("/stream?region=nope").status_code == 400
+    assert app_module.STREAM_SLOTS.stats()["active"] == 0
@@ -0,0 +1,17 @@
+import numpy as np
+
+import api.app as app_module
+
+
+def test_class_counts_fold_classes_with_the_same_text():
+    texts = np.array(["Low", "Moderate", "Low", "Severe"], dtype=object)
+    codes = np.array([0, 2, 2, 1, 3, 0])
+    assert app_module.class_counts_from_codes(codes, texts) == {"Low": 4, "Moderate": 1, "Severe": 1}
+    summary = app_module.risk_summary_from_codes(codes, texts)
+    assert summary == {"Low": 66.7, "Moderate": 16.7, "Severe": 16.7}
+
+
+def test_empty_input_gives_zero_percentages():
+    texts = np.array(["Low", "Moderate", "Severe"], dtype=object)
+    summary = app_module.risk_summary_from_codes(np.array([], dtype=np.intp), texts)
+    assert summary == {"Low": 0, "Moderate": 0, "Severe": 0}
@@ -0,0 +1,75 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import api.app as app_module
+from api.temporal import TemporalFeatureEngine
+
+T0 = datetime(2024, 6, 18, 0, 0)
+
+
+def feed(engine, k, ctp, ctt, lat=(10.1,), lon=(75.1,)):
+    return engine.update(T0 + timedelta(minutes=15 * k), np.array(lat), np.array(lon),
+                         {"CTP": np.array(ctp, dtype=float), "CTT": np.array(ctt, dtype=float)})
+
+
+def test_mean_is_nan_not_inf_once_window_is_all_clear():
+    engine = TemporalFeatureEngine(window=4)
+    # values that do not round-trip through float32 leave a residue in a float64 sum
+    for k, (p, t) in enumerate([(123.456789, 211.1), (987.654321, 233.3), (555.5551, 244.4)]):
+        feed(engine, k, [p], [t])
+    for k in range(3, 3 + 4):
+        feed(engine, k, [np.nan], [np.nan])
+    f = engine.features([10.1], [75.1])
+    assert np.isnan(f["CTP_mean"][0]) and np.isnan(f["CTT_mean"][0])
+    assert not np.isinf(f["CTP_mean"]).any()
+    assert engine._sums[:, 0].tolist() == [0.0, 0.0]
+
+
+def test_rolling_mean_delta_and_rate():
+    engine = TemporalFeatureEngine(window=3)
+    for k, p in enumerate([100.0, 200.0, 300.0, 400.0]):
+        feed(engine, k, [p], [250.0 - k])
+    f = engine.features([10.1], [75.1])
+    assert f["temporal_n_obs"][0] == 3
+    assert np.isclose(f["CTP_mean"][0], 300.0)          # 200, 300, 400 in the window
+    assert np.isclose(f["CTP_delta"][0], 100.0)
+    assert np.isclose(f["CTP_rate"][0], 400.0)          # per hour, 15-min steps
+    assert np.isclose(f["CTT_cooling_rate"][0], 4.0)
+
+
+def test_stale_and_repeated_timesteps_are_ignored():
+    engine = TemporalFeatureEngine(window=4)
+    assert feed(engine, 2, [100.0], [200.0]) == 1
+    assert feed(engine, 2, [900.0], [900.0]) == 0
+    assert feed(engine, 1, [900.0], [900.0]) == 0
+    f = engine.features([10.1], [75.1])
+    assert f["temporal_n_obs"][0] == 1 and f["CTP_mean"][0] == 100.0
+
+
+def test_pixels_in_one_cell_are_averaged_and_unknown_cells_are_nan():
+    engine = TemporalFeatureEngine(window=2)
+    feed(engine, 0, [100.0, 300.0, np.nan], [1.0, 3.0, 5.0], lat=(10.01, 10.02, 10.03), lon=(75.01, 75.02, 75.03))
+    f = engine.features([10.0, -40.0], [75.0, 10.0])
+    assert f["CTP_mean"][0] == 200.0 and f["CTT_mean"][0] == 3.0
+    assert np.isnan(f["CTP_mean"][1]) and f["temporal_n_obs"][1] == 0
+
+
+def test_temporal_features_stay_out_of_scoring_until_a_model_uses_them(monkeypatch):
+    if app_module.MODEL is None:
+        pytest.skip("model artifacts not available")
+    assert not app_module.model_uses_temporal_features()
+    names = set(app_module.TEMPORAL.feature_names)
+    df = app_module.satellite_frame(pd.DataFrame({"lat": [10.1], "lon": [75.1], "CTP": [300.0], "CTT": [220.0]}),
+                                    [10], [75])
+    assert not names & set(df.columns)
+
+    scored = []
+    real_predict = app_module.predict_arrays
+    monkeypatch.setattr(app_module, "predict_arrays", lambda df, **kw: scored.append(df) or real_predict(df, **kw))
+    resp = app_module.app.test_client().post("/mosdac-ingest", json={"username": "u", "password": "p"})
+    assert resp.status_code == 200
+    assert set(resp.get_json()["temporal_features"]) == names  # still collected and reported
+    assert not names & set(scored[0].columns)
@@ -0,0 +1,27 @@
+import os
+
+import joblib
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+
+import train_model
+
+
+def saved_forest(model_dir, name):
+    rng = np.random.default_rng(0)
+    X = rng.standard_normal((200, 3))
+    forest = RandomForestClassifier(n_estimators=5, random_state=0).fit(X, (X[:, 0] > 0).astype(int))
+    joblib.dump(forest, os.path.join(model_dir, name))
+
+
+def test_fast_model_is_named_after_its_forest():
+    assert train_model.fast_model_names() == ("fast_model.joblib", "fast_model_report.json")
+    assert train_model.fast_model_names("delhi.joblib") == ("delhi_fast.joblib", "delhi_fast_report.json")
+
+
+def test_distill_existing_uses_the_given_forest(tmp_path, monkeypatch):
+    monkeypatch.setattr(train_model, "MODEL_DIR", str(tmp_path))
+    saved_forest(str(tmp_path), "delhi.joblib")
+    path = train_model.distill_existing("delhi.joblib", n_samples=500)
+    assert path == os.path.join(str(tmp_path), "delhi_fast.joblib")
+    assert sorted(os.listdir(tmp_path)) == ["delhi.joblib", "delhi_fast.joblib", "delhi_fast_report.json"]
@@ -5,9 +5,13 @@ Simple pipeline:
  - feature engineering (wind_shear, TPI proxy)
  - label by simple thresholds into Low/Moderate/Severe
  - train RandomForest, evaluate, save model artifact and scaler
+ - distill a small fast model from the forest for low-latency single-point requests
 """
 
+import io
 import os
+import json
+import time
 import joblib
 import argparse
 from datetime import datetime, timedelta
@@ -15,6 +19,7 @@ import numpy as np
 import pandas as pd
 import requests
 from sklearn.ensemble import RandomForestClassifier
+from sklearn.tree import DecisionTreeClassifier
 from sklearn.model_selection import train_test_split, GridSearchCV
 from sklearn.preprocessing import StandardScaler
 from sklearn.metrics import classification_report, confusion_matrix
@@ -24,7 +29,108 @@ from utils import fetch_era5_hourly, make_features_and_labels
 MODEL_DIR = "model_artifacts"
 os.makedirs(MODEL_DIR, exist_ok=True)
 
-def train_for_location(lat, lon, start_date, end_date, save_name="rf_model.joblib"):
+# Distilled fast model (served for small requests, see FAST_MODEL_* in api/app.py)
+DEFAULT_MODEL_NAME = "rf_model.joblib"
+FAST_MODEL_NAME = "fast_model.joblib"
+FAST_REPORT_NAME = "fast_model_report.json"
+DISTILL_AUGMENT = 4         # jittered copies of the training rows labelled by the forest
+DISTILL_NOISE = 0.1         # jitter std in scaled feature units
+
+def model_bytes(model):
+    buf = io.BytesIO()
+    joblib.dump(model, buf)
+    return buf.tell()
+
+def single_row_latency_ms(model, X, n=200):
+    """Median and p99 latency of predict_proba on one row, as the Instant Predict path calls it."""
+    X = np.asarray(X)
+    times = []
+    for i in range(min(n, len(X))):
+        t0 = time.perf_counter()
+        model.predict_proba(X[i:i + 1])
+        times.append((time.perf_counter() - t0) * 1000)
+    return float(np.median(times)), float(np.percentile(times, 99))
+
+def distill(teacher, X_train_s, kind="tree", random_state=42):
+    """
+    Fit a small student on the forest's own predictions over the training rows
+    plus jittered copies of them, so it learns the forest's decision surface
+    rather than the noisy threshold labels.
+    kind: "tree" (a single depth-10 tree) or "forest" (20 trees, depth 8).
+    """
+    rng = np.random.default_rng(random_state)
+    X_train_s = np.asarray(X_train_s)
+    X_aug = np.vstack([X_train_s] + [X_train_s + rng.normal(0, DISTILL_NOISE, X_train_s.shape)
+                                     for _ in range(DISTILL_AUGMENT)])
+    y_aug = teacher.predict(X_aug)
+    if kind == "tree":
+        student = DecisionTreeClassifier(max_depth=10, min_samples_leaf=5, random_state=random_state)
+    else:
+        student = RandomForestClassifier(n_estimators=20, max_depth=8, min_samples_leaf=5,
+                                         random_state=random_state, n_jobs=1)
+    student.fit(X_aug, y_aug)
+    if not np.array_equal(student.classes_, teacher.classes_):
+        print(f"WARNING: fast model classes {list(student.classes_)} differ from {list(teacher.classes_)}")
+    return student
+
+def distillation_report(teacher, student, X_test_s, y_test=None):
+    """Agreement with the forest, accuracy, size and single-row latency of both models."""
+    t_pred = teacher.predict(X_test_s)
+    s_pred = student.predict(X_test_s)
+    t_med, t_p99 = single_row_latency_ms(teacher, X_test_s)
+    s_med, s_p99 = single_row_latency_ms(student, X_test_s)
+    report = {
+        "student": type(student).__name__,
+        "test_rows": int(len(t_pred)),
+        "agreement": round(float(np.mean(t_pred == s_pred)), 4),
+        "teacher_bytes": model_bytes(teacher),
+        "student_bytes": model_bytes(student),
+        "teacher_latency_ms": {"median": round(t_med, 3), "p99": round(t_p99, 3)},
+        "student_latency_ms": {"median": round(s_med, 3), "p99": round(s_p99, 3)},
+    }
+    if y_test is not None:
+        y_test = np.asarray(y_test)
+        report["teacher_accuracy"] = round(float(np.mean(t_pred == y_test)), 4)
+        report["student_accuracy"] = round(float(np.mean(s_pred == y_test)), 4)
+    return report
+
+def fast_model_names(save_name=DEFAULT_MODEL_NAME):
+    """
+    (fast model, report) file names for the forest saved as `save_name`. The default
+    forest keeps fast_model.joblib, which the API loads by default; any other forest
+    gets <name>_fast.joblib so students of different forests do not overwrite each other.
+    """
+    if save_name == DEFAULT_MODEL_NAME:
+        return FAST_MODEL_NAME, FAST_REPORT_NAME
+    stem = os.path.splitext(save_name)[0]
+    return f"{stem}_fast.joblib", f"{stem}_fast_report.json"
+
+def save_fast_model(student, report, save_name=DEFAULT_MODEL_NAME):
+    fast_name, report_name = fast_model_names(save_name)
+    fast_path = os.path.join(MODEL_DIR, fast_name)
+    report_path = os.path.join(MODEL_DIR, report_name)
+    joblib.dump(student, fast_path)
+    with open(report_path, "w") as fh:
+        json.dump(report, fh, indent=2)
+    print("Distillation report:", json.dumps(report, indent=2))
+    print(f"Saved fast model -> {fast_path}")
+    return fast_path
+
+def distill_existing(save_name=DEFAULT_MODEL_NAME, kind="tree", n_samples=50000, random_state=42):
+    """
+    Distill the forest saved as MODEL_DIR/save_name without refetching training data:
+    inputs are drawn from N(0, 1) in the scaler's standardized space, which covers the
+    range the scaler was fitted on.
+    """
+    teacher = joblib.load(os.path.join(MODEL_DIR, save_name))
+    rng = np.random.default_rng(random_state)
+    n_features = teacher.n_features_in_
+    X = rng.standard_normal((n_samples, n_features))
+    X_train, X_test = X[: int(n_samples * 0.8)], X[int(n_samples * 0.8):]
+    student = distill(teacher, X_train, kind=kind, random_state=random_state)
+    return save_fast_model(student, distillation_report(teacher, student, X_test), save_name)
+
+def train_for_location(lat, lon, start_date, end_date, save_name=DEFAULT_MODEL_NAME, fast="tree"):
     print(f"Fetching data for {lat},{lon} from {start_date} to {end_date}")
     df = fetch_era5_hourly(lat, lon, start_date, end_date)
     if df is None or df.empty:
@@ -61,6 +167,11 @@ def train_for_location(lat, lon, start_date, end_date, save_name="rf_model.jobli
     print(f"Saved model -> {model_path}")
     print(f"Saved scaler -> {scaler_path}")
 
+    if fast != "none":
+        print(f"Distilling fast model ({fast})")
+        student = distill(rf, X_train_s, kind=fast)
+        save_fast_model(student, distillation_report(rf, student, X_test_s, y_test), save_name)
+
     return model_path, scaler_path
 
 if __name__ == "__main__":
@@ -69,9 +180,20 @@ if __name__ == "__main__":
     parser.add_argument("--lon", type=float, default=77.2090, help="Longitude (default Delhi)")
     parser.add_argument("--start", type=str, default=None, help="YYYY-MM-DD")
     parser.add_argument("--end", type=str, default=None, help="YYYY-MM-DD")
-    parser.add_argument("--out", type=str, default="rf_model.joblib", help="Saved model name")
+    parser.add_argument("--out", type=str, default=DEFAULT_MODEL_NAME, help="Saved model name")
+    parser.add_argument("--fast", choices=["tree", "forest", "none"], default="tree",
+                        help="Distilled fast model to build alongside the forest")
+    parser.add_argument("--distill-only", action="store_true",
+                        help="Only distill a fast model from the saved --out forest (no data fetch)")
     args = parser.parse_args()
 
+    if args.distill_only:
+        if args.fast == "none":
+            print("--distill-only with --fast none: nothing to do")
+            raise SystemExit(0)
+        distill_existing(args.out, kind=args.fast)
+        raise SystemExit(0)
+
     # default: last 30 days if not provided
     if args.end is None:
         end = datetime.utcnow().date()
@@ -82,4 +204,4 @@ if __name__ == "__main__":
     else:
         start = datetime.strptime(args.start, "%Y-%m-%d").date()
 
-    train_for_location(args.lat, args.lon, start.isoformat(), end.isoformat(), save_name=args.out)
+    train_for_location(args.lat, args.lon, start.isoformat(), end.isoformat(), save_name=args.out, fast=args.fast)
@@ -3,6 +3,8 @@ import requests
 import pandas as pd
 import numpy as np
 
+from api.features import FEATURES, LABELS, iter_features_and_labels
+
 def fetch_era5_hourly(lat, lon, start_date, end_date):
     """
     Use open-meteo's ERA5 archive endpoint (free) to pull hourly variables.
@@ -43,27 +45,25 @@ def make_features_and_labels(df):
     Input: raw ERA5-like df with columns:
       temperature_2m, dewpoint_2m, surface_pressure,
       wind_speed_10m, wind_speed_100m, relative_humidity_2m, cloud_cover
+    (optionally lat/lon for several locations, one contiguous series each),
+    or an iterable of such frames.
     Output: X (DataFrame), y (Series labels Low/Moderate/Severe)
-    """
-    # fill short gaps
-    df = df.copy()
-    df = df.interpolate(limit=3).dropna()
-
-    # features
-    df["wind_shear"] = (df["wind_speed_100m"] - df["wind_speed_10m"]).abs()
-    # simple instability proxy (you can refine later)
-    df["instability"] = 0.5 * df["wind_shear"] + 0.3 * (100 - df["relative_humidity_2m"]) + 0.2 * df["cloud_cover"]
-    # lapse proxy: approximate from small diffs (if vertical temps available use that)
-    # use dewpoint depression
-    df["dewpt_dep"] = df["temperature_2m"] - df["dewpoint_2m"]
 
-    features = ["wind_speed_10m", "wind_speed_100m", "wind_shear", "relative_humidity_2m", "cloud_cover", "surface_pressure", "dewpt_dep"]
-    X = df[features].copy()
-
-    # simple thresholding for labels (adjust thresholds after inspection)
-    bins = [-999, 10, 25, 999]
-    labels = ["Low", "Moderate", "Severe"]
-    y = pd.cut(df["instability"], bins=bins, labels=labels)
-    # drop any rows with NA labels
-    mask = y.notna()
-    return X.loc[mask], y.loc[mask]
+    Features and labels come from api.features, which serving uses as well.
+    Each location's series is processed on its own arrays; the input is never copied.
+    """
+    frames = [df] if isinstance(df, pd.DataFrame) else df
+    X_parts, code_parts, index_parts = [], [], []
+    for frame in frames:
+        positions = []
+        for _, X, codes, pos in iter_features_and_labels([frame]):
+            X_parts.append(X)
+            code_parts.append(codes)
+            positions.append(pos)
+        if positions:
+            index_parts.append(frame.index[np.concatenate(positions)])
+    X = np.concatenate(X_parts) if X_parts else np.empty((0, len(FEATURES)))
+    codes = np.concatenate(code_parts) if code_parts else np.empty(0, dtype=np.int8)
+    index = index_parts[0].append(index_parts[1:]) if index_parts else pd.RangeIndex(0)
+    y = pd.Series(pd.Categorical.from_codes(codes, LABELS, ordered=True), index=index, name="instability")
+    return pd.DataFrame(X, columns=FEATURES, index=index, copy=False), y